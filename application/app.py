@@ -5,9 +5,10 @@ import json
 import dash_bootstrap_components as dbc
 from dotenv import load_dotenv
 import os
-from flask_caching import Cache
 import logging
-from utils.data_loading import init_data_loading
+from utils.data_loading import load_data
+from utils.warmup import WARM_UP
+from utils.dataset_watcher import DATASET_WATCHER
 from dash import Dash
 
 # Load environment variables from .env file
@@ -26,20 +27,20 @@ except Exception as e:
 # Initialize the Flask server
 server = Flask(__name__)
 
-# Configure cache
-cache_config = {
-    'CACHE_TYPE': 'SimpleCache',  # Choose appropriate cache type
-    'CACHE_DEFAULT_TIMEOUT': 3600  # 1 hour
-}
-cache = Cache()
-cache.init_app(server, config=cache_config)
+@server.route('/healthz')
+def healthz():
+    """Readiness check: 200 once the warm-up has finished and there is data to serve, 503 until then."""
+    status = WARM_UP.status()
+    if not WARM_UP.ready:
+        return status, 503
+    dataset = load_data()
+    if dataset.empty:
+        return {**status, 'status': 'unavailable'}, 503
+    return {**status, 'status': 'ok', 'generation': dataset.generation}, 200
 
 # Initialize the Dash app
 app = Dash(__name__, server=server, external_stylesheets=[dbc.themes.BOOTSTRAP])
 
-# Initialize data loading with cache
-init_data_loading(cache)
-
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
@@ -47,9 +48,13 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 app.layout = layout
 
 # Register callbacks
+from callbacks.jobs import JOB_RUNNER
 from callbacks.callbacks import (
+    precompute_defaults,
+    warm_up_phases,
     initialize_and_reset_data,
     reload_data,
+    poll_jobs,
     update_selected_users,
     update_page_number,
     update_table,
@@ -61,6 +66,7 @@ from callbacks.callbacks import (
 # Initialize each callback
 initialize_and_reset_data(app)
 reload_data(app)
+poll_jobs(app)
 update_selected_users(app)
 update_page_number(app)
 update_table(app)
@@ -68,6 +74,10 @@ reset_filters(app)
 update_total_records_display(app)
 export_selected_rows(app)
 
-# Run the app
+# Run the app with Dash's development server; in production it is served by
+# gunicorn (see gunicorn.conf.py), which warms up before its workers start
 if __name__ == '__main__':
+    WARM_UP.start(warm_up_phases())
+    DATASET_WATCHER.start(prepare=precompute_defaults)
+    JOB_RUNNER.start()
     app.run_server(debug=False)
\ No newline at end of file
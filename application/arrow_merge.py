@@ -0,0 +1,344 @@
+import csv
+import io
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from merge_utils import ACTIVITY_COLUMNS, PROFILE_COLUMNS
+
+# activity_week is joined as days since the epoch; blank or unparseable weeks
+# sort before every real week, as '' does in the pandas engine
+BLANK_WEEK = np.iinfo(np.int32).min
+_KEYS = ['user_id', 'activity_week']
+_HISTORY_FLAG = '__history'
+CSV_BATCH_ROWS = 200000
+
+
+def _csv_special_characters():
+    """Characters that make the csv module (and so pandas.to_csv) quote a field."""
+    special = ''
+    for char in ',"\r\n':
+        buffer = io.StringIO()
+        csv.writer(buffer, lineterminator='\n').writerow([f'a{char}b'])
+        if buffer.getvalue().startswith('"'):
+            special += char
+    return special
+
+
+_CSV_QUOTE_PATTERN = f'[{_csv_special_characters()}]'
+
+
+def _user_id_keys(values):
+    """Convert a user_id column to int64 join keys."""
+    if pd.api.types.is_integer_dtype(values):
+        return values.to_numpy(dtype=np.int64)
+    numeric = pd.to_numeric(pd.Series(values).astype(str).str.strip())
+    if numeric.isna().any() or (numeric % 1 != 0).any():
+        raise ValueError("The arrow merge engine requires integer user_id values")
+    return numeric.astype('int64').to_numpy()
+
+
+def _week_keys(values):
+    """
+    Convert activity_week values to int32 day numbers.
+
+    Dates are parsed once per distinct value, with the same pandas parser the
+    pandas engine uses, so both engines agree on what counts as a valid week.
+    """
+    codes, uniques = pd.factorize(pd.Series(values), use_na_sentinel=True)
+    parsed = pd.to_datetime(pd.Series(uniques, dtype=object), errors='coerce')
+    days = (parsed.dt.normalize() - pd.Timestamp('1970-01-01')).dt.days
+    lookup = np.append(days.fillna(BLANK_WEEK).to_numpy(dtype=np.int64), BLANK_WEEK).astype(np.int32)
+    return lookup[codes]
+
+
+def _week_strings(days):
+    """Convert int32 day numbers back to 'YYYY-MM-DD' strings."""
+    codes, uniques = pd.factorize(days)
+    labels = pd.to_datetime(uniques.astype('int64'), unit='D').strftime('%Y-%m-%d')
+    return np.asarray(labels, dtype=object)[codes]
+
+
+def _to_table(df, prefix, keys):
+    """Build an Arrow table with integer keys and prefixed attribute columns."""
+    columns = {'user_id': pa.array(_user_id_keys(df['user_id']), type=pa.int64())}
+    if 'activity_week' in keys:
+        columns['activity_week'] = pa.array(_week_keys(df['activity_week']), type=pa.int32())
+    values = df.drop(columns=keys)
+    values.columns = [f'{prefix}{col}' for col in values.columns]
+    table = pa.Table.from_pandas(values, preserve_index=False)
+    for name in table.column_names:
+        # All-empty object columns come out as null, which joins don't support
+        column = table[name]
+        columns[name] = column.cast(pa.string()) if pa.types.is_null(column.type) else column
+    return pa.table(columns)
+
+
+def _fill_indices(user_ids, valid):
+    """
+    Return, for every row, the index of the value it takes after a per-user
+    forward fill followed by a backward fill, or -1 if the user has no value.
+
+    Rows must be sorted by user. Both directions are computed with cumulative
+    max/min over row positions, so each column is filled in one pass.
+    """
+    n = len(user_ids)
+    positions = np.arange(n)
+    new_group = np.empty(n, dtype=bool)
+    new_group[:1] = True
+    new_group[1:] = user_ids[1:] != user_ids[:-1]
+    starts = np.maximum.accumulate(np.where(new_group, positions, 0))
+    ends = np.empty(n, dtype=np.int64)
+    ends[::-1] = np.minimum.accumulate(np.where(np.append(new_group[1:], True), positions, n)[::-1])
+
+    previous = np.maximum.accumulate(np.where(valid, positions, -1))
+    following = np.empty(n, dtype=np.int64)
+    following[::-1] = np.minimum.accumulate(np.where(valid, positions, n)[::-1])
+
+    return np.where(
+        previous >= starts,
+        previous,
+        np.where(following <= ends, following, -1)
+    )
+
+
+def _fill_profile_columns(table):
+    """Forward then backward fill PROFILE_COLUMNS within each user's sorted rows."""
+    user_ids = table['user_id'].to_numpy()
+    for name in PROFILE_COLUMNS:
+        if name not in table.column_names:
+            continue
+        column = table[name]
+        if column.null_count == 0:
+            continue
+        valid = column.is_valid().to_numpy(zero_copy_only=False)
+        indices = _fill_indices(user_ids, valid)
+        filled = column.take(pa.array(indices, mask=indices < 0))
+        table = table.set_column(table.column_names.index(name), name, filled)
+    return table
+
+
+def _widen_nullable_integers(table, names):
+    """Cast integer columns that gained nulls to float64, as a pandas merge would."""
+    for name in names:
+        column = table[name]
+        if pa.types.is_integer(column.type) and column.null_count > 0:
+            table = table.set_column(table.column_names.index(name), name, column.cast(pa.float64()))
+    return table
+
+
+def _history_rows(history, schema):
+    """
+    Shape query_3 rows from before since_week like the merged table.
+
+    They carry only the filled profile columns, seed the forward fill exactly
+    like the blank-week context rows of the pandas engine, and are dropped
+    after filling.
+    """
+    columns = {}
+    for field in schema:
+        if field.name == _HISTORY_FLAG:
+            columns[field.name] = pa.array(np.ones(history.num_rows, dtype=bool))
+        elif field.name in _KEYS or field.name in PROFILE_COLUMNS and field.name in history.column_names:
+            columns[field.name] = history[field.name].cast(field.type)
+        else:
+            columns[field.name] = pa.nulls(history.num_rows, type=field.type)
+    return pa.table(columns, schema=schema)
+
+
+def merge_frames_arrow(df1, df2, df3, since_week=None):
+    """
+    Merge standardized query frames on integer keys with pyarrow.
+
+    Produces the same frame as merge_utils.merge_frames (user_id and
+    activity_week as strings, same column order, types and fill rules) for
+    query results with integer user ids and one row per user and week.
+    """
+    print("Converting query results to Arrow tables...")
+    t1 = _to_table(df1, '', _KEYS)
+    t2 = _to_table(df2, 'df2_', ['user_id'])
+    t3 = _to_table(df3, 'df3_', _KEYS)
+
+    history = None
+    if since_week:
+        print(f"Keeping weeks from {since_week} onwards...")
+        since = int(_week_keys([since_week])[0])
+        history = t3.filter(pc.less(t3['activity_week'], since))
+        t1 = t1.filter(pc.greater_equal(t1['activity_week'], since))
+        t3 = t3.filter(pc.greater_equal(t3['activity_week'], since))
+
+    print("Merging data...")
+    all_keys = (
+        pa.concat_tables([t1.select(_KEYS), t3.select(_KEYS)])
+        .group_by(_KEYS)
+        .aggregate([])
+    )
+    print(f"Total unique week combinations: {all_keys.num_rows}")
+
+    merged = all_keys.join(t2, 'user_id', join_type='left outer')
+    merged = merged.join(t1, _KEYS, join_type='left outer')
+    merged = merged.join(t3, _KEYS, join_type='left outer')
+    value_columns = [name for t in (t2, t1, t3) for name in t.column_names if name not in _KEYS]
+    merged = merged.select(_KEYS + value_columns)
+    merged = _widen_nullable_integers(merged, value_columns)
+    print(f"After merges: {merged.num_rows} rows, {merged.num_columns} columns")
+
+    print("Filling missing values...")
+    for name in ACTIVITY_COLUMNS:
+        if name in merged.column_names:
+            column = merged[name]
+            merged = merged.set_column(merged.column_names.index(name), name,
+                                       column.fill_null(pa.scalar(0, type=column.type)))
+
+    merged = merged.append_column(_HISTORY_FLAG, pa.array(np.zeros(merged.num_rows, dtype=bool)))
+    if history is not None:
+        history = history.filter(pc.is_in(history['user_id'], value_set=pc.unique(merged['user_id'])))
+        if history.num_rows:
+            # Columns the pandas context rows leave empty become nullable there too
+            seeded = set(_KEYS) | set(ACTIVITY_COLUMNS) | {
+                name for name in PROFILE_COLUMNS if name in history.column_names
+            }
+            for name in value_columns:
+                column = merged[name]
+                if name not in seeded and (pa.types.is_integer(column.type) or pa.types.is_boolean(column.type)):
+                    merged = merged.set_column(merged.column_names.index(name), name, column.cast(pa.float64()))
+            for name in PROFILE_COLUMNS:
+                if name in history.column_names and name in merged.column_names:
+                    if pa.types.is_floating(history[name].type) and pa.types.is_integer(merged[name].type):
+                        merged = merged.set_column(merged.column_names.index(name), name,
+                                                   merged[name].cast(pa.float64()))
+            context = _history_rows(history, merged.schema)
+            merged = pa.concat_tables([merged, context])
+
+    print("Forward filling profile data...")
+    merged = merged.sort_by([('user_id', 'ascending'), ('activity_week', 'ascending')])
+    merged = _fill_profile_columns(merged)
+
+    print("Removing blank activity weeks...")
+    keep = pc.and_(pc.invert(merged[_HISTORY_FLAG]), pc.not_equal(merged['activity_week'], BLANK_WEEK))
+    merged = merged.filter(keep).drop_columns([_HISTORY_FLAG])
+
+    week_days = merged['activity_week'].to_numpy()
+    return merged.set_column(1, 'activity_week', pa.array(_week_strings(week_days), type=pa.string()))
+
+
+def user_rows(table, user_id):
+    """Return one user's rows of a merged table as a DataFrame."""
+    return table.filter(pc.equal(table['user_id'], user_id)).to_pandas()
+
+
+def _float_strings(column):
+    """Format floats the way pandas.to_csv does (Python's repr)."""
+    text = pc.cast(column, pa.string())
+    magnitude = pc.abs(column)
+    # Arrow switches to exponent notation at different magnitudes than repr
+    # does; those (rare) values are formatted in Python
+    irregular = pc.or_(
+        pc.match_substring(text, 'e'),
+        pc.or_(
+            pc.invert(pc.is_finite(column)),
+            pc.and_(pc.less(magnitude, 1e-4), pc.not_equal(magnitude, 0))
+        )
+    ).fill_null(False)
+    integral = pc.invert(pc.match_substring(text, '.')).fill_null(False)
+    text = pc.if_else(integral, pc.binary_join_element_wise(text, '.0', ''), text)
+    if pc.any(irregular).as_py():
+        positions = np.flatnonzero(irregular.to_numpy(zero_copy_only=False))
+        values = column.take(pa.array(positions)).to_pylist()
+        text = text.to_numpy(zero_copy_only=False).astype(object)
+        text[positions] = [repr(value) for value in values]
+        text = pa.array(text, type=pa.string())
+    return text
+
+
+def _csv_field(column):
+    """Render a column as CSV fields, matching pandas.to_csv formatting and quoting."""
+    if pa.types.is_floating(column.type):
+        return _float_strings(column).fill_null('')
+    if pa.types.is_integer(column.type):
+        return pc.cast(column, pa.string()).fill_null('')
+
+    if pa.types.is_boolean(column.type):
+        text = pc.if_else(column, 'True', 'False')
+    elif pa.types.is_string(column.type):
+        text = column
+    else:
+        text = pa.array(column.to_pandas().map(str, na_action='ignore'), type=pa.string())
+    needs_quotes = pc.match_substring_regex(text, _CSV_QUOTE_PATTERN).fill_null(False)
+    if pc.any(needs_quotes).as_py():
+        quoted = pc.binary_join_element_wise('"', pc.replace_substring(text, '"', '""'), '"', '')
+        text = pc.if_else(needs_quotes, quoted, text)
+    return text.fill_null('')
+
+
+def write_csv(table, output_file, append=False):
+    """
+    Write a merged table to CSV, byte-for-byte as pandas.to_csv(index=False) would.
+
+    Fields are formatted column-wise with Arrow compute functions and joined into
+    lines batch by batch; only floats that Arrow and repr() format differently
+    are formatted in Python. With append, rows are added to an existing file
+    without repeating the header.
+    """
+    with open(output_file, 'ab' if append else 'wb') as f:
+        if not append:
+            header = io.StringIO()
+            csv.writer(header, lineterminator='\n').writerow(table.column_names)
+            f.write(header.getvalue().encode('utf-8'))
+        for batch in table.to_batches(max_chunksize=CSV_BATCH_ROWS):
+            fields = [_csv_field(column) for column in batch.columns]
+            lines = pc.binary_join_element_wise(*fields, ',')
+            lines = pc.binary_join_element_wise(lines, '', '\n')
+            if isinstance(lines, pa.ChunkedArray):
+                lines = lines.combine_chunks()
+            _, offsets, data = lines.buffers()
+            bounds = np.frombuffer(offsets, dtype=np.int32, count=len(lines) + 1, offset=lines.offset * 4)
+            f.write(memoryview(data)[bounds[0]:bounds[-1]])
+
+
+def interchange_table(table):
+    """Give a merged table its Parquet key types: int64 user_id and date32 activity_week."""
+    for name, key_type in (('user_id', pa.int64()), ('activity_week', pa.date32())):
+        index = table.column_names.index(name)
+        table = table.set_column(index, name, table[name].cast(key_type))
+    return table
+
+
+class MergedOutputWriter:
+    """
+    Write merged tables to output_file, one table at a time.
+
+    The format follows the file extension: '.parquet' gets typed Parquet with
+    the schema of the first table, anything else gets CSV identical to
+    pandas.to_csv.
+    """
+
+    def __init__(self, output_file):
+        self.output_file = output_file
+        self.parquet = str(output_file).endswith('.parquet')
+        self._writer = None
+        self._started = False
+
+    def write(self, table):
+        if self.parquet:
+            table = interchange_table(table)
+            if self._writer is None:
+                self._writer = pq.ParquetWriter(self.output_file, table.schema)
+            self._writer.write_table(table)
+        else:
+            write_csv(table, self.output_file, append=self._started)
+        self._started = True
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,128 @@
+"""
+Compare the dashboard callbacks' data work with text and integer user ids.
+
+Builds the users and weekly activity frames the dashboard loads from
+synthetic query results, then times what the filter, table and export
+callbacks do with them: the filter aggregates the selected weeks per user and
+applies the range filters, the table narrows the weeks to the filtered users
+and renders one sorted page, and the export aggregates the selected users
+into a CSV. 'text' keys reproduce the old TEXT user_id with its astype(str)
+conversions; 'int64' keys stand for the integer keys the dashboard uses now
+(int32 when every id fits). Also reports the memory of each activity frame
+and checks that both produce the same users.
+
+Usage (from the application directory):
+    python -m benchmarks.bench_callbacks --rows 1000000 5000000
+"""
+import argparse
+import contextlib
+import io
+import statistics
+import time
+
+from benchmarks.bench_load import prepared_frame
+
+DEFAULT_ROWS = [1_000_000, 5_000_000]
+KEY_TYPES = ['text', 'int64']
+
+# Share of the filtered users that are selected for the export
+EXPORT_SHARE = 0.1
+PAGE_ROWS = 20
+
+
+def dashboard_frames(rows, weeks, seed=0):
+    """Return the (users, activity) frames load_data would return for synthetic data."""
+    from initialize_db import split_user_data
+    from utils.data_loading import compact_frame
+
+    df = prepared_frame(rows, weeks, seed=seed)
+    with contextlib.redirect_stdout(io.StringIO()):
+        users, activity = split_user_data(df)
+    return compact_frame(users), compact_frame(activity)
+
+
+def with_keys(users, activity, key_type):
+    if key_type == 'int64':
+        return users, activity
+    users, activity = users.copy(), activity.copy()
+    users['user_id'] = users['user_id'].astype(str)
+    activity['user_id'] = activity['user_id'].astype(str)
+    return users, activity
+
+
+def filter_users(users, activity, key_type):
+    """The filter callback: weeks in range, aggregated per user, then range filters."""
+    from callbacks.callbacks import summarize_users
+    from utils.data_loading import weeks_between
+
+    weeks = activity['activity_week']
+    in_range = weeks_between(weeks, weeks.cat.categories[len(weeks.cat.categories) // 4], weeks.max())
+    summary = summarize_users(users, activity.loc[in_range])
+    mask = (summary['total_uploads'] >= 1) & (summary['df2_acceptance_rate'].fillna(0) <= 90)
+    ids = summary.loc[mask, 'user_id']
+    return (ids.astype(str) if key_type == 'text' else ids).tolist()
+
+
+def table_page(users, activity, filtered_ids, key_type):
+    """The table callback: weeks of the filtered users, aggregated, sorted and paged."""
+    from callbacks.callbacks import summarize_users
+
+    keys = activity['user_id'].astype(str) if key_type == 'text' else activity['user_id']
+    summary = summarize_users(users, activity.loc[keys.isin(filtered_ids)])
+    return summary.sort_values('total_uploads', ascending=False).iloc[:PAGE_ROWS]
+
+
+def export_csv(users, activity, selected_ids, key_type):
+    """The export callback: weeks of the selected users, aggregated and written as CSV."""
+    from callbacks.callbacks import summarize_users
+
+    keys = activity['user_id'].astype(str) if key_type == 'text' else activity['user_id']
+    summary = summarize_users(users, activity.loc[keys.isin(set(selected_ids))])
+    return summary.to_csv(index=False)
+
+
+def timed(func, repeat):
+    """Run func repeat times; return its last result and the median seconds."""
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        seconds.append(time.perf_counter() - start)
+    return result, statistics.median(seconds)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the dashboard callbacks with text and integer user ids.")
+    parser.add_argument('--rows', type=int, nargs='+', default=DEFAULT_ROWS,
+                        help="Approximate merged row counts to benchmark")
+    parser.add_argument('--weeks', type=int, default=52)
+    parser.add_argument('--keys', nargs='+', default=KEY_TYPES, choices=KEY_TYPES)
+    parser.add_argument('--repeat', type=int, default=5, help="Runs per step; the median is reported")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    for rows in args.rows:
+        users, activity = dashboard_frames(rows, args.weeks, seed=args.seed)
+        print(f"\n== {len(activity):,} weekly rows, {len(users):,} users ==")
+        filtered = {}
+        for key_type in args.keys:
+            key_users, key_activity = with_keys(users, activity, key_type)
+            ids, filter_seconds = timed(lambda: filter_users(key_users, key_activity, key_type), args.repeat)
+            _, table_seconds = timed(lambda: table_page(key_users, key_activity, ids, key_type), args.repeat)
+            selected = ids[:max(1, int(len(ids) * EXPORT_SHARE))]
+            _, export_seconds = timed(lambda: export_csv(key_users, key_activity, selected, key_type), args.repeat)
+            memory_mb = key_activity.memory_usage(deep=True).sum() / 1e6
+            print(f"{key_type:>6}: filter {filter_seconds:6.2f}s, table {table_seconds:6.2f}s, "
+                  f"export {export_seconds:6.2f}s, activity frame {memory_mb:,.0f} MB")
+            filtered[key_type] = [str(user_id) for user_id in ids]
+
+        if len(filtered) > 1:
+            first, *rest = filtered.values()
+            identical = all(ids == first for ids in rest)
+            print(f"Filtered users identical: {identical}")
+            if not identical:
+                raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
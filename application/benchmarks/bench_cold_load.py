@@ -0,0 +1,142 @@
+"""
+Time a cold load of the dashboard dataset.
+
+Loads synthetic data into a database the way a full ingest does, then times
+reading it back with no cache both ways:
+
+- 'typed': utils.data_loading.load_data_from_db, which reads the raw values
+  through the sqlite3 connection and types them once, with the categories
+  stored at ingest.
+- 'untyped': the previous load path, which read every column as inferred,
+  re-parsed the dates, then built the categoricals and narrow types in pandas.
+- 'snapshot': utils.data_loading.Dataset mapping the generation's Arrow
+  snapshot, as the dashboard does after a restart. The snapshot is published
+  before the timed loads, and its time is reported separately.
+
+Reports the median seconds and rows/s of each and checks that they return the
+same frames (on the columns they share: the snapshot leaves out the profile
+text columns, which the dashboard reads per row).
+
+Usage (from the application directory):
+    python -m benchmarks.bench_cold_load --rows 1000000 5000000
+"""
+import argparse
+import os
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import time
+
+import pandas as pd
+from sqlalchemy import create_engine
+from sqlalchemy.pool import NullPool
+
+from benchmarks.bench_load import build_database
+
+DEFAULT_ROWS = [1_000_000, 5_000_000]
+MODES = ['untyped', 'typed', 'snapshot']
+
+
+def untyped_load(db_path):
+    """Read the tables as inferred and type them afterwards, like the previous load_data."""
+    from initialize_db import CATEGORY_ORDERS
+    from utils.data_loading import compact_frame
+
+    conn = sqlite3.connect(db_path)
+    try:
+        users = pd.read_sql("SELECT * FROM users", conn)
+        activity = pd.read_sql("SELECT * FROM weekly_activity", conn)
+    finally:
+        conn.close()
+    users['df2_registration_date'] = pd.to_datetime(users['df2_registration_date'])
+    activity['activity_week'] = pd.to_datetime(activity['activity_week'])
+    for col, order in CATEGORY_ORDERS.items():
+        if order is not None:
+            users[col] = pd.Categorical(users[col], categories=order, ordered=True)
+        else:
+            users[col] = pd.Categorical(users[col], categories=sorted(users[col].dropna().unique()))
+    return compact_frame(users), compact_frame(activity)
+
+
+def typed_load(db_path):
+    from utils.data_loading import load_data_from_db
+
+    return load_data_from_db(create_engine(f'sqlite:///{db_path}', poolclass=NullPool))
+
+
+def snapshot_load(db_path):
+    from utils.data_loading import Dataset
+
+    dataset = Dataset(create_engine(f'sqlite:///{db_path}', poolclass=NullPool), snapshots=True)
+    return dataset.users(), dataset.activity()
+
+
+def publish_snapshot(db_path):
+    """Publish the database's snapshot; returns the seconds taken."""
+    start = time.perf_counter()
+    snapshot_load(db_path)
+    return time.perf_counter() - start
+
+
+def same_frames(first, other):
+    """True if both (users, activity) pairs hold equal values in the columns they share."""
+    for frame, other_frame in zip(first, other):
+        columns = [col for col in frame.columns if col in other_frame.columns]
+        if not frame[columns].equals(other_frame[columns]):
+            return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark a cold load of the dashboard dataset.")
+    parser.add_argument('--rows', type=int, nargs='+', default=DEFAULT_ROWS,
+                        help="Approximate merged row counts to benchmark")
+    parser.add_argument('--weeks', type=int, default=52)
+    parser.add_argument('--modes', nargs='+', default=MODES, choices=MODES)
+    parser.add_argument('--repeat', type=int, default=3, help="Loads per mode; the median is reported")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--work-dir', help="Where to write the database (default: a temp dir)")
+    args = parser.parse_args()
+
+    loaders = {'untyped': untyped_load, 'typed': typed_load, 'snapshot': snapshot_load}
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix='bench_cold_load_')
+    os.makedirs(work_dir, exist_ok=True)
+    try:
+        for rows in args.rows:
+            db_path = os.path.join(work_dir, f'{rows}.db')
+            if os.path.exists(db_path):
+                os.remove(db_path)
+            build_database(db_path, rows, args.weeks, seed=args.seed)
+            if 'snapshot' in args.modes:
+                print(f"\nSnapshot published in {publish_snapshot(db_path):.2f}s")
+
+            loaded = {}
+            for mode in args.modes:
+                seconds = []
+                for _ in range(args.repeat):
+                    start = time.perf_counter()
+                    loaded[mode] = loaders[mode](db_path)
+                    seconds.append(time.perf_counter() - start)
+                users, activity = loaded[mode]
+                median = statistics.median(seconds)
+                if mode == args.modes[0]:
+                    print(f"\n== {len(activity):,} weekly rows, {len(users):,} users ==")
+                print(f"{mode:>8}: cold load {median:6.2f}s ({len(activity) / median:10,.0f} weekly rows/s)")
+            for name in os.listdir(work_dir):
+                if name.startswith(f'{rows}.db'):
+                    os.remove(os.path.join(work_dir, name))
+
+            if len(loaded) > 1:
+                first, *rest = loaded.values()
+                identical = all(same_frames(first, frames) for frames in rest)
+                print(f"Frames identical: {identical}")
+                if not identical:
+                    raise SystemExit(1)
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
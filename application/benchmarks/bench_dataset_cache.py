@@ -0,0 +1,123 @@
+"""
+Time what load_data() costs each dashboard callback.
+
+Loads synthetic data into a database the way a full ingest does, then times
+the load_data() calls of one interaction both ways:
+
+- 'simplecache': the previous setup, Flask-Caching's SimpleCache holding the
+  frames. cachelib pickles the value on set and unpickles it on every get, so
+  each call deserialized the whole dataset.
+- 'holder': utils.data_loading.DatasetHolder, which hands out the same
+  in-process Dataset; each callback then projects the columns it uses.
+
+The filter callback called load_data() twice (data, then date ranges), the
+table and export callbacks once each. Reports the median seconds per call
+and per interaction; the first, cold read of the database is reported
+separately and not counted.
+
+Usage (from the application directory):
+    python -m benchmarks.bench_dataset_cache --rows 1000000 5000000
+"""
+import argparse
+import os
+import pickle
+import shutil
+import statistics
+import tempfile
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy.pool import NullPool
+
+from benchmarks.bench_load import build_database
+
+DEFAULT_ROWS = [1_000_000, 5_000_000]
+MODES = ['simplecache', 'holder']
+
+# load_data() calls per interaction, by callback
+CALLS_PER_INTERACTION = {'filter': 2, 'table': 1, 'export': 1}
+
+
+class PicklingCache:
+    """What cachelib's SimpleCache does with a value: pickle on set, unpickle on get."""
+
+    def __init__(self):
+        self._value = None
+
+    def set(self, value):
+        self._value = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+    def get(self):
+        return pickle.loads(self._value)
+
+
+def simplecache_loader(engine):
+    """Return a load_data() like the previous one: a cold read once, then cache gets."""
+    from utils.data_loading import load_data_from_db
+
+    cache = PicklingCache()
+    cache.set(load_data_from_db(engine))
+
+    return cache.get
+
+
+def holder_loader(engine):
+    """Return a load_data() backed by a DatasetHolder, with every column read once."""
+    from utils.data_loading import DatasetHolder
+
+    holder = DatasetHolder(engine)
+    dataset = holder.get()
+    dataset.users(), dataset.activity()
+
+    def load():
+        dataset = holder.get()
+        return dataset.users(), dataset.activity()
+    return load
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark load_data() per dashboard callback.")
+    parser.add_argument('--rows', type=int, nargs='+', default=DEFAULT_ROWS,
+                        help="Approximate merged row counts to benchmark")
+    parser.add_argument('--weeks', type=int, default=52)
+    parser.add_argument('--modes', nargs='+', default=MODES, choices=MODES)
+    parser.add_argument('--repeat', type=int, default=10, help="Calls per mode; the median is reported")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--work-dir', help="Where to write the database (default: a temp dir)")
+    args = parser.parse_args()
+
+    loaders = {'simplecache': simplecache_loader, 'holder': holder_loader}
+    calls = sum(CALLS_PER_INTERACTION.values())
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix='bench_dataset_cache_')
+    os.makedirs(work_dir, exist_ok=True)
+    try:
+        for rows in args.rows:
+            db_path = os.path.join(work_dir, f'{rows}.db')
+            if os.path.exists(db_path):
+                os.remove(db_path)
+            build_database(db_path, rows, args.weeks, seed=args.seed)
+            engine = create_engine(f'sqlite:///{db_path}', poolclass=NullPool)
+
+            for mode in args.modes:
+                start = time.perf_counter()
+                load = loaders[mode](engine)
+                cold_seconds = time.perf_counter() - start
+                seconds = []
+                for _ in range(args.repeat):
+                    start = time.perf_counter()
+                    users, activity = load()
+                    seconds.append(time.perf_counter() - start)
+                median = statistics.median(seconds)
+                if mode == args.modes[0]:
+                    print(f"\n== {len(activity):,} weekly rows, {len(users):,} users ==")
+                print(f"{mode:>11}: cold {cold_seconds:6.2f}s, load_data() {median * 1000:9.2f} ms/call, "
+                      f"{median * calls * 1000:9.2f} ms per interaction ({calls} calls)")
+            engine.dispose()
+            os.remove(db_path)
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
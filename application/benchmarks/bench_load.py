@@ -0,0 +1,141 @@
+"""
+Compare the database loaders of initialize_db on the same merged data.
+
+Builds a merged frame from synthetic query results, prepares it the way
+load_and_process_data does, then loads it into a fresh database with each
+loader: 'to_sql' (DataFrame.to_sql into the keyed tables, then the indexes)
+and 'bulk' (sqlite_loader.bulk_load). Reports rows per second for the inserts, the
+indexes and both, and checks that the loaded tables read back identically.
+
+Usage (from the application directory):
+    python -m benchmarks.bench_load --rows 1000000 5000000
+"""
+import argparse
+import contextlib
+import io
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+
+import pandas as pd
+
+from benchmarks.synthetic_data import generate_query_frames, users_for_rows
+
+DEFAULT_ROWS = [1_000_000, 5_000_000]
+LOADERS = ['to_sql', 'bulk']
+
+
+def prepared_frame(rows, weeks, seed=0):
+    """Merge synthetic query results and prepare them like load_and_process_data."""
+    from arrow_merge import interchange_table, merge_frames_arrow
+    from initialize_db import load_mappings, prepare_dataframe
+
+    frames = generate_query_frames(users_for_rows(rows, weeks), weeks, seed=seed)
+    with contextlib.redirect_stdout(io.StringIO()):
+        merged = interchange_table(merge_frames_arrow(*frames)).to_pandas(date_as_object=False)
+        country_mappings, region_mappings = load_mappings({})
+        return prepare_dataframe(merged, country_mappings, region_mappings)
+
+
+def build_database(db_path, rows, weeks, seed=0):
+    """Load synthetic data into a new database at db_path the way a full ingest does."""
+    from initialize_db import write_user_data
+
+    df = prepared_frame(rows, weeks, seed=seed)
+    conn = sqlite3.connect(db_path)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            write_user_data(conn, df)
+    finally:
+        conn.close()
+    return df
+
+
+def load(loader, df, db_path):
+    """Load df into a new database with the given loader. Returns (insert, index) seconds."""
+    from initialize_db import ACTIVITY_TABLE, PRIMARY_KEYS, USERS_TABLE, _create_indexes, split_user_data
+    from sqlite_loader import bulk_load, create_table, table_schema
+
+    users, activity = split_user_data(df)
+    tables = {USERS_TABLE: users, ACTIVITY_TABLE: activity}
+    conn = sqlite3.connect(db_path)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            if loader == 'bulk':
+                stats = bulk_load(conn, tables, primary_keys=PRIMARY_KEYS, create_indexes=_create_indexes)
+                return stats['insert_seconds'], stats['index_seconds']
+            start = time.perf_counter()
+            for table, frame in tables.items():
+                create_table(conn, table, table_schema(frame), PRIMARY_KEYS[table])
+                frame.to_sql(table, conn, if_exists='append', index=False)
+            conn.commit()
+            inserted = time.perf_counter()
+            _create_indexes(conn)
+            conn.commit()
+            return inserted - start, time.perf_counter() - inserted
+    finally:
+        conn.close()
+
+
+def read_back(db_path):
+    from initialize_db import ACTIVITY_TABLE, USERS_TABLE
+
+    conn = sqlite3.connect(db_path)
+    try:
+        types, frames = [], []
+        for table in (USERS_TABLE, ACTIVITY_TABLE):
+            types.append([(row[1], row[2]) for row in conn.execute(f"PRAGMA table_info({table})")])
+            frames.append(pd.read_sql(f"SELECT * FROM {table}", conn))
+        return types, frames
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark DataFrame.to_sql against the bulk SQLite loader.")
+    parser.add_argument('--rows', type=int, nargs='+', default=DEFAULT_ROWS,
+                        help="Approximate merged row counts to benchmark")
+    parser.add_argument('--weeks', type=int, default=52)
+    parser.add_argument('--loaders', nargs='+', default=LOADERS, choices=LOADERS)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--work-dir', help="Where to write the databases (default: a temp dir)")
+    args = parser.parse_args()
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix='bench_load_')
+    os.makedirs(work_dir, exist_ok=True)
+    try:
+        for rows in args.rows:
+            df = prepared_frame(rows, args.weeks, seed=args.seed)
+            print(f"\n== {len(df):,} rows, {len(df.columns)} columns ==")
+            loaded = {}
+            for loader in args.loaders:
+                db_path = os.path.join(work_dir, f'{rows}_{loader}.db')
+                if os.path.exists(db_path):
+                    os.remove(db_path)
+                insert_seconds, index_seconds = load(loader, df, db_path)
+                total = insert_seconds + index_seconds
+                print(f"{loader:>7}: inserts {insert_seconds:7.1f}s ({len(df) / insert_seconds:10,.0f} rows/s), "
+                      f"indexes {index_seconds:6.1f}s, total {total:7.1f}s ({len(df) / total:10,.0f} rows/s), "
+                      f"{os.path.getsize(db_path) / 1e6:,.0f} MB")
+                loaded[loader] = db_path
+
+            if len(loaded) > 1:
+                (first_types, first), *rest = (read_back(path) for path in loaded.values())
+                identical = all(
+                    types == first_types and all(frame.equals(other) for frame, other in zip(frames, first))
+                    for types, frames in rest
+                )
+                print(f"Tables identical: {identical}")
+                if not identical:
+                    raise SystemExit(1)
+            for path in loaded.values():
+                os.remove(path)
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
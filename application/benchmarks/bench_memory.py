@@ -0,0 +1,67 @@
+"""
+Report the dashboard dataset's memory per column, as read and compacted.
+
+Loads synthetic data into a database the way a full ingest does, then reads
+the users and weekly_activity tables back twice: as plain frames with the
+types pandas infers, and with utils.data_loading.load_data_from_db, which
+applies the compact schema. Prints each column's size and dtype both ways and
+the totals.
+
+Usage (from the application directory):
+    python -m benchmarks.bench_memory --rows 1000000
+"""
+import argparse
+import os
+import sqlite3
+import tempfile
+
+import pandas as pd
+from sqlalchemy import create_engine
+from sqlalchemy.pool import NullPool
+
+from benchmarks.bench_load import build_database
+
+DEFAULT_ROWS = [1_000_000]
+
+
+def plain_frames(db_path):
+    """Read the tables with inferred types and parsed dates."""
+    conn = sqlite3.connect(db_path)
+    try:
+        users = pd.read_sql("SELECT * FROM users", conn, parse_dates=['df2_registration_date'])
+        activity = pd.read_sql("SELECT * FROM weekly_activity", conn, parse_dates=['activity_week'])
+    finally:
+        conn.close()
+    return users, activity
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report the dashboard dataset's memory per column.")
+    parser.add_argument('--rows', type=int, nargs='+', default=DEFAULT_ROWS,
+                        help="Approximate merged row counts to report on")
+    parser.add_argument('--weeks', type=int, default=52)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    from utils.data_loading import load_data_from_db, memory_report
+
+    for rows in args.rows:
+        with tempfile.TemporaryDirectory(prefix='bench_memory_') as work_dir:
+            db_path = os.path.join(work_dir, 'user_data.db')
+            build_database(db_path, rows, args.weeks, seed=args.seed)
+            users, activity = plain_frames(db_path)
+            before = memory_report(users, activity)
+            users, activity = load_data_from_db(create_engine(f'sqlite:///{db_path}', poolclass=NullPool))
+            after = memory_report(users, activity)
+        report = before.merge(after, on=['frame', 'column'], suffixes=('_before', '_after'))
+
+        print(f"\n== {len(activity):,} weekly rows, {len(users):,} users ==")
+        with pd.option_context('display.max_rows', None, 'display.width', 120):
+            print(report.to_string(index=False, float_format=lambda mb: f"{mb:,.1f}"))
+        total_before, total_after = before['mb'].sum(), after['mb'].sum()
+        print(f"Total: {total_before:,.1f} MB -> {total_after:,.1f} MB "
+              f"({1 - total_after / max(total_before, 1e-9):.0%} smaller)")
+
+
+if __name__ == '__main__':
+    main()
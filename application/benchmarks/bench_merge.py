@@ -0,0 +1,98 @@
+"""
+Compare the merge engines of merge_utils.join_csv_files.
+
+Generates synthetic query results at each size, runs every engine in its own
+process (so peak memory is measured per engine) and checks that the merged
+CSVs are byte-identical. The 'partitioned' engine is the out-of-core arrow
+merge under --memory-budget-mb; it only partitions when the estimated
+in-memory merge exceeds the budget, so keep the budget below that.
+
+Usage (from the application directory):
+    python -m benchmarks.bench_merge --rows 1000000 10000000 50000000
+    python -m benchmarks.bench_merge --rows 1000000 --engines arrow partitioned --memory-budget-mb 256
+"""
+import argparse
+import contextlib
+import filecmp
+import io
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+
+from benchmarks.synthetic_data import generate_query_frames, users_for_rows, write_query_files
+
+DEFAULT_ROWS = [1_000_000, 10_000_000, 50_000_000]
+
+
+def _run_engine(engine, paths, output_file, memory_budget_mb, results):
+    from merge_utils import join_csv_files
+    from pipeline_metrics import peak_rss_mb
+
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        if engine == 'partitioned':
+            join_csv_files(paths['query_1'], paths['query_2'], paths['query_3'], output_file,
+                           memory_budget_mb=memory_budget_mb)
+        else:
+            join_csv_files(paths['query_1'], paths['query_2'], paths['query_3'], output_file, engine=engine)
+    results.put({'seconds': time.perf_counter() - start, 'peak_rss_mb': peak_rss_mb()})
+
+
+def run_engine(engine, paths, output_file, memory_budget_mb=None):
+    """Merge in a fresh process and return its timing and peak memory."""
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    process = context.Process(target=_run_engine, args=(engine, paths, output_file, memory_budget_mb, results))
+    process.start()
+    process.join()
+    if process.exitcode != 0:
+        raise RuntimeError(f"{engine} engine failed with exit code {process.exitcode}")
+    return results.get()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the merge engines on synthetic data.")
+    parser.add_argument('--rows', type=int, nargs='+', default=DEFAULT_ROWS,
+                        help="Approximate merged row counts to benchmark")
+    parser.add_argument('--weeks', type=int, default=52)
+    parser.add_argument('--engines', nargs='+', default=['pandas', 'arrow'], choices=['pandas', 'arrow', 'partitioned'])
+    parser.add_argument('--memory-budget-mb', type=int, default=512,
+                        help="Memory budget of the partitioned engine")
+    parser.add_argument('--format', default='parquet', choices=['parquet', 'csv'],
+                        help="File format of the generated query results")
+    parser.add_argument('--work-dir', help="Where to write inputs and outputs (default: a temp dir)")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix='bench_merge_')
+    try:
+        for rows in args.rows:
+            users = users_for_rows(rows, args.weeks)
+            print(f"\n== ~{rows:,} rows ({users:,} users x {args.weeks} weeks) ==")
+            case_dir = os.path.join(work_dir, str(rows))
+            paths = write_query_files(generate_query_frames(users, args.weeks, seed=args.seed),
+                                      case_dir, args.format)
+
+            outputs = {}
+            for engine in args.engines:
+                outputs[engine] = os.path.join(case_dir, f'join_{engine}.csv')
+                stats = run_engine(engine, paths, outputs[engine], args.memory_budget_mb)
+                print(f"{engine:>7}: {stats['seconds']:8.1f}s, peak RSS {stats['peak_rss_mb']:,.0f} MB")
+
+            if len(outputs) > 1:
+                first, *rest = outputs.values()
+                identical = all(filecmp.cmp(first, other, shallow=False) for other in rest)
+                print(f"Outputs identical: {identical}")
+                if not identical:
+                    raise SystemExit(1)
+            if not args.work_dir:
+                shutil.rmtree(case_dir)
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+"""
+End-to-end ingest benchmark against a local Redash stand-in.
+
+For each scale, synthetic query results are written as Redash payloads and
+served by benchmarks.fake_redash; update_user_data.main then runs the whole
+download -> join_csv_files -> load_and_process_data flow in a fresh process,
+with the shipped config.json except for paths, which point into the work
+directory. Stage timings, row counts and peak RSS come from the run's
+pipeline_metrics record.
+
+Usage (from the application directory):
+    python -m benchmarks.bench_pipeline --rows 100000 1000000 5000000
+    python -m benchmarks.bench_pipeline --rows 1000000 --set merge_engine=pandas --set download_mode=json
+"""
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+from benchmarks.fake_redash import FakeRedashServer
+from benchmarks.synthetic_data import generate_query_frames, users_for_rows, write_redash_payloads
+
+DEFAULT_ROWS = [100_000, 1_000_000, 5_000_000]
+STAGES = ['fetch', 'merge', 'load']
+
+
+def _config_value(text):
+    """Parse a --set value as JSON where possible (numbers, true, null), else keep the string."""
+    try:
+        return json.loads(text)
+    except ValueError:
+        return text
+
+
+def benchmark_config(base_config, server_url, case_dir, overrides=None):
+    """Return base_config with every file the pipeline writes moved into case_dir."""
+    config = dict(base_config)
+    config.update({
+        'redash_base_url': server_url,
+        'output_folder': os.path.join(case_dir, 'query_results'),
+        'fixed_output_csv': os.path.join(case_dir, 'join_result.csv'),
+        'delta_output_csv': os.path.join(case_dir, 'join_delta.csv'),
+        'metrics_path': os.path.join(case_dir, 'pipeline_metrics.jsonl'),
+        'manifest_path': os.path.join(case_dir, 'refresh_manifest.json'),
+        'ingest_mode': 'full',
+    })
+    for key in ('country_mappings_path', 'region_mappings_path'):
+        if key in config:
+            config[key] = os.path.abspath(config[key])
+    config.update(overrides or {})
+    return config
+
+
+def _run_pipeline(config, config_path, db_path, log_path):
+    import update_user_data
+
+    config = dict(config, api_key='benchmark')
+    with open(log_path, 'w') as log, contextlib.redirect_stdout(log):
+        update_user_data.main(config=config, config_path=config_path, db_path=db_path, force=True)
+
+
+def run_pipeline(config, case_dir):
+    """Run update_user_data.main in a fresh process and return its pipeline_metrics record."""
+    from pipeline_metrics import read_runs
+
+    config_path = os.path.join(case_dir, 'config.json')
+    with open(config_path, 'w') as f:
+        json.dump(config, f, indent=2)
+    log_path = os.path.join(case_dir, 'pipeline.log')
+
+    context = multiprocessing.get_context('spawn')
+    process = context.Process(target=_run_pipeline,
+                              args=(config, config_path, os.path.join(case_dir, 'user_data.db'), log_path))
+    process.start()
+    process.join()
+    if process.exitcode != 0:
+        raise RuntimeError(f"Pipeline failed with exit code {process.exitcode}; see {log_path}")
+    return read_runs(config['metrics_path'], last=1)[0]
+
+
+def _stage(record, name):
+    return next((stage for stage in record['stages'] if stage['name'] == name), {})
+
+
+def format_result(rows, users, weeks, payload_mb, record):
+    """Format one scale's results: totals, then wall time and throughput per stage."""
+    merged_rows = _stage(record, 'load.read').get('rows_out') or 0
+    lines = [
+        f"~{rows:,} rows ({users:,} users x {weeks} weeks), {payload_mb:,.1f} MB of payloads: "
+        f"{record['wall_seconds']:.1f}s total, {merged_rows / max(record['wall_seconds'], 1e-9):,.0f} merged rows/s, "
+        f"peak RSS {record['peak_rss_mb']:,.0f} MB"
+    ]
+    for name in STAGES:
+        stage = _stage(record, name)
+        if not stage:
+            continue
+        seconds = max(stage['wall_seconds'], 1e-9)
+        rows_done = stage.get('rows_out') or merged_rows
+        lines.append(
+            f"  {name:>5}: {stage['wall_seconds']:7.1f}s wall, {stage['cpu_seconds']:7.1f}s CPU, "
+            f"{rows_done / seconds:12,.0f} rows/s, peak RSS {stage['peak_rss_mb']:,.0f} MB"
+        )
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the full ingest pipeline against a local Redash.")
+    parser.add_argument('--rows', type=int, nargs='+', default=DEFAULT_ROWS,
+                        help="Approximate merged row counts to benchmark")
+    parser.add_argument('--weeks', type=int, default=52)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--latency', type=float, default=0.0, help="Seconds the fake Redash waits per response")
+    parser.add_argument('--config', default='./config.json', help="Config whose settings are benchmarked")
+    parser.add_argument('--set', action='append', default=[], metavar='KEY=VALUE',
+                        help="Override a config key, e.g. --set merge_engine=pandas")
+    parser.add_argument('--work-dir', help="Where to write payloads, outputs and logs (default: a temp dir)")
+    args = parser.parse_args()
+
+    with open(args.config, 'r') as f:
+        base_config = json.load(f)
+    overrides = {}
+    for item in args.set:
+        key, _, value = item.partition('=')
+        overrides[key] = _config_value(value)
+    query_ids = base_config['query_ids']
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix='bench_pipeline_')
+    try:
+        for rows in args.rows:
+            users = users_for_rows(rows, args.weeks)
+            case_dir = os.path.join(work_dir, str(rows))
+            payload_dir = os.path.join(case_dir, 'payloads')
+            paths = write_redash_payloads(generate_query_frames(users, args.weeks, seed=args.seed),
+                                          payload_dir, query_ids)
+            payload_mb = sum(os.path.getsize(path) for path in paths.values()) / 1e6
+
+            with FakeRedashServer.from_directory(payload_dir, latency=args.latency) as server:
+                config = benchmark_config(base_config, server.url, case_dir, overrides)
+                record = run_pipeline(config, case_dir)
+            print(format_result(rows, users, args.weeks, payload_mb, record))
+
+            if not args.work_dir:
+                shutil.rmtree(case_dir)
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
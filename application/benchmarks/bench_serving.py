@@ -0,0 +1,238 @@
+"""
+Load-test the dashboard with concurrent users, under Dash's development
+server and under gunicorn.
+
+Loads synthetic data into a database the way a full ingest does, starts the
+dashboard on it in each serving mode in turn and waits for /healthz, then
+runs --users simulated users at once for --duration seconds. Each user
+repeats what opening the dashboard does: the filter callback's initial load
+(user ids and dropdown options) and then the first table page for those ids.
+The callback requests are built from the app's own /_dash-layout and
+/_dash-dependencies, the way the browser builds them.
+
+- 'dev': python app.py, Dash's single-process development server.
+- 'gunicorn': gunicorn --config gunicorn.conf.py app:server (set the worker
+  and thread counts with DASHBOARD_WORKERS / DASHBOARD_THREADS).
+
+Reports interactions per second and the median and 95th percentile seconds
+per interaction. With --url, the running dashboard at that address is
+tested instead, and nothing is started.
+
+Usage (from the application directory):
+    python -m benchmarks.bench_serving --rows 1000000 --users 1 8 32
+"""
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+from benchmarks.bench_load import build_database
+
+DEFAULT_ROWS = [1_000_000]
+DEFAULT_USERS = [1, 8, 32]
+MODES = ['dev', 'gunicorn']
+ADDRESS = '127.0.0.1:8050'
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+FILTER_OUTPUT = 'filtered_user_ids.data'
+TABLE_OUTPUT = 'table-body.children'
+
+
+def server_command(mode):
+    if mode == 'dev':
+        return [sys.executable, os.path.join(APP_DIR, 'app.py')]
+    return [sys.executable, '-m', 'gunicorn', '--config', os.path.join(APP_DIR, 'gunicorn.conf.py'), 'app:server']
+
+
+def start_server(mode, work_dir, startup_timeout=600):
+    """Start the dashboard on work_dir's user_data.db; returns the process once /healthz is ready."""
+    # The app's DB_PATH is relative, so the server runs in work_dir with the
+    # application directory on its import path
+    env = dict(os.environ, PYTHONPATH=APP_DIR, DASHBOARD_BIND=ADDRESS)
+    process = subprocess.Popen(server_command(mode), cwd=work_dir, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + startup_timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"The {mode} server exited with status {process.returncode}")
+        try:
+            if requests.get(f'http://{ADDRESS}/healthz', timeout=5).status_code == 200:
+                return process
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    process.terminate()
+    raise RuntimeError(f"The {mode} server wasn't ready within {startup_timeout}s")
+
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def layout_props(node, props=None):
+    """Map each component id in the layout tree to its props."""
+    props = {} if props is None else props
+    if isinstance(node, list):
+        for child in node:
+            layout_props(child, props)
+    elif isinstance(node, dict):
+        component = node.get('props', {})
+        if 'id' in component and isinstance(component['id'], str):
+            props[component['id']] = component
+        layout_props(component.get('children'), props)
+    return props
+
+
+def parse_outputs(output):
+    """Split a dependency's output string into the outputs list the renderer sends."""
+    specs = output[2:-2].split('...') if output.startswith('..') else [output]
+    outputs = []
+    for spec in specs:
+        component_id, prop = spec.rsplit('.', 1)
+        outputs.append({'id': component_id, 'property': prop})
+    return outputs if output.startswith('..') else outputs[0]
+
+
+class CallbackClient:
+    """Builds and sends callback requests the way the browser does on page load."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.props = layout_props(requests.get(f'{base_url}/_dash-layout', timeout=60).json())
+        self.dependencies = {}
+        for dependency in requests.get(f'{base_url}/_dash-dependencies', timeout=60).json():
+            for output in dependency['output'].strip('.').split('...'):
+                self.dependencies.setdefault(output.split('@')[0], dependency)
+
+    def call(self, session, output, values):
+        """
+        Call the callback producing output with values (keyed 'id.property')
+        in place of the layout's props. The values given for its inputs are
+        sent as the changed props that triggered it, as the browser does; with
+        none, it is the initial call made on page load.
+        """
+        dependency = self.dependencies[output]
+
+        def with_values(items):
+            return [{**item, 'value': values.get(f"{item['id']}.{item['property']}",
+                                                 self.props.get(item['id'], {}).get(item['property']))}
+                    for item in items]
+        inputs = with_values(dependency['inputs'])
+        body = {
+            'output': dependency['output'],
+            'outputs': parse_outputs(dependency['output']),
+            'inputs': inputs,
+            'state': with_values(dependency['state']),
+            'changedPropIds': [f"{item['id']}.{item['property']}" for item in inputs
+                               if f"{item['id']}.{item['property']}" in values],
+        }
+        response = session.post(f'{self.base_url}/_dash-update-component', json=body, timeout=300)
+        if response.status_code != 200:
+            # 204 means the callback returned no_update: it didn't run as on a page load
+            raise RuntimeError(f"{output} callback answered HTTP {response.status_code}, expected 200 "
+                               f"with its outputs")
+        return response.json()['response']
+
+
+def interaction(client, session):
+    """Open the dashboard: the filter callback's initial load, then the first table page."""
+    filtered = client.call(session, FILTER_OUTPUT, {})
+    user_ids = filtered['filtered_user_ids']['data']
+    client.call(session, TABLE_OUTPUT, {'filtered_user_ids.data': user_ids, 'page-number.data': 1})
+
+
+def run_load(base_url, users, duration):
+    """Run users concurrent users for duration seconds; returns each interaction's seconds."""
+    client = CallbackClient(base_url)
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    stop_at = time.perf_counter() + duration
+
+    def user():
+        with requests.Session() as session:
+            while time.perf_counter() < stop_at:
+                start = time.perf_counter()
+                try:
+                    interaction(client, session)
+                except Exception as e:
+                    with lock:
+                        errors.append(e)
+                    continue
+                with lock:
+                    latencies.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=user) for _ in range(users)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        print(f"  {len(errors)} interactions failed, e.g. {errors[0]}")
+    return latencies
+
+
+def report(label, users, duration, latencies):
+    if not latencies:
+        print(f"{label}, {users:3d} users: no interaction completed")
+        return
+    ordered = sorted(latencies)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    print(f"{label}, {users:3d} users: {len(latencies) / duration:7.2f} interactions/s, "
+          f"median {statistics.median(latencies):6.2f}s, p95 {p95:6.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the dashboard's serving modes.")
+    parser.add_argument('--rows', type=int, nargs='+', default=DEFAULT_ROWS,
+                        help="Approximate merged row counts to benchmark")
+    parser.add_argument('--weeks', type=int, default=52)
+    parser.add_argument('--users', type=int, nargs='+', default=DEFAULT_USERS, help="Concurrent users")
+    parser.add_argument('--duration', type=float, default=60, help="Seconds per run")
+    parser.add_argument('--modes', nargs='+', default=MODES, choices=MODES)
+    parser.add_argument('--url', help="Test the dashboard already running here instead")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--work-dir', help="Where to write the database (default: a temp dir)")
+    args = parser.parse_args()
+
+    if args.url:
+        for users in args.users:
+            report(args.url, users, args.duration, run_load(args.url.rstrip('/'), users, args.duration))
+        return
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix='bench_serving_')
+    os.makedirs(work_dir, exist_ok=True)
+    try:
+        for rows in args.rows:
+            db_path = os.path.join(work_dir, 'user_data.db')
+            for name in os.listdir(work_dir):
+                if name.startswith('user_data.db'):
+                    os.remove(os.path.join(work_dir, name))
+            build_database(db_path, rows, args.weeks, seed=args.seed)
+            print(f"\n== {rows:,} merged rows ==")
+            for mode in args.modes:
+                process = start_server(mode, work_dir)
+                try:
+                    for users in args.users:
+                        report(f"{mode:>8}", users, args.duration,
+                               run_load(f'http://{ADDRESS}', users, args.duration))
+                finally:
+                    stop_server(process)
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""
+Compare N dashboard worker processes loading the dataset from SQLite and
+mapping its Arrow snapshot.
+
+Loads synthetic data into a database the way a full ingest does, then starts
+--workers processes at once, each of which loads every users and
+weekly_activity column the way the dashboard does (utils.data_loading.Dataset):
+
+- 'sqlite': every worker reads the columns from SQLite into its own memory.
+- 'snapshot': the generation's Arrow snapshot is published once (timed
+  separately), then every worker maps it; the pages are shared.
+
+Reports the median seconds until a worker has the dataset, and the workers'
+total proportional set size (PSS, which splits shared pages between the
+processes mapping them) after loading. Linux only: PSS is read from
+/proc/self/smaps_rollup.
+
+Usage (from the application directory):
+    python -m benchmarks.bench_workers --rows 1000000 --workers 1 4 8
+"""
+import argparse
+import multiprocessing
+import os
+import shutil
+import statistics
+import tempfile
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy.pool import NullPool
+
+from benchmarks.bench_load import build_database
+
+DEFAULT_ROWS = [1_000_000]
+DEFAULT_WORKERS = [1, 4, 8]
+MODES = ['sqlite', 'snapshot']
+
+
+def pss_mb():
+    """This process's proportional set size in MB."""
+    with open('/proc/self/smaps_rollup') as f:
+        for line in f:
+            if line.startswith('Pss:'):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def worker_load(db_path, snapshots, start_barrier):
+    """Load every dataset column in this process; returns (seconds, PSS MB)."""
+    from utils.data_loading import Dataset
+
+    engine = create_engine(f'sqlite:///{db_path}', poolclass=NullPool)
+    start_barrier.wait()
+    start = time.perf_counter()
+    dataset = Dataset(engine, snapshots=snapshots)
+    dataset.users(), dataset.activity()
+    seconds = time.perf_counter() - start
+    return seconds, pss_mb()
+
+
+def run_workers(db_path, snapshots, workers):
+    """Start the workers together; returns their (seconds, PSS MB) results."""
+    context = multiprocessing.get_context('spawn')
+    with context.Manager() as manager:
+        start_barrier = manager.Barrier(workers)
+        with context.Pool(workers) as pool:
+            return pool.starmap(worker_load, [(db_path, snapshots, start_barrier)] * workers)
+
+
+def publish(db_path):
+    """Publish the database's snapshot; returns the seconds taken."""
+    from utils.data_loading import Dataset
+
+    start = time.perf_counter()
+    Dataset(create_engine(f'sqlite:///{db_path}', poolclass=NullPool)).users([])
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark dashboard workers loading the dataset.")
+    parser.add_argument('--rows', type=int, nargs='+', default=DEFAULT_ROWS,
+                        help="Approximate merged row counts to benchmark")
+    parser.add_argument('--weeks', type=int, default=52)
+    parser.add_argument('--workers', type=int, nargs='+', default=DEFAULT_WORKERS)
+    parser.add_argument('--modes', nargs='+', default=MODES, choices=MODES)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--work-dir', help="Where to write the database (default: a temp dir)")
+    args = parser.parse_args()
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix='bench_workers_')
+    os.makedirs(work_dir, exist_ok=True)
+    try:
+        for rows in args.rows:
+            db_path = os.path.join(work_dir, f'{rows}.db')
+            if os.path.exists(db_path):
+                os.remove(db_path)
+            build_database(db_path, rows, args.weeks, seed=args.seed)
+            print(f"\n== {rows:,} merged rows ==")
+            if 'snapshot' in args.modes:
+                print(f"snapshot published in {publish(db_path):.2f}s")
+
+            for workers in args.workers:
+                for mode in args.modes:
+                    results = run_workers(db_path, mode == 'snapshot', workers)
+                    seconds = statistics.median(result[0] for result in results)
+                    total_pss = sum(result[1] for result in results)
+                    print(f"{workers:3d} workers, {mode:>8}: ready in {seconds * 1000:9.1f} ms (median), "
+                          f"total PSS {total_pss:8,.0f} MB")
+            for name in os.listdir(work_dir):
+                if name.startswith(f'{rows}.db'):
+                    os.remove(os.path.join(work_dir, name))
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,177 @@
+"""
+Local stand-in for the parts of the Redash API the pipeline uses.
+
+Serves GET /api/queries/<id> and GET /api/query_results/<id> from JSON payloads
+on disk, so update_user_data can be exercised without the production Redash.
+
+Usage (from the application directory):
+    python -m benchmarks.fake_redash --results-dir ./fake_results --port 5005
+
+The results directory holds one `<query_id>.json` file per query, in the same
+shape Redash returns from /api/query_results/<id>.
+"""
+import argparse
+import json
+import os
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+QUERY_PATH = re.compile(r'^/api/queries/(\d+)$')
+RESULT_PATH = re.compile(r'^/api/query_results/(\d+)$')
+
+# Result ids are offset from query ids so a mixed-up id fails loudly
+RESULT_ID_OFFSET = 100000
+
+
+class FakeRedashServer:
+    """
+    Threaded HTTP server standing in for Redash.
+
+    results maps query_id -> path of a query result JSON payload. latency adds a
+    delay before every response, and fail_first makes the first N requests to
+    each path return 502 to exercise the retry logic.
+    """
+
+    def __init__(self, results, host='127.0.0.1', port=0, latency=0.0, fail_first=0,
+                 chunk_size=1 << 16):
+        self.results = {int(query_id): path for query_id, path in results.items()}
+        self.result_ids = {query_id: query_id + RESULT_ID_OFFSET for query_id in self.results}
+        self.latency = latency
+        self.fail_first = fail_first
+        self.chunk_size = chunk_size
+        self.request_counts = {}
+        self.connections = set()
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @classmethod
+    def from_directory(cls, results_dir, **kwargs):
+        """Serve every <query_id>.json file in results_dir."""
+        results = {
+            int(name[:-len('.json')]): os.path.join(results_dir, name)
+            for name in os.listdir(results_dir)
+            if name.endswith('.json') and name[:-len('.json')].isdigit()
+        }
+        return cls(results, **kwargs)
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def set_result(self, query_id, path):
+        """Point a query at a new result payload, giving it a fresh result id."""
+        with self._lock:
+            self.results[int(query_id)] = path
+            self.result_ids[int(query_id)] = max(self.result_ids.values(), default=RESULT_ID_OFFSET) + 1
+
+    def _should_fail(self, path):
+        with self._lock:
+            count = self.request_counts.get(path, 0)
+            self.request_counts[path] = count + 1
+            return count < self.fail_first
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, status, payload):
+                body = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _send_file(self, path):
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(os.path.getsize(path)))
+                self.end_headers()
+                with open(path, 'rb') as f:
+                    while True:
+                        chunk = f.read(server.chunk_size)
+                        if not chunk:
+                            break
+                        self.wfile.write(chunk)
+
+            def do_GET(self):
+                with server._lock:
+                    server.connections.add(self.client_address)
+                if server.latency:
+                    time.sleep(server.latency)
+                if not self.headers.get('Authorization', '').startswith('Key '):
+                    return self._send_json(401, {'message': 'Missing API key'})
+                if server._should_fail(self.path):
+                    return self._send_json(502, {'message': 'Bad Gateway'})
+
+                match = QUERY_PATH.match(self.path)
+                if match and int(match.group(1)) in server.results:
+                    query_id = int(match.group(1))
+                    return self._send_json(200, {
+                        'id': query_id,
+                        'latest_query_data_id': server.result_ids[query_id],
+                    })
+
+                match = RESULT_PATH.match(self.path)
+                if match:
+                    result_id = int(match.group(1))
+                    for query_id, current_id in server.result_ids.items():
+                        if current_id == result_id:
+                            return self._send_file(server.results[query_id])
+
+                return self._send_json(404, {'message': 'Not found'})
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve query results from disk like Redash does.")
+    parser.add_argument('--results-dir', required=True, help="Directory of <query_id>.json payloads")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5005)
+    parser.add_argument('--latency', type=float, default=0.0, help="Seconds to wait before each response")
+    parser.add_argument('--fail-first', type=int, default=0, help="Return 502 for the first N requests per path")
+    args = parser.parse_args()
+
+    server = FakeRedashServer.from_directory(
+        args.results_dir, host=args.host, port=args.port,
+        latency=args.latency, fail_first=args.fail_first
+    )
+    print(f"Fake Redash serving {sorted(server.results)} at {server.url}")
+    try:
+        server._httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server._httpd.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+"""
+Synthetic query results shaped like the three Redash queries the pipeline merges.
+
+query_1 holds weekly activity metrics, query_2 one profile row per user and
+query_3 additional weekly metrics with gaps and missing scores, so the merge
+has real filling work to do. Generation is vectorized, so tens of millions of
+rows take seconds rather than minutes.
+"""
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+COUNTRIES = ['Canada', ' united states, ny', 'Россия', 'Germany', None, 'France', 'Narnia', 'china']
+MEMBERSHIPS = ['0', 'Pro - Monthly', 'Awesome - Yearly', 'Trial - Pro Monthly - 30 Days', '-']
+USER_TYPES = ['Photographer', 'Brand', None]
+
+# Share of user weeks with a row in query_1 and query_3
+ACTIVITY_RATE = 0.7
+METRICS_RATE = 0.6
+
+# Rows serialized at a time when writing Redash payloads
+PAYLOAD_CHUNK_ROWS = 100000
+
+
+def users_for_rows(rows, weeks):
+    """Number of users that yields roughly `rows` merged rows over `weeks` weeks."""
+    coverage = 1 - (1 - ACTIVITY_RATE) * (1 - METRICS_RATE)
+    return max(1, int(round(rows / (weeks * coverage))))
+
+
+def _choice(rng, values, size):
+    return np.array(values, dtype=object)[rng.integers(0, len(values), size)]
+
+
+def _with_nulls(rng, values, rate):
+    values = values.astype(object)
+    values[rng.random(len(values)) < rate] = None
+    return values
+
+
+def generate_query_frames(users, weeks=52, seed=0, start='2024-01-01'):
+    """Return (query_1, query_2, query_3) DataFrames for `users` users over `weeks` weeks."""
+    rng = np.random.default_rng(seed)
+    user_ids = np.arange(1, users + 1, dtype=np.int64)
+    week_labels = pd.date_range(start, periods=weeks, freq='7D').strftime('%Y-%m-%d').to_numpy(dtype=object)
+
+    grid_users = np.repeat(user_ids, weeks)
+    grid_weeks = np.tile(week_labels, users)
+
+    in_q1 = rng.random(len(grid_users)) < ACTIVITY_RATE
+    n1 = int(in_q1.sum())
+    query_1 = pd.DataFrame({
+        'user_id': grid_users[in_q1],
+        'activity_week': grid_weeks[in_q1],
+        'total_uploads': rng.integers(0, 21, n1),
+        'total_licensing_submissions': rng.integers(0, 6, n1),
+        'total_accepted_licensing': rng.integers(0, 4, n1),
+        'total_sales_revenue': np.round(rng.random(n1) * 50, 2),
+        'total_num_of_sales': rng.integers(0, 5, n1),
+        'num_of_photos_featured': rng.integers(0, 3, n1),
+        'num_of_galleries_featured': np.zeros(n1, dtype=np.int64),
+        'num_of_stories_featured': rng.integers(0, 2, n1),
+    })
+
+    id_strings = user_ids.astype(str).astype(object)
+    query_2 = pd.DataFrame({
+        'user_id': user_ids,
+        'full_name': 'Name ' + id_strings,
+        'username': 'user' + id_strings,
+        'user_type': _choice(rng, USER_TYPES, users),
+        'registration_date': pd.to_datetime('2010-01-01') + pd.to_timedelta(rng.integers(0, 5000, users), unit='D'),
+        'membership': _choice(rng, MEMBERSHIPS, users),
+        'country': _choice(rng, COUNTRIES, users),
+        'profile_url': 'https://500px.com/u' + id_strings,
+        'social_links': _with_nulls(rng, np.full(users, 'insta.com/x, tw.com/y', dtype=object), 0.5),
+        'exclusivity_rate': np.round(rng.random(users) * 100, 2),
+        'acceptance_rate': np.where(rng.random(users) < 0.2, np.nan, np.round(rng.random(users) * 100, 2)),
+    })
+    query_2['registration_date'] = query_2['registration_date'].dt.strftime('%Y-%m-%d')
+
+    in_q3 = rng.random(len(grid_users)) < METRICS_RATE
+    n3 = int(in_q3.sum())
+    query_3 = pd.DataFrame({
+        'user_id': grid_users[in_q3],
+        'activity_week': grid_weeks[in_q3],
+        'photo_likes': rng.integers(0, 91, n3),
+        'comments': rng.integers(0, 10, n3),
+        'med_lai_score': np.where(rng.random(n3) < 0.3, np.nan, np.round(rng.random(n3) * 10, 2)),
+        'avg_visit_days_monthly': rng.integers(0, 32, n3),
+        'med_aesthetic_score': np.round(rng.random(n3), 3),
+        'quality_score': np.round(rng.random(n3) * 100, 1),
+    })
+
+    return query_1, query_2, query_3
+
+
+def write_query_files(frames, output_dir, file_format='parquet'):
+    """Write the frames as query_1..3 files and return their paths keyed by query."""
+    os.makedirs(output_dir, exist_ok=True)
+    paths = {}
+    for number, frame in enumerate(frames, start=1):
+        key = f'query_{number}'
+        path = os.path.join(output_dir, f'{key}.{file_format}')
+        if file_format == 'parquet':
+            frame.to_parquet(path, index=False)
+        else:
+            frame.to_csv(path, index=False)
+        paths[key] = path
+    return paths
+
+
+def _redash_type(dtype):
+    if pd.api.types.is_bool_dtype(dtype):
+        return 'boolean'
+    if pd.api.types.is_integer_dtype(dtype):
+        return 'integer'
+    if pd.api.types.is_float_dtype(dtype):
+        return 'float'
+    return 'string'
+
+
+def write_redash_payload(frame, path):
+    """
+    Write a frame as a Redash /api/query_results/<id> payload.
+
+    Columns come first with their Redash types, then the rows, as Redash
+    serializes them. Rows are written in chunks so large frames don't need
+    the whole JSON text in memory.
+    """
+    columns = [
+        {'name': name, 'friendly_name': name, 'type': _redash_type(dtype)}
+        for name, dtype in frame.dtypes.items()
+    ]
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('{"query_result": {"id": 1, "data": {"columns": ')
+        f.write(json.dumps(columns))
+        f.write(', "rows": [')
+        for start in range(0, len(frame), PAYLOAD_CHUNK_ROWS):
+            if start:
+                f.write(', ')
+            chunk = frame.iloc[start:start + PAYLOAD_CHUNK_ROWS]
+            f.write(chunk.to_json(orient='records', double_precision=15, force_ascii=False)[1:-1])
+        f.write(']}}}')
+    return path
+
+
+def write_redash_payloads(frames, output_dir, query_ids):
+    """
+    Write the frames as <query_id>.json payloads for benchmarks.fake_redash.
+
+    query_ids maps query_1..3 to Redash query ids, as in config.json. Returns
+    the payload paths keyed by query.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    return {
+        key: write_redash_payload(frame, os.path.join(output_dir, f'{query_ids[key]}.json'))
+        for key, frame in zip(('query_1', 'query_2', 'query_3'), frames)
+    }
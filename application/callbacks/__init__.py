@@ -6,7 +6,8 @@ from .callbacks import (
     update_total_records_display,
     export_selected_rows,
     reset_filters,
-    reload_data
+    reload_data,
+    poll_jobs
 )
 
 def register_callbacks(app):
@@ -18,3 +19,4 @@ def register_callbacks(app):
     export_selected_rows(app)
     reset_filters(app)
     reload_data(app)
+    poll_jobs(app)
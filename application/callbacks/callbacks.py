@@ -1,36 +1,213 @@
-import os
+import hashlib
 import dash
 import pandas as pd
 import math
 from dash import Output, Input, State, ALL, dcc
 import dash_bootstrap_components as dbc
-from utils.data_loading import load_data, load_paginated_data
+from utils.data_loading import load_data, load_paginated_data, weeks_between
 import re
 from utils.helpers import create_table_row
+from utils.dataset_watcher import DATASET_WATCHER
+from callbacks.jobs import JOB_QUEUE, JOB_RUNNER
+from job_queue import ACTIVE_STATUSES
 import logging
-from initialize_db import load_and_process_data
-from utils.data_loading import load_data
 
 
-def get_cached_data(force_reload=False):
-    return load_data(force_reload=force_reload)
+# Per-user aggregation of the weekly activity rows; the profile columns come
+# from the users frame
+ACTIVITY_AGGREGATIONS = {
+    # Metrics that are already averaged - use first
+    'df3_med_aesthetic_score': 'first',
+    'df3_med_lai_score': 'first',
+    'df3_quality_score': 'first',
+    'df3_avg_visit_days_monthly': 'first',
+    # Activity metrics - sum for the filtered period
+    'total_uploads': 'sum',
+    'total_licensing_submissions': 'sum',
+    'total_accepted_licensing': 'sum',
+    'total_sales_revenue': 'sum',
+    'total_num_of_sales': 'sum',
+    'df3_photo_likes': 'sum',
+    'df3_comments': 'sum',
+    'num_of_photos_featured': 'sum',
+    'num_of_galleries_featured': 'sum',
+    'num_of_stories_featured': 'sum'
+}
 
-def reload_cached_data():
-    return get_cached_data(force_reload=True)
+def summarize_users(users, activity):
+    """
+    Aggregate weekly activity rows per user and join the users' profiles.
 
-def initialize_and_reset_data(app):
+    Only users present in both frames are returned, one row each, in user_id
+    order.
+    """
+    totals = activity.groupby('user_id').agg(ACTIVITY_AGGREGATIONS).reset_index()
+    return users.merge(totals, on='user_id', how='inner')
+
+# Users columns the filter callback needs
+FILTER_USER_COLUMNS = [
+    'df2_registration_date', 'df2_user_type', 'df2_membership', 'region',
+    'df2_exclusivity_rate', 'df2_acceptance_rate'
+]
+
+def with_user_details(dataset, df):
+    """Add the DETAIL_COLUMNS of the users in df (read for those users only), keeping df's row order."""
+    details = dataset.user_details(df['user_id'].tolist())
+    return df.merge(details, on='user_id', how='left')
+
+def date_bounds(dataset):
+    """
+    Return the full registration date and activity week ranges as
+    'YYYY-MM-DD' strings; the last week runs to its sixth day.
+    """
+    return dataset.derived('date_bounds', _date_bounds)
+
+def _date_bounds(dataset):
+    registration = dataset.users(['df2_registration_date'])['df2_registration_date']
+    weeks = dataset.activity(['activity_week'])['activity_week']
+    return (
+        registration.min().strftime('%Y-%m-%d'),
+        registration.max().strftime('%Y-%m-%d'),
+        weeks.min().strftime('%Y-%m-%d'),
+        (weeks.max() + pd.Timedelta(days=6)).strftime('%Y-%m-%d'),
+    )
+
+def covers_all_weeks(dataset, act_start, act_end):
+    """True when the activity week range keeps every stored week (or isn't set)."""
+    if not (act_start and act_end):
+        return True
+    _, _, first_week, last_day = date_bounds(dataset)
+    last_week = pd.to_datetime(last_day) - pd.Timedelta(days=6)
+    return pd.to_datetime(act_start) <= pd.to_datetime(first_week) and pd.to_datetime(act_end) >= last_week
+
+def default_view(dataset):
+    """
+    The filter callback's initial-load outputs: every user id, the dropdown
+    options and the full date ranges. Computed once per database generation.
+    """
+    return dataset.derived('default_view', _default_view)
 
-    # Define membership display name mapping
-    MEMBERSHIP_DISPLAY_NAMES = {
-        '0': 'No membership',
-        '': 'No membership',
-        '-': 'No membership',
-        'Trial - Awesome Monthly - 30 Days': 'Trial - Awesome - M',
-        'Trial - Awesome Yearly - 30 Days': 'Trial - Awesome - Y',
-        'Trial - Pro Monthly - 30 Days': 'Trial - Pro - M',
-        'Trial - Pro Yearly - 30 Days': 'Trial - Pro - Y'
+def _default_view(dataset):
+    users = dataset.users(['df2_user_type', 'df2_membership', 'region'])
+    return {
+        'user_ids': users['user_id'].tolist(),
+        'user_type_options': [{'label': ut, 'value': ut} for ut in sorted(users['df2_user_type'].dropna().unique())],
+        'region_options': [{'label': region, 'value': region} for region in users['region'].cat.categories],
+        'membership_options': [{'label': m, 'value': m} for m in users['df2_membership'].cat.categories],
+        'date_bounds': date_bounds(dataset),
     }
 
+def default_summary(dataset):
+    """Every user's activity aggregated over all weeks (the unfiltered view). Computed once per database generation."""
+    return dataset.derived('default_summary', lambda dataset: summarize_users(dataset.users(), dataset.activity()))
+
+def precompute_defaults(dataset):
+    """Precompute the default view and the unfiltered aggregate of dataset (see utils.dataset_watcher)."""
+    default_view(dataset)
+    default_summary(dataset)
+
+def warm_up_phases():
+    """
+    The startup warm-up (see utils.warmup): load the dataset, then precompute
+    the default view and the unfiltered aggregate, so the first page load
+    costs what every later one does.
+    """
+    def dataset():
+        dataset = load_data()
+        if not dataset.empty:
+            dataset.users(), dataset.activity()
+            logging.info(f"Cold start: database generation {dataset.generation} loaded from {dataset.source}")
+
+    def precompute(compute):
+        def phase():
+            dataset = load_data()
+            if not dataset.empty:
+                compute(dataset)
+        return phase
+
+    return [
+        ('dataset', dataset),
+        ('default_view', precompute(default_view)),
+        ('default_summary', precompute(default_summary)),
+    ]
+
+# Define the column mapping
+EXPORT_COLUMNS = {
+    'user_id': 'User ID',
+    'df2_username': 'Username',
+    'df2_full_name': 'Name',
+    'df2_user_type': 'User Type',
+    'df2_registration_date': 'Registration Date',
+    'df2_membership': 'Membership',
+    'df2_country': 'Country',
+    'region': 'Region',
+    'df2_profile_url': 'Profile URL',
+    'df2_social_links': 'Social Links',
+    'total_uploads': 'Uploads',
+    'total_licensing_submissions': 'Licensing Submissions',
+    'total_accepted_licensing': 'Accepted Licensing Submissions',
+    'df3_med_aesthetic_score': 'Median Aesthetic Score',
+    'df3_med_lai_score': 'Median LAI Score',
+    'df3_quality_score': 'Quality Score',
+    'df2_exclusivity_rate': 'Exclusivity Rate',
+    'df2_acceptance_rate': 'Acceptance Rate',
+    'total_num_of_sales': 'Sales',
+    'total_sales_revenue': 'Revenue',
+    'df3_photo_likes': 'Likes',
+    'df3_comments': 'Comments',
+    'df3_avg_visit_days_monthly': 'Avg Visit Days Monthly',
+    'num_of_photos_featured': 'Photos Featured',
+    'num_of_galleries_featured': 'Galleries Featured',
+    'num_of_stories_featured': 'Stories Featured'
+}
+# Column order of the export CSV: the profile, the pre-averaged metrics, then
+# the summed activity, as the export has always been laid out
+EXPORT_ORDER = [
+    'user_id', 'df2_username', 'df2_full_name', 'df2_user_type', 'df2_registration_date',
+    'df2_membership', 'df2_country', 'region', 'df2_profile_url', 'df2_social_links',
+    'df3_med_aesthetic_score', 'df3_med_lai_score', 'df3_quality_score',
+    'df2_exclusivity_rate', 'df2_acceptance_rate', 'df3_avg_visit_days_monthly',
+    'total_uploads', 'total_licensing_submissions', 'total_accepted_licensing', 'total_sales_revenue',
+    'total_num_of_sales', 'df3_photo_likes', 'df3_comments', 'num_of_photos_featured',
+    'num_of_galleries_featured', 'num_of_stories_featured'
+]
+EXPORT_FILENAME = 'user_management_exported_data.csv'
+# Exports of more users than this run as background jobs
+EXPORT_JOB_USERS = 10000
+
+JOB_LABELS = {'reload': 'Reload', 'export': 'Export'}
+
+def export_frame(dataset, user_ids):
+    """
+    Aggregate the weeks of user_ids and join their profiles, with the export's
+    column names and order. Returns None if none of them have activity.
+    """
+    activity = dataset.activity()
+    mask = activity['user_id'].isin(set(user_ids))
+    if not mask.any():
+        return None
+
+    # Aggregate the weeks, then join the profiles in export column order
+    df_selected = summarize_users(dataset.users(), activity.loc[mask])
+    df_selected = with_user_details(dataset, df_selected)[EXPORT_ORDER]
+
+    df_selected['df2_registration_date'] = pd.to_datetime(df_selected['df2_registration_date']).dt.strftime('%Y-%m-%d')
+    
+    return df_selected.rename(columns=EXPORT_COLUMNS)
+
+def job_status_text(purpose, job):
+    """One line of progress for a queued or running job, for the job status area."""
+    if job['status'] == 'queued':
+        return f"{JOB_LABELS[purpose]} queued"
+    text = f"{JOB_LABELS[purpose]}: {job['progress']:.0%}"
+    return f"{text} - {job['message']}" if job['message'] else text
+
+def parse_user_id_search(user_id_search):
+    """Parse the comma-separated user ID search box into a set of integer IDs, ignoring anything else."""
+    parts = (part.strip() for part in user_id_search.split(','))
+    return {int(part) for part in parts if part.isdigit()}
+
+def initialize_and_reset_data(app):
     @app.callback(
         [Output('filtered_user_ids', 'data'),
          Output('selected_user_ids', 'data'),
@@ -102,38 +279,23 @@ def initialize_and_reset_data(app):
         try:
             ctx = dash.callback_context
             # Load data once at the start
-            df = load_data()
-            if df.empty:
+            dataset = load_data()
+            if dataset.empty:
                 return dash.no_update
+            view = default_view(dataset)
             
             if not ctx.triggered:
-                # On initial load, set default dates
-                # Convert activity_week to datetime for proper min/max calculation
-                df['activity_week'] = pd.to_datetime(df['activity_week'])
-                
-                min_reg_date = pd.to_datetime(df['df2_registration_date'].min()).strftime('%Y-%m-%d')
-                max_reg_date = pd.to_datetime(df['df2_registration_date'].max()).strftime('%Y-%m-%d')
-                min_act_date = pd.to_datetime(df['activity_week'].min()).strftime('%Y-%m-%d')
-                max_act_date = pd.to_datetime(df['activity_week'].max() + pd.Timedelta(days=6)).strftime('%Y-%m-%d')
-                
-                user_type_options = [{'label': ut, 'value': ut} for ut in sorted(df['df2_user_type'].dropna().unique())]
-                region_options = [{'label': region, 'value': region} for region in df['region'].cat.categories]
-                membership_options = [{'label': m, 'value': m} for m in df['df2_membership'].cat.categories]
-                
-                return (df['user_id'].astype(str).tolist(), df['user_id'].astype(str).tolist(),
-                       user_type_options, region_options, membership_options,
-                       min_reg_date, max_reg_date, min_act_date, max_act_date)
+                # On initial load, everything is precomputed at warm-up
+                return (view['user_ids'], view['user_ids'],
+                       view['user_type_options'], view['region_options'], view['membership_options'],
+                       *view['date_bounds'])
             
-            trigger = ctx.triggered[0]['prop_id'].split('.')[0]
+            users = dataset.users(FILTER_USER_COLUMNS)
             
-            if df.empty:
-                raise ValueError("No data loaded")
+            trigger = ctx.triggered[0]['prop_id'].split('.')[0]
             
             # Get min/max dates from data
-            min_reg_date = pd.to_datetime(df['df2_registration_date'].min()).strftime('%Y-%m-%d')
-            max_reg_date = pd.to_datetime(df['df2_registration_date'].max()).strftime('%Y-%m-%d')
-            min_act_date = pd.to_datetime(df['activity_week'].min()).strftime('%Y-%m-%d')
-            max_act_date = (pd.to_datetime(df['activity_week'].max()) + pd.Timedelta(days=6)).strftime('%Y-%m-%d')
+            min_reg_date, max_reg_date, min_act_date, max_act_date = date_bounds(dataset)
             
             # Handle registration date range
             if trigger == 'registration-date-range':
@@ -158,49 +320,23 @@ def initialize_and_reset_data(app):
                 act_end = max_act_date
 
             # First apply date filters
-            mask = pd.Series(True, index=df.index)
+            activity = dataset.activity()
+            user_mask = pd.Series(True, index=users.index)
+            week_mask = pd.Series(True, index=activity.index)
             
             # Apply registration date filter
             if reg_start and reg_end:
-                mask &= (df['df2_registration_date'] >= pd.to_datetime(reg_start)) & (df['df2_registration_date'] <= pd.to_datetime(reg_end))
+                user_mask &= (users['df2_registration_date'] >= pd.to_datetime(reg_start)) & (users['df2_registration_date'] <= pd.to_datetime(reg_end))
             
             # Apply activity week filter first
             if act_start and act_end:
-                mask &= (df['activity_week'] >= pd.to_datetime(act_start)) & (df['activity_week'] <= pd.to_datetime(act_end))
-            
-            # Apply initial filter
-            df_filtered = df.loc[mask].copy()
-            
-            # Aggregate data first
-            df_agg = df_filtered.groupby('user_id').agg({
-                'df2_username': 'first',
-                'df2_full_name': 'first',
-                'df2_user_type': 'first',
-                'df2_registration_date': 'first',
-                'df2_membership': 'first',
-                'df2_country': 'first',
-                'region': 'first',
-                'df2_profile_url': 'first',
-                'df2_social_links': 'first',
-                # Metrics that are already averaged - use first
-                'df3_med_aesthetic_score': 'first',
-                'df3_med_lai_score': 'first',
-                'df3_quality_score': 'first',
-                'df2_exclusivity_rate': 'first',
-                'df2_acceptance_rate': 'first',
-                'df3_avg_visit_days_monthly': 'first',
-                # Activity metrics - sum for the filtered period
-                'total_uploads': 'sum',
-                'total_licensing_submissions': 'sum',
-                'total_accepted_licensing': 'sum',
-                'total_sales_revenue': 'sum',
-                'total_num_of_sales': 'sum',
-                'df3_photo_likes': 'sum',
-                'df3_comments': 'sum',
-                'num_of_photos_featured': 'sum',
-                'num_of_galleries_featured': 'sum',
-                'num_of_stories_featured': 'sum'
-            }).reset_index()
+                week_mask &= weeks_between(activity['activity_week'], act_start, act_end)
+            
+            # Aggregate data first; the unfiltered aggregate is precomputed
+            if user_mask.all() and week_mask.all():
+                df_agg = default_summary(dataset)
+            else:
+                df_agg = summarize_users(users.loc[user_mask], activity.loc[week_mask])
             
             # Now apply all filters on aggregated data
             mask = pd.Series(True, index=df_agg.index)
@@ -269,15 +405,10 @@ def initialize_and_reset_data(app):
                 mask &= df_agg['num_of_stories_featured'] <= stories_featured_max
             
             # Get filtered user IDs from the final masked data
-            filtered_user_ids = df_agg.loc[mask, 'user_id'].astype(str).tolist()
-            
-            # Get dropdown options from original data
-            df_original = load_data()
-            user_type_options = [{'label': ut, 'value': ut} for ut in sorted(df_original['df2_user_type'].dropna().unique())]
-            region_options = [{'label': region, 'value': region} for region in df['region'].cat.categories]
-            membership_options = [{'label': m, 'value': m} for m in df['df2_membership'].cat.categories]
+            filtered_user_ids = df_agg.loc[mask, 'user_id'].tolist()
             
-            return (filtered_user_ids, filtered_user_ids, user_type_options, region_options, membership_options,
+            return (filtered_user_ids, filtered_user_ids,
+                   view['user_type_options'], view['region_options'], view['membership_options'],
                    reg_start, reg_end, act_start, act_end)
             
         except Exception as e:
@@ -431,7 +562,7 @@ def update_table(app):
             
             # Handle user ID search
             if triggered_id == 'user-id-search' and user_id_search:
-                search_ids = [id.strip() for id in user_id_search.split(',')]
+                search_ids = parse_user_id_search(user_id_search)
                 filtered_user_ids = [id for id in filtered_user_ids if id in search_ids]
                 page_number = 1
             
@@ -450,54 +581,32 @@ def update_table(app):
             if not filtered_user_ids:
                 return [no_results_row], "Page 1 of 1", 1, 0
             
-            # Use cached data
-            df = load_data()
-            if df is None or df.empty:
+            # The in-process dataset; no copy is made
+            dataset = load_data()
+            if dataset.empty:
                 return [no_results_row], "Page 1 of 1", 1, 0
             
-            # Filter for the current filtered_user_ids
-            df = df.loc[df['user_id'].astype(str).isin(filtered_user_ids)].copy()
-            
-            # Apply activity week filter
-            if act_start and act_end:
-                df = df.loc[(df['activity_week'] >= pd.to_datetime(act_start)) & 
-                   (df['activity_week'] <= pd.to_datetime(act_end))]
+            if (len(filtered_user_ids) == len(default_view(dataset)['user_ids'])
+                    and covers_all_weeks(dataset, act_start, act_end)):
+                # Every user over every week: precomputed at warm-up
+                df = default_summary(dataset)
+            else:
+                activity = dataset.activity()
+                
+                # Filter for the current filtered_user_ids
+                activity = activity.loc[activity['user_id'].isin(filtered_user_ids)]
+                
+                # Apply activity week filter
+                if act_start and act_end:
+                    activity = activity.loc[weeks_between(activity['activity_week'], act_start, act_end)]
+                
+                # Aggregate the filtered data
+                df = summarize_users(dataset.users(), activity)
             
             # Handle empty dataframe
             if df.empty:
                 return [no_results_row], "Page 1 of 1", 1, 0
             
-            # Aggregate the filtered data
-            df = df.groupby('user_id').agg({
-                'df2_username': 'first',
-                'df2_full_name': 'first',
-                'df2_user_type': 'first',
-                'df2_registration_date': 'first',
-                'df2_membership': 'first',
-                'df2_country': 'first',
-                'region': 'first',
-                'df2_profile_url': 'first',
-                'df2_social_links': 'first',
-                # Use first for pre-averaged metrics
-                'df3_med_aesthetic_score': 'first',
-                'df3_med_lai_score': 'first',
-                'df3_quality_score': 'first',
-                'df2_exclusivity_rate': 'first',
-                'df2_acceptance_rate': 'first',
-                'df3_avg_visit_days_monthly': 'first',
-                # Sum activity metrics for the filtered period
-                'total_uploads': 'sum',
-                'total_licensing_submissions': 'sum',
-                'total_accepted_licensing': 'sum',
-                'total_sales_revenue': 'sum',
-                'total_num_of_sales': 'sum',
-                'df3_photo_likes': 'sum',
-                'df3_comments': 'sum',
-                'num_of_photos_featured': 'sum',
-                'num_of_galleries_featured': 'sum',
-                'num_of_stories_featured': 'sum'
-            }).reset_index()
-            
             # Apply sorting if specified
             if sort_by and sort_by in df.columns:
                 ascending = order != 'desc'
@@ -519,12 +628,13 @@ def update_table(app):
             start_idx = (page_number - 1) * rows_per_page
             end_idx = min(start_idx + rows_per_page, total_records)
             
-            # Get page data using .iloc
-            df_page = df.iloc[start_idx:end_idx]
+            # Get page data using .iloc; names and links are read for these rows only
+            df_page = with_user_details(dataset, df.iloc[start_idx:end_idx])
             
             # Create table rows
+            selected_user_ids = set(selected_user_ids or [])
             table_rows = [
-                create_table_row(row, idx + start_idx + 1, is_selected=str(row['user_id']) in selected_user_ids) 
+                create_table_row(row, idx + start_idx + 1, is_selected=row['user_id'] in selected_user_ids) 
                 for idx, (_, row) in enumerate(df_page.iterrows())
             ]
             
@@ -533,7 +643,6 @@ def update_table(app):
             return table_rows, page_display, page_number, total_records
             
         except Exception as e:
-            import traceback
             print(f"Error in update_table: {str(e)}")
             no_results_row = dash.html.Tr([
                 dash.html.Td("No results found", colSpan=28, style={
@@ -600,11 +709,7 @@ def reset_filters(app):
         button_id = ctx.triggered[0]['prop_id'].split('.')[0]
 
         # Load data to get min/max dates
-        df = load_data()
-        min_reg_date = pd.to_datetime(df['df2_registration_date'].min()).strftime('%Y-%m-%d')
-        max_reg_date = pd.to_datetime(df['df2_registration_date'].max()).strftime('%Y-%m-%d')
-        min_act_date = pd.to_datetime(df['activity_week'].min()).strftime('%Y-%m-%d')
-        max_act_date = pd.to_datetime(df['activity_week'].max() + pd.Timedelta(days=6)).strftime('%Y-%m-%d')
+        min_reg_date, max_reg_date, min_act_date, max_act_date = date_bounds(load_data())
 
         if button_id == 'reset-filters-button':
             return [
@@ -642,45 +747,65 @@ def reset_filters(app):
 
 def reload_data(app):
     @app.callback(
-        [
-            Output('reload-alert', 'is_open'),
-            Output('reset-filters-button', 'n_clicks')  # Trigger initialize_and_reset_data
-        ],
+        [Output('active-jobs', 'data', allow_duplicate=True),
+         Output('job-poll-interval', 'disabled', allow_duplicate=True),
+         Output('job-status', 'children', allow_duplicate=True)],
         [Input('reload-data-button', 'n_clicks')],
+        [State('active-jobs', 'data')],
         prevent_initial_call=True
     )
-    def _reload_data(n_clicks):
-        if n_clicks is None:
-            return False, dash.no_update
+    def _reload_data(n_clicks, active_jobs):
+        if not n_clicks:
+            return dash.no_update, dash.no_update, dash.no_update
 
         try:
+            # The reload runs as a background job (see callbacks.jobs); clicks
+            # while one is queued or running join it instead of starting another
+            job_id, _ = JOB_QUEUE.submit('reload')
+            JOB_RUNNER.wake()
+            return {**(active_jobs or {}), 'reload': job_id}, False, "Reload queued"
         
-            # Reinitialize the database
-            CONFIG_PATH = './config.json'
-            CSV_PATH = './join_result.csv'
-            DB_PATH = './user_data.db'
+        except Exception as e:
+            print(f"Error reloading data: {str(e)}")
+            return dash.no_update, dash.no_update, "Reload failed to start"
 
-            if os.path.exists(CSV_PATH):
-                load_and_process_data(CSV_PATH, CONFIG_PATH, DB_PATH)
-            else:
-                return False, dash.no_update
+def poll_jobs(app):
+    @app.callback(
+        [Output('active-jobs', 'data', allow_duplicate=True),
+         Output('job-poll-interval', 'disabled', allow_duplicate=True),
+         Output('job-status', 'children', allow_duplicate=True),
+         Output('reload-alert', 'is_open'),
+         Output('reset-filters-button', 'n_clicks'),  # Trigger initialize_and_reset_data
+         Output('download-dataframe-csv', 'data', allow_duplicate=True),
+         Output('export-alert', 'is_open', allow_duplicate=True)],
+        [Input('job-poll-interval', 'n_intervals')],
+        [State('active-jobs', 'data'),
+         State('reset-filters-button', 'n_clicks')],
+        prevent_initial_call=True
+    )
+    def _poll_jobs(n_intervals, active_jobs, reset_clicks):
+        active_jobs = dict(active_jobs or {})
+        status = []
+        reloaded = reset = download = exported = dash.no_update
 
-            # Load fresh data (caching is handled in load_data)
-            df = load_data(force_reload=True)
-            
-            if df is None or df.empty:
-                raise ValueError("No data loaded")
+        for purpose, job_id in list(active_jobs.items()):
+            job = JOB_QUEUE.get(job_id)
+            if job is not None and job['status'] in ACTIVE_STATUSES:
+                status.append(job_status_text(purpose, job))
+                continue
+            del active_jobs[purpose]
+            if job is None or job['status'] == 'failed':
+                status.append(f"{JOB_LABELS[purpose]} failed: {job['error'] if job else 'job not found'}")
+            elif purpose == 'reload':
+                # Other processes' datasets pick up the new generation too
+                DATASET_WATCHER.refresh()
+                reloaded, reset = True, (reset_clicks or 0) + 1
+            elif purpose == 'export':
+                download = dcc.send_file(job['result']['path'], filename=EXPORT_FILENAME)
+                exported = True
 
-            user_ids = df['user_id'].astype(str).tolist()
-            
-            # Trigger the initialize_and_reset_data callback by incrementing n_clicks
-            new_n_clicks = n_clicks + 1 if n_clicks else 1
-            return True, new_n_clicks
-        
-        except Exception as e:
-            import traceback
-            print(f"Error reloading data: {str(e)}")
-            return False, dash.no_update
+        return (active_jobs, not active_jobs, [dash.html.Div(line) for line in status],
+                reloaded, reset, download, exported)
 
 def update_total_records_display(app):
     @app.callback(
@@ -691,132 +816,63 @@ def update_total_records_display(app):
         return f"Total Records: {total_records:,}"
 
 def export_selected_rows(app):
-    # Define the column mapping and order
-    EXPORT_COLUMNS = {
-        'user_id': 'User ID',
-        'df2_username': 'Username',
-        'df2_full_name': 'Name',
-        'df2_user_type': 'User Type',
-        'df2_registration_date': 'Registration Date',
-        'df2_membership': 'Membership',
-        'df2_country': 'Country',
-        'region': 'Region',
-        'df2_profile_url': 'Profile URL',
-        'df2_social_links': 'Social Links',
-        'total_uploads': 'Uploads',
-        'total_licensing_submissions': 'Licensing Submissions',
-        'total_accepted_licensing': 'Accepted Licensing Submissions',
-        'df3_med_aesthetic_score': 'Median Aesthetic Score',
-        'df3_med_lai_score': 'Median LAI Score',
-        'df3_quality_score': 'Quality Score',
-        'df2_exclusivity_rate': 'Exclusivity Rate',
-        'df2_acceptance_rate': 'Acceptance Rate',
-        'total_num_of_sales': 'Sales',
-        'total_sales_revenue': 'Revenue',
-        'df3_photo_likes': 'Likes',
-        'df3_comments': 'Comments',
-        'df3_avg_visit_days_monthly': 'Avg Visit Days Monthly',
-        'num_of_photos_featured': 'Photos Featured',
-        'num_of_galleries_featured': 'Galleries Featured',
-        'num_of_stories_featured': 'Stories Featured'
-    }
-
     @app.callback(
         [Output('download-dataframe-csv', 'data'),
-         Output("export-alert", "is_open", allow_duplicate=True)],
+         Output("export-alert", "is_open", allow_duplicate=True),
+         Output('active-jobs', 'data', allow_duplicate=True),
+         Output('job-poll-interval', 'disabled', allow_duplicate=True),
+         Output('job-status', 'children', allow_duplicate=True)],
         [Input('export-button', 'n_clicks')],
         [State('selected_user_ids', 'data'),
          State('filtered_user_ids', 'data'),
-         State('user-id-search', 'value')],
+         State('user-id-search', 'value'),
+         State('active-jobs', 'data')],
         prevent_initial_call=True
     )
-    def _export_selected_rows(n_clicks, selected_user_ids, filtered_user_ids, user_id_search):
+    def _export_selected_rows(n_clicks, selected_user_ids, filtered_user_ids, user_id_search, active_jobs):
+        no_export = (None, False, dash.no_update, dash.no_update, dash.no_update)
         if not n_clicks or not selected_user_ids or not filtered_user_ids:
-            return None, False
+            return no_export
         
         try:
-            # Load the full dataset
-            df = load_data()
-            
-            # Convert IDs to strings and prepare export list
-            df['user_id'] = df['user_id'].astype(str)
-            
             # Ensure we're only using the filtered user IDs
-             # Convert IDs to strings
-            df['user_id'] = df['user_id'].astype(str)
-            filtered_user_ids = set(str(id) for id in filtered_user_ids)
-            selected_user_ids = set(str(id) for id in selected_user_ids)
-            
+            filtered_user_ids = set(filtered_user_ids)
+            selected_user_ids = set(selected_user_ids)
 
              # Apply user ID search filter if present
             if user_id_search:
-                search_ids = set(id.strip() for id in user_id_search.split(','))
-                filtered_user_ids = filtered_user_ids.intersection(search_ids)
+                filtered_user_ids = filtered_user_ids.intersection(parse_user_id_search(user_id_search))
             
             # Get intersection of selected and filtered IDs
-            export_user_ids = selected_user_ids.intersection(filtered_user_ids)
+            export_user_ids = sorted(selected_user_ids.intersection(filtered_user_ids))
             
             if not export_user_ids:
-                return None, False
-            
-            # Filter the dataframe
-            mask = df['user_id'].isin(export_user_ids)
-            df_selected = df.loc[mask].copy()
-            
-            if df_selected.empty:
-                return None, False
-
-            # Pre-select only needed columns before aggregation
-            needed_columns = ['user_id'] + [col for col in EXPORT_COLUMNS.keys() if col != 'user_id']
-            df_selected = df_selected[needed_columns]
-            
-            # Perform aggregation
-            agg_dict = {
-                'df2_username': 'first',
-                'df2_full_name': 'first',
-                'df2_user_type': 'first',
-                'df2_registration_date': 'first',
-                'df2_membership': 'first',
-                'df2_country': 'first',
-                'region': 'first',
-                'df2_profile_url': 'first',
-                'df2_social_links': 'first',
-                # Use first for pre-averaged metrics
-                'df3_med_aesthetic_score': 'first',
-                'df3_med_lai_score': 'first',
-                'df3_quality_score': 'first',
-                'df2_exclusivity_rate': 'first',
-                'df2_acceptance_rate': 'first',
-                'df3_avg_visit_days_monthly': 'first',
-                # Sum activity metrics for the filtered period
-                'total_uploads': 'sum',
-                'total_licensing_submissions': 'sum',
-                'total_accepted_licensing': 'sum',
-                'total_sales_revenue': 'sum',
-                'total_num_of_sales': 'sum',
-                'df3_photo_likes': 'sum',
-                'df3_comments': 'sum',
-                'num_of_photos_featured': 'sum',
-                'num_of_galleries_featured': 'sum',
-                'num_of_stories_featured': 'sum'
-            }
-            
-            df_selected = df_selected.groupby('user_id', as_index=False).agg(agg_dict)
-
-            df_selected['df2_registration_date'] = pd.to_datetime(df_selected['df2_registration_date']).dt.strftime('%Y-%m-%d')
-            
-            df_export = df_selected.rename(columns=EXPORT_COLUMNS)
+                return no_export
+
+            # Large exports are written by a background job and downloaded
+            # when it is done (see poll_jobs); the same export requested
+            # again while it runs joins that job
+            if len(export_user_ids) > EXPORT_JOB_USERS:
+                dedupe_key = hashlib.sha1(','.join(map(str, export_user_ids)).encode()).hexdigest()
+                job_id, _ = JOB_QUEUE.submit('export', dedupe_key, {'user_ids': export_user_ids})
+                JOB_RUNNER.wake()
+                return (None, False, {**(active_jobs or {}), 'export': job_id}, False,
+                        f"Export of {len(export_user_ids):,} users queued")
+
+            df_export = export_frame(load_data(), export_user_ids)
+            if df_export is None:
+                return no_export
 
             return dcc.send_data_frame(
                 df_export.to_csv,
-                filename='user_management_exported_data.csv',
+                filename=EXPORT_FILENAME,
                 index=False,
                 encoding='utf-8-sig'
-            ), True
+            ), True, dash.no_update, dash.no_update, dash.no_update
             
         except Exception as e:
             print(f"Error in export: {str(e)}")
-            return None, False
+            return no_export
 
 def safe_numeric_value(value, default=None):
     """Helper function to safely extract numeric values from inputs"""
@@ -0,0 +1,104 @@
+import os
+import time
+
+from db_swap import rebuild_lock
+from initialize_db import load_and_process_data, get_ingest_mode, get_merged_output_path
+from job_queue import ACTIVE_STATUSES, JobQueue, JobRunner
+from update_user_data import run_update_user_data
+from utils.data_loading import DB_PATH, load_data
+from utils.dataset_watcher import DATASET_WATCHER
+
+CONFIG_PATH = './config.json'
+# Large exports are written here by a job, then downloaded
+EXPORTS_DIR = './exports'
+# Export files older than this are deleted when the next export is written
+KEEP_EXPORTS_SECONDS = 24 * 3600
+
+# The dashboard's job queue, shared with the scheduler (which runs the
+# 'ingest' jobs) and between the dashboard's worker processes
+JOB_QUEUE = JobQueue()
+
+def run_reload(job, progress):
+    """
+    Refresh the database and swap the new generation into this process's
+    dataset.
+
+    In full ingest mode the merged output is reloaded into the database. In
+    incremental mode each delta goes straight into the database, so the
+    merged output can be older than the data already loaded; the refresh is
+    an 'ingest' job instead, the same one the scheduler queues (see
+    _run_ingest). Waits for any other rebuild, scheduled or from another
+    reload, to finish first (see db_swap.rebuild_lock).
+    """
+    if get_ingest_mode(CONFIG_PATH) == 'incremental':
+        _run_ingest(progress)
+    else:
+        csv_path = get_merged_output_path(CONFIG_PATH)
+        with rebuild_lock(DB_PATH, on_wait=lambda: progress(0, "Waiting for the running data refresh")):
+            if not os.path.exists(csv_path):
+                raise FileNotFoundError(f"No merged data at {csv_path}")
+            progress(0.1, "Loading the merged data into the database")
+            if not load_and_process_data(csv_path, CONFIG_PATH, DB_PATH):
+                raise RuntimeError("Loading the merged data failed")
+    progress(0.8, "Loading the new data")
+    DATASET_WATCHER.check()
+    if load_data().empty:
+        raise ValueError("No data loaded")
+    return {'generation': load_data().generation}
+
+def _run_ingest(progress, poll_interval=2):
+    """
+    Queue an 'ingest' job, or join the one already queued or running, and
+    return once it is done.
+
+    A queued job is claimed and run here, so a reload doesn't wait for the
+    scheduler's next poll (or for a scheduler at all); one the scheduler is
+    already running is waited for. update_user_data takes the rebuild lock
+    itself.
+    """
+    job_id, _ = JOB_QUEUE.submit('ingest')
+    runner = JobRunner(JOB_QUEUE, {'ingest': run_update_user_data})
+    while True:
+        ingest = JOB_QUEUE.get(job_id)
+        if ingest['status'] not in ACTIVE_STATUSES:
+            break
+        progress(0.1, ingest['message'] or "Refreshing the data from Redash")
+        if not runner.run_next():
+            time.sleep(poll_interval)
+            # Requeues the job if the process running it died, so it's run here
+            JOB_QUEUE.recover()
+    if ingest['status'] == 'failed':
+        raise RuntimeError(f"Refreshing the data failed: {ingest['error']}")
+
+def run_export(job, progress):
+    """Write the export of job's user_ids to a CSV in EXPORTS_DIR; returns its path and row count."""
+    from callbacks.callbacks import export_frame
+
+    user_ids = job['params']['user_ids']
+    progress(0.1, f"Aggregating {len(user_ids):,} users")
+    df_export = export_frame(load_data(), user_ids)
+    if df_export is None:
+        raise ValueError("None of the selected users have activity")
+
+    os.makedirs(EXPORTS_DIR, exist_ok=True)
+    _remove_old_exports()
+    progress(0.7, f"Writing {len(df_export):,} rows")
+    path = os.path.abspath(os.path.join(EXPORTS_DIR, f"export-{job['id']}.csv"))
+    tmp_path = f"{path}.tmp"
+    df_export.to_csv(tmp_path, index=False, encoding='utf-8-sig')
+    os.replace(tmp_path, path)
+    return {'path': path, 'rows': len(df_export)}
+
+def _remove_old_exports():
+    cutoff = time.time() - KEEP_EXPORTS_SECONDS
+    for name in os.listdir(EXPORTS_DIR):
+        path = os.path.join(EXPORTS_DIR, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except OSError:
+            pass
+
+# Runs the dashboard's jobs in the background; started by app.py, and in
+# each gunicorn worker (see gunicorn.conf.py)
+JOB_RUNNER = JobRunner(JOB_QUEUE, {'reload': run_reload, 'export': run_export})
@@ -0,0 +1,289 @@
+import fcntl
+import json
+import os
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime
+
+
+def generation_marker_path(db_path):
+    return f"{db_path}.generation"
+
+
+def read_generation(db_path):
+    """
+    Return the generation number of the database at db_path, 0 if it has none.
+
+    The marker file next to the database is checked first, so watchers can
+    poll it without opening the database.
+    """
+    generation = _marker_generation(db_path)
+    if generation is not None:
+        return generation
+    return _stored_generation(db_path)
+
+
+def _marker_generation(db_path):
+    try:
+        with open(generation_marker_path(db_path), 'r') as f:
+            return int(json.load(f)['generation'])
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def _stored_generation(db_path):
+    """Return the generation stamped in the database itself (PRAGMA user_version), 0 if it has none."""
+    if not os.path.exists(db_path):
+        return 0
+    try:
+        conn = sqlite3.connect(db_path)
+        try:
+            return conn.execute("PRAGMA user_version").fetchone()[0]
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        return 0
+
+
+def _next_generation(db_path, stored_generation):
+    """
+    Return the generation after the live one.
+
+    The marker is written after the database is swapped or committed, so a
+    crash in between leaves it one behind the live database's user_version;
+    taking the larger of the two never reuses a generation that was already
+    made live.
+    """
+    return max(_marker_generation(db_path) or 0, stored_generation) + 1
+
+
+@contextmanager
+def rebuild_lock(db_path, on_wait=None):
+    """
+    Hold the lock that lets one rebuild of db_path run at a time, across
+    processes: a scheduled refresh, a reload from the dashboard or a manual
+    run. It covers the whole rebuild (fetching and merging as well as the
+    load), unlike DatabaseSwap's lock, which only covers staging and the
+    swap. If another rebuild holds it, on_wait() is called, then this waits.
+    """
+    directory = os.path.dirname(os.path.abspath(db_path))
+    os.makedirs(directory, exist_ok=True)
+    with open(f"{db_path}.rebuild.lock", 'w') as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            if on_wait is not None:
+                on_wait()
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def validate_database(db_path, expected_columns=None, expected_rows=None):
+    """
+    Check a staged database before it replaces the live one.
+
+    Raises ValueError if it fails SQLite's quick_check, lacks user_data (a
+    table or view) or any of expected_columns in it, or holds a different
+    number of rows than expected_rows. Returns the number of user_data rows.
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        check = conn.execute("PRAGMA quick_check").fetchone()[0]
+        if check != 'ok':
+            raise ValueError(f"Staged database failed its integrity check: {check}")
+        _check_columns(conn, expected_columns)
+        rows = conn.execute("SELECT COUNT(*) FROM user_data").fetchone()[0]
+        if expected_rows is not None and rows != expected_rows:
+            raise ValueError(f"Staged user_data has {rows:,} rows, expected {expected_rows:,}")
+        return rows
+    finally:
+        conn.close()
+
+
+def _check_columns(conn, expected_columns):
+    stored_columns = {row[1] for row in conn.execute("PRAGMA table_info(user_data)")}
+    if not stored_columns:
+        raise ValueError("Database has no user_data table or view")
+    missing = set(expected_columns if expected_columns is not None else []) - stored_columns
+    if missing:
+        raise ValueError(f"user_data lacks columns: {sorted(missing)}")
+
+
+def _lock_builders(db_path):
+    """Open and exclusively lock db_path's builder lock file; closing the returned file releases it."""
+    directory = os.path.dirname(os.path.abspath(db_path))
+    os.makedirs(directory, exist_ok=True)
+    lock_file = open(f"{db_path}.lock", 'w')
+    fcntl.flock(lock_file, fcntl.LOCK_EX)
+    return lock_file
+
+
+def _write_marker(db_path, generation, **details):
+    marker_path = generation_marker_path(db_path)
+    tmp_path = f"{marker_path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump({'generation': generation, **details}, f)
+    os.replace(tmp_path, marker_path)
+
+
+class DatabaseSwap:
+    """
+    Build the next generation of a SQLite database off to the side and swap it in.
+
+    Used for full rebuilds (incremental loads use DatabaseUpdate). Writes go
+    to an empty staging file next to db_path. commit() validates the staged
+    database, stamps it with the next generation number (PRAGMA user_version)
+    and renames it over db_path, which is atomic: connections opened before
+    the swap keep reading the old generation until they close, new ones get
+    the new generation, and no reader ever sees a half-written table. The
+    generation marker next to the database is updated after the swap. If the
+    block exits without commit(), the staging file is discarded and the live
+    database is left untouched.
+
+    A lock file serializes builders, so the scheduler and a reload from the
+    dashboard can't stage over each other.
+
+        with DatabaseSwap(db_path) as swap:
+            conn = sqlite3.connect(swap.staging_path)
+            ...
+            conn.close()
+            swap.commit(expected_rows=len(df))
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.staging_path = f"{db_path}.staging"
+        self.generation = None
+        self._lock_file = None
+
+    def __enter__(self):
+        self._lock_file = _lock_builders(self.db_path)
+        try:
+            self._remove_staging()
+        except BaseException:
+            self._release()
+            raise
+        return self
+
+    def commit(self, expected_columns=None, expected_rows=None):
+        """Validate the staged database and atomically make it the live one. Returns its generation."""
+        rows = validate_database(self.staging_path, expected_columns, expected_rows)
+        generation = _next_generation(self.db_path, _stored_generation(self.db_path))
+
+        conn = sqlite3.connect(self.staging_path)
+        try:
+            conn.execute(f"PRAGMA user_version = {int(generation)}")
+            conn.commit()
+        finally:
+            conn.close()
+
+        self._empty_live_wal()
+        os.replace(self.staging_path, self.db_path)
+        _write_marker(self.db_path, generation, rows=rows,
+                      swapped_at=datetime.now().isoformat(timespec='seconds'))
+        self.generation = generation
+        print(f"Swapped in generation {generation} of {self.db_path} ({rows:,} rows)")
+        return generation
+
+    def _empty_live_wal(self):
+        """
+        Checkpoint the live database's write-ahead log (left by DatabaseUpdate)
+        into it and truncate the log, so no frames of the old file are left
+        next to the new one.
+        """
+        if not os.path.exists(f"{self.db_path}-wal"):
+            return
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            busy, _, _ = conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+        finally:
+            conn.close()
+        if busy:
+            raise ValueError(f"Could not checkpoint the write-ahead log of {self.db_path}; readers kept it busy")
+
+    def _remove_staging(self):
+        for path in (self.staging_path, f"{self.staging_path}-journal"):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _release(self):
+        if self._lock_file is not None:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+            self._lock_file.close()
+            self._lock_file = None
+
+    def __exit__(self, *exc_info):
+        try:
+            if self.generation is None:
+                self._remove_staging()
+        finally:
+            self._release()
+
+
+class DatabaseUpdate:
+    """
+    Apply a small change to the live database in place as its next generation.
+
+    For incremental loads, where staging a copy of the whole database would
+    cost I/O that grows with the history. The database is switched to WAL
+    mode and the change runs in one write transaction on self.conn; commit()
+    checks the user_data columns, stamps the next generation number (PRAGMA
+    user_version) in that same transaction and commits it. Readers keep
+    seeing the previous generation until the commit and the new one from the
+    next read on, never a half-applied change. The generation marker is
+    updated right after the commit. If the block exits without commit(), the
+    transaction is rolled back.
+
+    Shares DatabaseSwap's lock file, so an update and a rebuild never overlap.
+
+        with DatabaseUpdate(db_path) as update:
+            update.conn.execute(...)
+            update.commit(expected_columns=list(df.columns))
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.conn = None
+        self.generation = None
+        self._lock_file = None
+
+    def __enter__(self):
+        self._lock_file = _lock_builders(self.db_path)
+        try:
+            self.conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            self.conn.execute("PRAGMA journal_mode = WAL")
+            self.conn.execute("BEGIN IMMEDIATE")
+        except BaseException:
+            self._release()
+            raise
+        return self
+
+    def commit(self, expected_columns=None, **details):
+        """Stamp the next generation and commit the change. Returns the generation."""
+        _check_columns(self.conn, expected_columns)
+        stored_generation = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        generation = _next_generation(self.db_path, stored_generation)
+        self.conn.execute(f"PRAGMA user_version = {int(generation)}")
+        self.conn.execute("COMMIT")
+        _write_marker(self.db_path, generation, **details,
+                      updated_at=datetime.now().isoformat(timespec='seconds'))
+        self.generation = generation
+        print(f"Committed generation {generation} of {self.db_path} in place")
+        return generation
+
+    def _release(self):
+        if self.conn is not None:
+            if self.conn.in_transaction:
+                self.conn.execute("ROLLBACK")
+            self.conn.close()
+            self.conn = None
+        if self._lock_file is not None:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+            self._lock_file.close()
+            self._lock_file = None
+
+    def __exit__(self, *exc_info):
+        self._release()
@@ -0,0 +1,79 @@
+"""
+Production serving settings for the dashboard:
+
+    gunicorn --config gunicorn.conf.py app:server
+
+Several worker processes, each with a few threads, so one heavy filter or
+export doesn't hold up everyone else. The app is loaded and warmed up (see
+utils.warmup) once in the master process before the workers fork, so every
+worker starts with the dataset and the default view already in memory (its
+pages shared with the master) and a recycled worker is ready at once. The
+master checks for a new database generation before each fork, so recycled
+workers start on the live data rather than the startup generation.
+Workers are restarted after a number of requests, finishing the requests
+they are serving first.
+
+Every setting can be overridden from the environment (DASHBOARD_*).
+"""
+import multiprocessing
+import os
+
+bind = os.getenv('DASHBOARD_BIND', '127.0.0.1:8050')
+workers = int(os.getenv('DASHBOARD_WORKERS', multiprocessing.cpu_count()))
+threads = int(os.getenv('DASHBOARD_THREADS', 4))
+worker_class = 'gthread'
+preload_app = True
+
+# Graceful recycling: after max_requests (staggered by the jitter so workers
+# don't restart together), a worker stops accepting requests and gets
+# graceful_timeout seconds to finish the ones it has
+max_requests = int(os.getenv('DASHBOARD_MAX_REQUESTS', 1000))
+max_requests_jitter = max_requests // 10
+graceful_timeout = 30
+# Large exports can take a while
+timeout = int(os.getenv('DASHBOARD_TIMEOUT', 120))
+keepalive = 5
+
+accesslog = '-'
+
+
+def when_ready(server):
+    """Warm up in the master (load the dataset, precompute the default view) before any worker forks."""
+    from callbacks.callbacks import precompute_defaults, warm_up_phases
+    from utils.dataset_watcher import DATASET_WATCHER
+    from utils.warmup import WARM_UP
+
+    if WARM_UP.run(warm_up_phases()):
+        server.log.info(f"Warmed up: {WARM_UP.status()['phases']}")
+    DATASET_WATCHER.prepare = precompute_defaults
+
+
+def pre_fork(server, worker):
+    """
+    Bring the master's dataset up to the live generation before a worker
+    forks from it. The master runs no watcher thread (threads and fork don't
+    mix), so this is where it catches up; swapping also releases its mapping
+    of the old generation's snapshot. Only a marker file is read when
+    nothing changed.
+    """
+    from utils.dataset_watcher import DATASET_WATCHER
+
+    try:
+        DATASET_WATCHER.check()
+    except Exception as e:
+        server.log.error(f"Generation check before fork failed: {e}")
+
+
+def post_fork(server, worker):
+    """
+    Catch up with a generation swapped in since the fork, then start each
+    worker's background threads, which don't survive the fork: the watcher
+    for new database generations and the job runner.
+    """
+    from callbacks.callbacks import precompute_defaults
+    from callbacks.jobs import JOB_RUNNER
+    from utils.dataset_watcher import DATASET_WATCHER
+
+    DATASET_WATCHER.check()
+    DATASET_WATCHER.start(prepare=precompute_defaults)
+    JOB_RUNNER.start()
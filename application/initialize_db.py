@@ -1,26 +1,145 @@
 import pandas as pd
+import pyarrow.parquet as pq
 import sqlite3
 import json
 import os
+from parse_utils import read_csv, numeric_column_types
+from pipeline_metrics import stage
+from db_swap import DatabaseSwap, DatabaseUpdate
+from sqlite_loader import bulk_insert, bulk_load, create_table, table_schema
+from merge_utils import with_integer_user_ids
 
-def create_region_column(df, region_mappings):
-    """Create a region column based on country mappings."""
-    def get_region(country):
-        if not isinstance(country, str):
-            return 'Unknown'
-        for region, countries in region_mappings.items():
-            if country in countries:
-                return region
-        return 'Unknown'
-    
-    df['region'] = df['df2_country'].apply(get_region)
-    return df
+def country_regions(region_mappings):
+    """
+    Return a country -> region lookup.
 
-def load_and_process_data(csv_path, config_path, db_path='user_data.db'):
-    # Load configuration
-    with open(config_path, 'r') as config_file:
-        config = json.load(config_file)
-    
+    region_mappings.json maps each country to its region; a mapping of regions
+    to lists of countries is accepted too.
+    """
+    lookup = {}
+    for key, value in region_mappings.items():
+        if isinstance(value, list):
+            lookup.update({country: key for country in value})
+        else:
+            lookup[key] = value
+    return lookup
+
+def normalize_countries(countries, country_mappings, region_mappings):
+    """
+    Clean country names and derive their regions.
+
+    There are only a few hundred distinct country strings, so the column is
+    factorized and only its distinct values are cleaned and mapped; the codes
+    are then broadcast back. Returns (country, region) as categoricals aligned
+    with countries. Countries without a region get 'Other'.
+    """
+    codes, raw = pd.factorize(countries.fillna('Unknown').astype(str))
+
+    # Clean country names: first part before a comma, title case, then English names
+    cleaned = pd.Series(raw, dtype=object).str.strip().str.split(',').str[0].str.title()
+    if country_mappings:
+        cleaned = cleaned.map(lambda x: country_mappings.get(x, x))
+
+    # Cleaning can merge raw spellings, so factorize the cleaned names again
+    country_codes, country_names = pd.factorize(cleaned)
+    country = pd.Categorical.from_codes(country_codes[codes], categories=country_names)
+
+    region_names = pd.Series(country_names, dtype=object).map(country_regions(region_mappings)).fillna('Other')
+    region_codes, regions = pd.factorize(region_names)
+    region = pd.Categorical.from_codes(region_codes[country_codes[codes]], categories=regions)
+    return country, region
+
+# Columns that describe the user rather than a single week; query_2 supplies the df2_ ones
+PROFILE_COLUMNS = [
+    'df2_full_name', 'df2_username', 'df2_user_type', 'df2_registration_date',
+    'df2_membership', 'df2_country', 'df2_profile_url', 'df2_social_links',
+    'df2_exclusivity_rate', 'df2_acceptance_rate', 'region'
+]
+
+# Ensure consistent data types for numeric columns
+NUMERIC_COLUMNS = [
+    'total_uploads', 'total_licensing_submissions', 'total_accepted_licensing', 'total_num_of_sales',
+    'total_sales_revenue', 'df3_photo_likes', 'df3_comments',
+    'df3_med_aesthetic_score', 'df3_med_lai_score', 'df3_quality_score',
+    'df2_exclusivity_rate', 'df2_acceptance_rate',
+    'df3_avg_visit_days_monthly', 'num_of_photos_featured',
+    'num_of_galleries_featured', 'num_of_stories_featured'
+]
+
+# Normalized schema: one users row per user with the profile columns, and one
+# weekly_activity row per (user, week) with everything else, stored clustered
+# on that key. The user_data view joins them back into the wide weekly rows.
+USERS_TABLE = 'users'
+ACTIVITY_TABLE = 'weekly_activity'
+PRIMARY_KEYS = {USERS_TABLE: ['user_id'], ACTIVITY_TABLE: ['user_id', 'activity_week']}
+
+# user_id is covered by the primary keys
+INDEX_COLUMNS = {
+    USERS_TABLE: ['df2_user_type', 'region', 'df2_registration_date'],
+    ACTIVITY_TABLE: ['activity_week'],
+}
+
+# Membership names as the dashboard shows them
+MEMBERSHIP_DISPLAY_NAMES = {
+    '0': 'No membership',
+    '': 'No membership',
+    '-': 'No membership',
+    'Trial - Awesome Monthly - 30 Days': 'Trial - Awesome - M',
+    'Trial - Awesome Yearly - 30 Days': 'Trial - Awesome - Y',
+    'Trial - Pro Monthly - 30 Days': 'Trial - Pro - M',
+    'Trial - Pro Yearly - 30 Days': 'Trial - Pro - Y'
+}
+
+MEMBERSHIP_ORDER = [
+    'No membership',
+    'Awesome - Monthly',
+    'Awesome - Yearly',
+    'Pro - Monthly',
+    'Pro - Yearly',
+    'Android - Monthly',
+    'Android - Yearly',
+    'iOS - Monthly',
+    'iOS - Yearly',
+    'Free Pro CX',
+    'Free Awesome CX',
+    'Trial - Awesome - M',
+    'Trial - Awesome - Y',
+    'Trial - Pro - M',
+    'Trial - Pro - Y'
+]
+
+REGION_ORDER = [
+    'North America',
+    'South America',
+    'Northern Europe',
+    'Southern Europe',
+    'Western Europe',
+    'Eastern Europe',
+    'Africa',
+    'Asia Pacific (excl. China & Indonesia)',
+    'China',
+    'Indonesia',
+    'Rest of Asia',
+    'Other'
+]
+
+# Categorical users columns. Ordered ones keep these categories (other values
+# load as missing); None lists the stored values in sorted order.
+CATEGORY_ORDERS = {
+    'df2_membership': MEMBERSHIP_ORDER,
+    'region': REGION_ORDER,
+    'df2_user_type': None,
+    'df2_country': None,
+}
+# Holds the categories of each column in CATEGORY_ORDERS, so the dashboard
+# reads those columns straight into categoricals
+CATEGORIES_TABLE = 'column_categories'
+
+# Define the expected date format (modify as per your data)
+DATE_FORMAT = '%Y-%m-%d'  # Example: '2023-10-15'
+
+def load_mappings(config):
+    """Load the country and region mapping files named in config."""
     country_mappings_path = config.get('country_mappings_path', 'country_mappings.json')
     region_mappings_path = config.get('region_mappings_path', 'region_mappings.json')
     
@@ -39,28 +158,276 @@ def load_and_process_data(csv_path, config_path, db_path='user_data.db'):
     else:
         with open(region_mappings_path, 'r') as f:
             region_mappings = json.load(f)
-    
-    # Define the expected date format (modify as per your data)
-    DATE_FORMAT = '%Y-%m-%d'  # Example: '2023-10-15'
-    
-    # Load raw data with explicit date parsing
+
+    return country_mappings, region_mappings
+
+def display_memberships(memberships):
+    """Map membership values to their display names (MEMBERSHIP_DISPLAY_NAMES), keeping missing ones missing."""
+    return memberships.astype(str).replace(MEMBERSHIP_DISPLAY_NAMES).where(memberships.notna())
+
+def clean_profile_columns(df, country_mappings, region_mappings):
+    """
+    Normalize country names, derive the region column (see
+    normalize_countries) and give memberships their display names.
+    """
+    df['df2_country'], df['region'] = normalize_countries(df['df2_country'], country_mappings, region_mappings)
+    if 'df2_membership' in df.columns:
+        df['df2_membership'] = display_memberships(df['df2_membership'])
+    return df
+
+def coerce_numeric_columns(df):
+    for col in NUMERIC_COLUMNS:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors='coerce')
+        else:
+            print(f"Numeric column '{col}' not found in CSV. Skipping conversion.")
+    return df
+
+def read_merged_output(path, parser='pandas'):
+    """Read the merged output of join_csv_files, either typed Parquet or CSV (with the given parser)."""
+    if str(path).endswith('.parquet'):
+        # Weeks are stored as dates; read them as datetimes like parse_dates does
+        return pq.read_table(path).to_pandas(date_as_object=False)
+    if parser == 'pyarrow':
+        import pyarrow as pa
+        # Dates stay text here; prepare_dataframe parses them with DATE_FORMAT
+        column_types = numeric_column_types(NUMERIC_COLUMNS)
+        column_types.update({'df2_registration_date': pa.string(), 'activity_week': pa.string()})
+        return read_csv(path, parser, column_types=column_types)
+    return read_csv(
+        path,
+        parser,
+        encoding='utf-8',
+        parse_dates=['df2_registration_date', 'activity_week'],
+        dtype={'df2_registration_date': 'object', 'activity_week': 'object'}
+    )
+
+def get_max_activity_week(db_path):
+    """Return the latest activity_week in the database as 'YYYY-MM-DD', or None if there is none."""
+    if not os.path.exists(db_path):
+        return None
+    try:
+        conn = sqlite3.connect(db_path)
+        try:
+            # Databases built before the normalized schema only have the wide table
+            table = ACTIVITY_TABLE if _table_columns(conn, ACTIVITY_TABLE) else 'user_data'
+            row = conn.execute(f"SELECT MAX(activity_week) FROM {table}").fetchone()
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        print(f"Could not read latest activity week from {db_path}: {e}")
+        return None
+    if not row or not row[0]:
+        return None
+    return str(row[0])[:10]
+
+def get_merged_output_path(config_path):
+    """Return the path of the full merged output named in config, in its interchange format."""
+    from merge_utils import interchange_path
     try:
-        df = pd.read_csv(
-            csv_path,
-            encoding='utf-8',
-            parse_dates=['df2_registration_date', 'activity_week'],
-            dtype={'df2_registration_date': 'object', 'activity_week': 'object'}
+        with open(config_path, 'r') as config_file:
+            config = json.load(config_file)
+    except Exception:
+        config = {}
+    return interchange_path(
+        config.get('fixed_output_csv', './join_result.csv'),
+        config.get('interchange_format', 'parquet')
+    )
+
+def get_ingest_mode(config_path):
+    """Return the configured ingest mode, 'full' or 'incremental'."""
+    try:
+        with open(config_path, 'r') as config_file:
+            return json.load(config_file).get('ingest_mode', 'full')
+    except Exception:
+        return 'full'
+
+def profile_fingerprints(df2):
+    """
+    Hash each raw query_2 profile row so changed profiles can be found later.
+
+    Expects the column names and user_id as standardized by join_csv_files.
+    """
+    df2 = df2.sort_values('user_id').drop_duplicates('user_id', keep='last')
+    hashes = pd.util.hash_pandas_object(df2.drop(columns=['user_id']).astype(str), index=False)
+    return pd.DataFrame({
+        'user_id': df2['user_id'].astype('int64').to_numpy(),
+        # SQLite integers are signed; keep the same 64 bits
+        'fingerprint': hashes.to_numpy().view('int64'),
+    })
+
+def _read_raw_profiles(profiles_path):
+    """Read query_2 the way join_csv_files does and prefix its columns."""
+    from merge_utils import read_query_result
+    df2 = read_query_result(profiles_path)
+    df2.columns = df2.columns.str.strip().str.lower()
+    df2 = with_integer_user_ids(df2)
+    return df2.rename(columns={col: f'df2_{col}' for col in df2.columns if col != 'user_id'})
+
+def _save_profile_fingerprints(conn, fingerprints):
+    # Inserts in the caller's transaction (to_sql would commit it)
+    bulk_insert(conn, 'profile_fingerprints', fingerprints, if_exists='replace')
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_profile_fingerprints_user_id ON profile_fingerprints (user_id)")
+
+def _table_columns(conn, table):
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+
+def split_user_data(df):
+    """
+    Split merged weekly rows into the users and weekly_activity tables.
+
+    Both come back sorted by their primary key. A user's profile is the same
+    on every week, so the first row of each user is kept; a (user, week) that
+    occurs more than once keeps its last row.
+    """
+    profile_columns = [col for col in PROFILE_COLUMNS if col in df.columns]
+    users = df[['user_id'] + profile_columns].drop_duplicates('user_id').sort_values('user_id', kind='stable')
+
+    activity = df.drop(columns=profile_columns)
+    duplicated = activity.duplicated(['user_id', 'activity_week'], keep='last')
+    if duplicated.any():
+        print(f"Dropping {duplicated.sum():,} rows with a duplicate (user_id, activity_week)")
+        activity = activity[~duplicated]
+    activity = activity.sort_values(['user_id', 'activity_week'], kind='stable')
+    return users.reset_index(drop=True), activity.reset_index(drop=True)
+
+def _create_user_data_view(conn, columns):
+    """(Re)create the user_data view with the merged column order."""
+    def qualified(col):
+        table = 'u' if col in PROFILE_COLUMNS else 'w'
+        return f'{table}."{col}"'
+    conn.execute("DROP VIEW IF EXISTS user_data")
+    conn.execute(f"""
+        CREATE VIEW user_data AS
+        SELECT {', '.join(qualified(col) for col in columns)}
+        FROM {ACTIVITY_TABLE} w LEFT JOIN {USERS_TABLE} u ON u.user_id = w.user_id
+    """)
+
+def _create_indexes(conn):
+    # Create indexes for faster querying
+    cursor = conn.cursor()
+    for table, columns in INDEX_COLUMNS.items():
+        stored_columns = _table_columns(conn, table)
+        for col in columns:
+            if col in stored_columns:
+                try:
+                    cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_{col} ON {table} ({col})")
+                except sqlite3.OperationalError as e:
+                    print(f"Error creating index for '{col}': {e}")
+            else:
+                print(f"Cannot create index on '{col}' as it does not exist in the data.")
+
+def write_user_data(conn, df, loader='bulk'):
+    """
+    Write prepared merged data into the users and weekly_activity tables of a
+    new database, index them and create the user_data view over them.
+
+    loader is 'bulk' (sqlite_loader.bulk_load) or 'to_sql'. Returns the
+    number of weekly rows stored.
+    """
+    users, activity = split_user_data(df)
+    tables = {USERS_TABLE: users, ACTIVITY_TABLE: activity}
+    if loader == 'bulk':
+        bulk_load(conn, tables, primary_keys=PRIMARY_KEYS, create_indexes=_create_indexes)
+    else:
+        with stage('insert', rows_in=len(users) + len(activity)) as record:
+            for table, frame in tables.items():
+                create_table(conn, table, table_schema(frame), PRIMARY_KEYS[table])
+                frame.to_sql(table, conn, if_exists='append', index=False)
+            record.rows_out = len(users) + len(activity)
+        with stage('indexes'):
+            _create_indexes(conn)
+    _create_user_data_view(conn, df.columns)
+    _save_column_categories(conn)
+    conn.commit()
+    return len(activity)
+
+def _save_column_categories(conn):
+    """(Re)write the categories table from CATEGORY_ORDERS and the stored users."""
+    stored_columns = _table_columns(conn, USERS_TABLE)
+    rows = []
+    for col, order in CATEGORY_ORDERS.items():
+        if col not in stored_columns:
+            continue
+        categories = order if order is not None else [
+            row[0] for row in conn.execute(
+                f"SELECT DISTINCT {col} FROM {USERS_TABLE} WHERE {col} IS NOT NULL ORDER BY {col}"
+            )
+        ]
+        rows.extend((col, position, category, order is not None) for position, category in enumerate(categories))
+    conn.execute(f"DROP TABLE IF EXISTS {CATEGORIES_TABLE}")
+    conn.execute(f"""
+        CREATE TABLE {CATEGORIES_TABLE} (
+            column_name TEXT, position INTEGER, category TEXT, ordered INTEGER,
+            PRIMARY KEY (column_name, position)
         )
-    except Exception as e:
-        print(f"Error reading CSV file: {e}")
-        return
-    
-    print(f"Initial columns: {df.columns.tolist()}")
+    """)
+    conn.executemany(f"INSERT INTO {CATEGORIES_TABLE} VALUES (?, ?, ?, ?)", rows)
 
-    # Debug prints
-    print("Initial data load:")
-    print(f"Total rows: {len(df)}")
+def _backfill_earlier_weeks(conn, since, stored_columns):
+    """
+    Give earlier weeks the backward fill a full merge would have given them.
+
+    Stored weeks are only still NULL in a filled query_3 column when the user
+    had no value anywhere in the history so far; a full merge back-fills
+    those weeks from the user's first new week.
+    """
+    from merge_utils import PROFILE_COLUMNS as FILLED_COLUMNS
+    for col in FILLED_COLUMNS:
+        if not col.startswith('df3_') or col not in stored_columns:
+            continue
+        conn.execute(f"""
+            UPDATE {ACTIVITY_TABLE} SET {col} = (
+                SELECT d.{col} FROM {ACTIVITY_TABLE} d
+                WHERE d.user_id = {ACTIVITY_TABLE}.user_id AND d.activity_week >= ?
+                ORDER BY d.activity_week LIMIT 1
+            )
+            WHERE activity_week < ? AND {col} IS NULL
+              AND user_id IN (SELECT user_id FROM {ACTIVITY_TABLE} WHERE activity_week >= ? AND {col} IS NOT NULL)
+        """, (since, since, since))
+
+def _update_changed_profiles(conn, profiles_path, country_mappings, region_mappings):
+    """Rewrite the users row of every stored user whose query_2 row changed."""
+    raw = _read_raw_profiles(profiles_path)
+    current = profile_fingerprints(raw)
+
+    if _table_columns(conn, 'profile_fingerprints'):
+        previous = pd.read_sql_query("SELECT user_id, fingerprint FROM profile_fingerprints", conn)
+    else:
+        previous = pd.DataFrame(columns=['user_id', 'fingerprint'])
+    compared = current.merge(previous, on='user_id', how='left', suffixes=('', '_previous'))
+    changed_ids = compared.loc[compared['fingerprint'] != compared['fingerprint_previous'], 'user_id']
+    print(f"Profiles changed since last ingest: {len(changed_ids):,}")
+
+    if len(changed_ids):
+        profiles = raw[raw['user_id'].isin(changed_ids)].drop_duplicates('user_id', keep='last').copy()
+        profiles['user_id'] = profiles['user_id'].astype('int64')
+        profiles['df2_registration_date'] = pd.to_datetime(
+            profiles['df2_registration_date'], format=DATE_FORMAT, errors='coerce'
+        )
+        profiles = clean_profile_columns(profiles, country_mappings, region_mappings)
+        for col in ('df2_exclusivity_rate', 'df2_acceptance_rate'):
+            if col in profiles.columns:
+                profiles[col] = pd.to_numeric(profiles[col], errors='coerce')
 
+        stored_columns = _table_columns(conn, USERS_TABLE)
+        columns = [col for col in PROFILE_COLUMNS if col in profiles.columns and col in stored_columns]
+        bulk_insert(conn, 'changed_profiles', profiles[['user_id'] + columns], if_exists='replace')
+        assignments = ', '.join(
+            f"{col} = (SELECT c.{col} FROM changed_profiles c WHERE c.user_id = {USERS_TABLE}.user_id)"
+            for col in columns
+        )
+        cursor = conn.execute(f"""
+            UPDATE {USERS_TABLE} SET {assignments}
+            WHERE user_id IN (SELECT user_id FROM changed_profiles)
+        """)
+        print(f"Updated the profiles of {cursor.rowcount:,} stored users")
+        conn.execute("DROP TABLE changed_profiles")
+
+    _save_profile_fingerprints(conn, current)
+
+def prepare_dataframe(df, country_mappings, region_mappings):
+    """Parse dates, clean countries, derive region and fix column types of merged data."""
     # Convert to datetime without altering the dtype to datetime.date
     df['df2_registration_date'] = pd.to_datetime(df['df2_registration_date'], format=DATE_FORMAT, errors='coerce')
     df['activity_week'] = pd.to_datetime(df['activity_week'], format=DATE_FORMAT, errors='coerce')
@@ -68,20 +435,10 @@ def load_and_process_data(csv_path, config_path, db_path='user_data.db'):
     # Drop rows with invalid dates if needed
     df.dropna(subset=['df2_registration_date', 'activity_week'], inplace=True)
 
-    # Fill NaN in 'df2_country' with 'Unknown' and ensure all entries are strings
-    df['df2_country'] = df['df2_country'].fillna('Unknown').astype(str)
+    # Keep user ids as int64 keys (CSV input may have parsed them as text)
+    df = with_integer_user_ids(df)
 
-    # Clean country names
-    df['df2_country'] = df['df2_country'].str.strip()
-    df['df2_country'] = df['df2_country'].str.split(',').str[0]
-    df['df2_country'] = df['df2_country'].str.title()
-    
-    # Map country names to English if mappings are provided
-    if country_mappings:
-        df['df2_country'] = df['df2_country'].apply(lambda x: country_mappings.get(x, x))
-    
-    # Create region column
-    df = create_region_column(df, region_mappings)
+    df = clean_profile_columns(df, country_mappings, region_mappings)
     
     # Convert categorical columns if they exist
     if 'df2_user_type' in df.columns:
@@ -99,44 +456,124 @@ def load_and_process_data(csv_path, config_path, db_path='user_data.db'):
     else:
         print("region column not found after mapping. Skipping conversion.")
     
-    # Ensure consistent data types for numeric columns
-    numeric_columns = [
-        'total_uploads', 'total_licensing_submissions', 'total_accepted_licensing', 'total_num_of_sales',
-        'total_sales_revenue', 'df3_photo_likes', 'df3_comments',
-        'df3_med_aesthetic_score', 'df3_med_lai_score', 'df3_quality_score',
-        'df2_exclusivity_rate', 'df2_acceptance_rate',
-        'df3_avg_visit_days_monthly', 'num_of_photos_featured',
-        'num_of_galleries_featured', 'num_of_stories_featured'
-    ]
+    return coerce_numeric_columns(df)
+
+def load_and_process_data(csv_path, config_path, db_path='user_data.db', incremental=False, profiles_path=None):
+    """
+    Load merged data into the users and weekly_activity tables of db_path
+    (see write_user_data).
+
+    By default the tables are rebuilt from the full merged history. With
+    incremental=True, csv_path holds only the weeks from the database's latest
+    activity_week onwards (see join_csv_files' since_week): those weeks are
+    replaced, and if profiles_path (the query_2 result) is given, users whose
+    query_2 row changed get their profile rewritten.
+
+    Returns True on success.
+    """
+    # Load configuration
+    with open(config_path, 'r') as config_file:
+        config = json.load(config_file)
     
-    for col in numeric_columns:
-        if col in df.columns:
-            df[col] = pd.to_numeric(df[col], errors='coerce')
-        else:
-            print(f"Numeric column '{col}' not found in CSV. Skipping conversion.")
+    country_mappings, region_mappings = load_mappings(config)
     
-    # Save to SQLite and create indexes
+    # Load raw data with explicit date parsing
     try:
-        conn = sqlite3.connect(db_path)
-        df.to_sql('user_data', conn, if_exists='replace', index=False)
-        
-        # Create indexes for faster querying
-        cursor = conn.cursor()
-        index_columns = ['user_id', 'df2_user_type', 'region', 'df2_registration_date', 'activity_week']
-        for col in index_columns:
-            if col in df.columns:
-                try:
-                    cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{col} ON user_data ({col})")
-                except sqlite3.OperationalError as e:
-                    print(f"Error creating index for '{col}': {e}")
-            else:
-                print(f"Cannot create index on '{col}' as it does not exist in the data.")
-        conn.commit()
-        conn.close()
+        with stage('read') as record:
+            df = read_merged_output(csv_path, config.get('csv_parser', 'pandas'))
+            record.rows_out = len(df)
+    except Exception as e:
+        print(f"Error reading merged file: {e}")
+        return False
+    
+    print(f"Initial columns: {df.columns.tolist()}")
+
+    # Debug prints
+    print("Initial data load:")
+    print(f"Total rows: {len(df)}")
+
+    with stage('prepare', rows_in=len(df)) as record:
+        df = prepare_dataframe(df, country_mappings, region_mappings)
+        record.rows_out = len(df)
+
+    if incremental:
+        with stage('apply_incremental', rows_in=len(df)):
+            return _apply_incremental(df, db_path, profiles_path, country_mappings, region_mappings)
+    
+    # Build the new database in a staging file, then swap it in atomically
+    try:
+        with DatabaseSwap(db_path) as swap:
+            conn = sqlite3.connect(swap.staging_path)
+            try:
+                rows = write_user_data(conn, df, config.get('db_loader', 'bulk'))
+                with stage('fingerprints'):
+                    if profiles_path and os.path.exists(profiles_path):
+                        _save_profile_fingerprints(conn, profile_fingerprints(_read_raw_profiles(profiles_path)))
+                    else:
+                        # Without the matching query_2 snapshot, stale fingerprints would hide profile changes
+                        conn.execute("DROP TABLE IF EXISTS profile_fingerprints")
+                with stage('commit'):
+                    conn.commit()
+            finally:
+                conn.close()
+            with stage('swap'):
+                swap.commit(expected_columns=list(df.columns), expected_rows=rows)
         print(f"Data successfully loaded into {db_path} with indexes")
+        return True
     except Exception as e:
         print(f"Error saving to SQLite: {e}")
-        conn.close()
+        return False
+
+def _apply_incremental(df, db_path, profiles_path, country_mappings, region_mappings):
+    """
+    Replace the delta's weeks in weekly_activity, upsert the delta's users and
+    update changed profiles.
+
+    The changes are applied to the live database in one WAL transaction (see
+    db_swap.DatabaseUpdate), so readers never wait on the update or see it
+    half applied, and the work done is proportional to the delta rather than
+    to the stored history.
+    """
+    if not os.path.exists(db_path):
+        print(f"No database at {db_path} to update incrementally.")
+        return False
+
+    try:
+        with DatabaseUpdate(db_path) as update:
+            conn = update.conn
+            user_columns = _table_columns(conn, USERS_TABLE)
+            activity_columns = _table_columns(conn, ACTIVITY_TABLE)
+            # A database from before the normalized schema has neither table
+            if not activity_columns or set(user_columns) | set(activity_columns) != set(df.columns):
+                print("Merged columns differ from the stored tables; a full rebuild is required.")
+                return False
+
+            deleted = inserted = 0
+            if not df.empty:
+                users, activity = split_user_data(df)
+                since = activity['activity_week'].min()
+                deleted = conn.execute(
+                    f"DELETE FROM {ACTIVITY_TABLE} WHERE activity_week >= ?", (str(since),)
+                ).rowcount
+                inserted = bulk_insert(conn, ACTIVITY_TABLE, activity[activity_columns], if_exists='append')
+                bulk_insert(conn, USERS_TABLE, users[user_columns], if_exists='append', on_conflict='REPLACE')
+                print(f"Replaced weeks from {since:%Y-%m-%d}: removed {deleted:,} rows, "
+                      f"inserted {inserted:,} rows for {len(users):,} users")
+                _backfill_earlier_weeks(conn, str(since), activity_columns)
+            else:
+                print("No new weeks to load.")
+
+            if profiles_path and os.path.exists(profiles_path):
+                _update_changed_profiles(conn, profiles_path, country_mappings, region_mappings)
+            _save_column_categories(conn)
+            with stage('commit'):
+                update.commit(expected_columns=list(df.columns), rows_deleted=deleted, rows_inserted=inserted)
+
+        print(f"Data successfully updated in {db_path}")
+        return True
+    except Exception as e:
+        print(f"Error updating SQLite incrementally: {e}")
+        return False
 
 def create_empty_dataframe():
     """Create an empty DataFrame with the expected schema."""
@@ -155,11 +592,11 @@ def create_empty_dataframe():
 
 if __name__ == '__main__':
     CONFIG_PATH = './config.json'      # Update with your config path if different
-    CSV_PATH = './join_result.csv'     # Update with your CSV path
+    CSV_PATH = get_merged_output_path(CONFIG_PATH)  # fixed_output_csv in config.json
     DB_PATH = './user_data.db'         # SQLite database file
     
-    # Ensure the CSV path exists
+    # Ensure the merged output exists
     if not os.path.exists(CSV_PATH):
-        print(f"CSV file not found at {CSV_PATH}. Please check the path in config.json.")
+        print(f"Merged data file not found at {CSV_PATH}. Please check the path in config.json.")
     else:
         load_and_process_data(CSV_PATH, CONFIG_PATH, DB_PATH)
@@ -0,0 +1,267 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import traceback
+from datetime import datetime, timedelta
+
+# Shared by the dashboard and the scheduler, next to user_data.db
+JOBS_DB_PATH = './jobs.db'
+
+# Finished jobs are kept this long for their status and results
+KEEP_FINISHED = timedelta(days=7)
+# A job interrupted this many times (its process died) is failed instead of rerun
+MAX_ATTEMPTS = 3
+
+ACTIVE_STATUSES = ('queued', 'running')
+
+_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS jobs (
+        id INTEGER PRIMARY KEY,
+        kind TEXT NOT NULL,
+        dedupe_key TEXT NOT NULL,
+        params TEXT,
+        status TEXT NOT NULL DEFAULT 'queued',
+        progress REAL NOT NULL DEFAULT 0,
+        message TEXT,
+        result TEXT,
+        error TEXT,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        pid INTEGER,
+        created_at TEXT NOT NULL,
+        started_at TEXT,
+        finished_at TEXT
+    )
+    """,
+    # At most one queued or running job per (kind, dedupe_key): submitting it
+    # again returns the job already there
+    """
+    CREATE UNIQUE INDEX IF NOT EXISTS jobs_active
+    ON jobs (kind, dedupe_key) WHERE status IN ('queued', 'running')
+    """,
+    "CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, id)",
+]
+
+
+def _now():
+    return datetime.now().isoformat(timespec='seconds')
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class JobQueue:
+    """
+    A local, disk-backed queue of background jobs, in a small SQLite database.
+
+    Any process can submit jobs and poll them; runners (see JobRunner) in
+    any process claim them, so the dashboard's workers and the scheduler
+    share one queue. Jobs are deduplicated: while a job of the same kind and
+    dedupe_key is queued or running, submitting it again returns that job.
+    """
+
+    def __init__(self, path=JOBS_DB_PATH):
+        self.path = path
+        self._initialized = False
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        if not self._initialized:
+            conn.execute("PRAGMA journal_mode = WAL")
+            for statement in _SCHEMA:
+                conn.execute(statement)
+            self._initialized = True
+        return conn
+
+    def submit(self, kind, dedupe_key='', params=None):
+        """Queue a job unless an identical one is active. Returns (job id, True if newly queued)."""
+        conn = self._connect()
+        try:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO jobs (kind, dedupe_key, params, created_at) VALUES (?, ?, ?, ?)",
+                (kind, dedupe_key, json.dumps(params or {}), _now()),
+            )
+            if cursor.rowcount:
+                return cursor.lastrowid, True
+            row = conn.execute(
+                "SELECT id FROM jobs WHERE kind = ? AND dedupe_key = ? AND status IN ('queued', 'running')",
+                (kind, dedupe_key),
+            ).fetchone()
+            if row is None:
+                # The active job finished in between; queue a new one
+                return self.submit(kind, dedupe_key, params)
+            return row['id'], False
+        finally:
+            conn.close()
+
+    def get(self, job_id):
+        """Return the job as a dict (params and result decoded), or None."""
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        finally:
+            conn.close()
+        return self._as_dict(row) if row is not None else None
+
+    def claim(self, kinds):
+        """Mark the oldest queued job of one of kinds as running in this process and return it, or None."""
+        placeholders = ','.join('?' * len(kinds))
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    f"SELECT * FROM jobs WHERE status = 'queued' AND kind IN ({placeholders}) ORDER BY id LIMIT 1",
+                    list(kinds),
+                ).fetchone()
+                if row is not None:
+                    conn.execute(
+                        "UPDATE jobs SET status = 'running', pid = ?, attempts = attempts + 1, started_at = ? "
+                        "WHERE id = ?",
+                        (os.getpid(), _now(), row['id']),
+                    )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        finally:
+            conn.close()
+        return self.get(row['id']) if row is not None else None
+
+    def update(self, job_id, progress=None, message=None):
+        """Record a running job's progress (0 to 1) and status message."""
+        conn = self._connect()
+        try:
+            conn.execute(
+                "UPDATE jobs SET progress = COALESCE(?, progress), message = COALESCE(?, message) WHERE id = ?",
+                (progress, message, job_id),
+            )
+        finally:
+            conn.close()
+
+    def finish(self, job_id, result=None, error=None):
+        """Mark a job done (with its result) or failed (with error)."""
+        conn = self._connect()
+        try:
+            conn.execute(
+                "UPDATE jobs SET status = ?, progress = CASE WHEN ? IS NULL THEN 1 ELSE progress END, "
+                "result = ?, error = ?, finished_at = ? WHERE id = ?",
+                ('done' if error is None else 'failed', error, json.dumps(result), error, _now(), job_id),
+            )
+        finally:
+            conn.close()
+
+    def recover(self):
+        """
+        Requeue the running jobs whose process has died (up to MAX_ATTEMPTS
+        runs, then fail them), and delete jobs finished before KEEP_FINISHED.
+        """
+        conn = self._connect()
+        try:
+            for row in conn.execute("SELECT id, pid, attempts FROM jobs WHERE status = 'running'").fetchall():
+                if row['pid'] is not None and _pid_alive(row['pid']):
+                    continue
+                if row['attempts'] >= MAX_ATTEMPTS:
+                    conn.execute(
+                        "UPDATE jobs SET status = 'failed', error = 'interrupted', finished_at = ? WHERE id = ?",
+                        (_now(), row['id']),
+                    )
+                else:
+                    conn.execute("UPDATE jobs SET status = 'queued', pid = NULL WHERE id = ?", (row['id'],))
+                logging.info(f"Recovered job {row['id']}, interrupted in process {row['pid']}")
+            cutoff = (datetime.now() - KEEP_FINISHED).isoformat(timespec='seconds')
+            conn.execute("DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?", (cutoff,))
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _as_dict(row):
+        job = dict(row)
+        job['params'] = json.loads(job['params']) if job['params'] else {}
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        return job
+
+
+class JobRunner:
+    """
+    Runs the jobs of the kinds in handlers from a JobQueue, one at a time,
+    in a background thread.
+
+    handlers maps a job kind to handler(job, progress), where
+    progress(fraction, message) records how far the job has got; the
+    handler's return value (JSON-serializable) is stored as the job's result,
+    and an exception fails the job. Several runners, in one process or many,
+    can serve the same queue: each job is claimed by exactly one.
+    """
+
+    def __init__(self, queue, handlers, poll_interval=2):
+        self.queue = queue
+        self.handlers = handlers
+        self.poll_interval = poll_interval
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        self._stop.clear()
+        self.queue.recover()
+        self._thread = threading.Thread(target=self._run, name='job-runner', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def wake(self):
+        """Look for a job now instead of at the next poll."""
+        self._wake.set()
+
+    def run_next(self):
+        """Claim and run one job. Returns False if there was none."""
+        job = self.queue.claim(list(self.handlers))
+        if job is None:
+            return False
+        logging.info(f"Running job {job['id']} ({job['kind']})")
+        start = time.perf_counter()
+
+        def progress(fraction=None, message=None):
+            self.queue.update(job['id'], fraction, message)
+        try:
+            result = self.handlers[job['kind']](job, progress)
+        except Exception as e:
+            logging.error(f"Job {job['id']} ({job['kind']}) failed: {e}\n{traceback.format_exc()}")
+            self.queue.finish(job['id'], error=str(e) or type(e).__name__)
+        else:
+            self.queue.finish(job['id'], result=result)
+            logging.info(f"Job {job['id']} ({job['kind']}) done in {time.perf_counter() - start:.2f}s")
+        return True
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                if self.run_next():
+                    continue
+            except Exception as e:
+                logging.error(f"Job runner error: {e}")
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
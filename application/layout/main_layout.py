@@ -21,6 +21,10 @@ layout = app.layout = dbc.Container([
     dcc.Store(id='total_records', data=0),
     dcc.Store(id='selected_user_ids', data=[]),
     dcc.Store(id='filtered_user_ids', data=[]),
+    # Background jobs (reload, large exports) this page is waiting for, and
+    # the interval that polls them; it only runs while there are any
+    dcc.Store(id='active-jobs', data={}),
+    dcc.Interval(id='job-poll-interval', interval=2000, disabled=True),
     
     dbc.Row([
         # Left column - Table
@@ -140,6 +144,8 @@ layout = app.layout = dbc.Container([
                     duration=4000,  # Alert will disappear after 4 seconds
                     color="success"
                 ),  
+                # Progress of background jobs
+                html.Div(id='job-status', className='small text-muted mt-1'),
                 # User ID Search Input
                 html.Div([
                     dbc.Label('Search User IDs', className='label'),
@@ -1,141 +1,292 @@
-def join_csv_files(csv_file_1, csv_file_2, csv_file_3, output_file):
+# Weekly activity metrics; weeks without a row in a query count as zero
+ACTIVITY_COLUMNS = [
+    'total_uploads', 'total_licensing_submissions', 'total_accepted_licensing', 'total_sales_revenue',
+    'total_num_of_sales', 'num_of_photos_featured', 'num_of_galleries_featured',
+    'num_of_stories_featured', 'df3_photo_likes', 'df3_comments'
+]
+
+# User attributes carried forward (then backward) across each user's weeks
+PROFILE_COLUMNS = [
+    'df2_full_name', 'df2_username', 'df2_user_type', 'df2_registration_date',
+    'df2_membership', 'df2_country', 'df2_profile_url', 'df2_social_links',
+    'df3_med_lai_score', 'df2_exclusivity_rate', 'df2_acceptance_rate',
+    'df3_avg_visit_days_monthly', 'df3_med_aesthetic_score', 'df3_quality_score'
+]
+
+def with_integer_user_ids(df):
+    """
+    Return df with user_id as int64 keys.
+
+    Text ids are stripped and parsed; rows whose id is not an integer are
+    dropped.
+    """
+    import pandas as pd
+    if pd.api.types.is_integer_dtype(df['user_id']):
+        df['user_id'] = df['user_id'].astype('int64')
+        return df
+    ids = pd.to_numeric(df['user_id'].astype(str).str.strip(), errors='coerce')
+    valid = ids.notna() & (ids % 1 == 0)
+    if not valid.all():
+        print(f"Dropping {(~valid).sum():,} rows without an integer user_id")
+        df = df[valid].copy()
+    df['user_id'] = ids[valid].astype('int64')
+    return df
+
+def read_query_result(path, parser='pandas'):
+    """Read a downloaded query result, either CSV (with the given parser) or streamed Parquet."""
+    import pandas as pd
+    if str(path).endswith('.parquet'):
+        return pd.read_parquet(path)
+    import pyarrow as pa
+    from parse_utils import read_csv, numeric_column_types
+    from initialize_db import NUMERIC_COLUMNS
+    column_types = numeric_column_types(NUMERIC_COLUMNS, prefixes=('df2_', 'df3_'))
+    # Keep dates as text; the merge parses them itself
+    column_types.update({'activity_week': pa.string(), 'registration_date': pa.string()})
+    return read_csv(path, parser, column_types=column_types)
+
+def interchange_path(path, file_format='parquet'):
+    """Return path with the extension of the given interchange format ('parquet' or 'csv')."""
+    import os
+    if file_format not in ('parquet', 'csv'):
+        raise ValueError(f"Unknown interchange format: {file_format}")
+    return f"{os.path.splitext(path)[0]}.{file_format}"
+
+def write_debug_csv(path):
+    """Write a CSV copy of a Parquet pipeline file next to it, for inspection. Returns its path."""
+    import pandas as pd
+    csv_path = interchange_path(path, 'csv')
+    pd.read_parquet(path).to_csv(csv_path, index=False)
+    return csv_path
+
+def _exceeds_budget(weekly_file_1, weekly_file_3, memory_budget_mb):
+    """True if merging in memory is estimated to need more than memory_budget_mb (see partitioned_merge)."""
+    from partitioned_merge import estimated_merge_mb
+    estimate = estimated_merge_mb([weekly_file_1, weekly_file_3])
+    if estimate <= memory_budget_mb:
+        print(f"Merging in memory: ~{estimate:,.0f} MB estimated, within the {memory_budget_mb} MB budget")
+        return False
+    print(f"Merging in partitions: ~{estimate:,.0f} MB estimated, over the {memory_budget_mb} MB budget")
+    return True
+
+def join_csv_files(csv_file_1, csv_file_2, csv_file_3, output_file, since_week=None, engine='pandas',
+                   memory_budget_mb=None, csv_parser='pandas'):
+    """
+    Join the three query results into one row per user and activity week.
+
+    With since_week ('YYYY-MM-DD'), only weeks on or after it are joined, which
+    is what the incremental ingest in initialize_db needs. engine selects the
+    merge implementation: 'pandas', or 'arrow' (see arrow_merge), which
+    produces identical output faster. With memory_budget_mb, if the merge is
+    estimated to need more memory than the budget, users are merged out of
+    core in partitions that fit it (see partitioned_merge), always with the
+    arrow engine; otherwise the budget changes nothing. output_file is written as typed Parquet if
+    it ends in '.parquet', as CSV otherwise. csv_parser picks how CSV query
+    results are read (see parse_utils.read_csv).
+    """
     import pandas as pd
+    from pipeline_metrics import stage
     pd.set_option('future.no_silent_downcasting', True)
 
     try:
-        # Load CSV files into DataFrames
+        if memory_budget_mb and _exceeds_budget(csv_file_1, csv_file_3, memory_budget_mb):
+            from partitioned_merge import join_partitioned
+            sample = join_partitioned(csv_file_1, csv_file_2, csv_file_3, output_file,
+                                      since_week=since_week, memory_budget_mb=memory_budget_mb)
+            print(f"Join results saved to {output_file}")
+            print("\nSample data:")
+            print(sample.sort_values('activity_week'))
+            return
+
+        # Load query results into DataFrames
         print("Loading CSV files...")
-        df1 = pd.read_csv(csv_file_1)  # Weekly activity metrics
-        df2 = pd.read_csv(csv_file_2)  # User profile data
-        df3 = pd.read_csv(csv_file_3)  # Additional weekly metrics
+        with stage('read') as record:
+            df1 = read_query_result(csv_file_1, csv_parser)  # Weekly activity metrics
+            df2 = read_query_result(csv_file_2, csv_parser)  # User profile data
+            df3 = read_query_result(csv_file_3, csv_parser)  # Additional weekly metrics
+            record.rows_out = len(df1) + len(df2) + len(df3)
+        rows_in = len(df1) + len(df2) + len(df3)
 
         print(f"Loaded data shapes - df1: {df1.shape}, df2: {df2.shape}, df3: {df3.shape}")
 
         # Standardize column names (trim whitespaces and convert to lowercase)
         for df in [df1, df2, df3]:
             df.columns = df.columns.str.strip().str.lower()
-            df['user_id'] = df['user_id'].astype(str).str.strip()
-
-        # Process 'activity_week' column
-        for df in [df1, df3]:
-            if 'activity_week' in df.columns:
-                df['activity_week'] = pd.to_datetime(df['activity_week'], errors='coerce').dt.strftime('%Y-%m-%d')
-                df['activity_week'] = df['activity_week'].fillna('')
-
-        # Rename df2 columns to add prefix
-        df2_columns_to_rename = {
-            col: f'df2_{col}' for col in df2.columns 
-            if col not in ['user_id']
-        }
-        df2.rename(columns=df2_columns_to_rename, inplace=True)
-
-        # Rename df3 columns to add prefix
-        df3_columns_to_rename = {
-            col: f'df3_{col}' for col in df3.columns 
-            if col not in ['user_id', 'activity_week']
-        }
-        df3.rename(columns=df3_columns_to_rename, inplace=True)
-
-        print("Getting unique weeks...")
-        # Get all unique user_id and activity_week combinations
-        weeks_df1 = df1[['user_id', 'activity_week']].copy()
-        weeks_df3 = df3[['user_id', 'activity_week']].copy()
-
-        print(f"Unique weeks in df1: {sorted(weeks_df1['activity_week'].unique())}")
-        print(f"Unique weeks in df3: {sorted(weeks_df3['activity_week'].unique())}")
-
-        all_weeks = pd.concat([weeks_df1, weeks_df3]).drop_duplicates()
-        print(f"Total unique week combinations: {len(all_weeks)}")
-
-        print("Merging data...")
-        # Get user profile data
-        user_profiles = df2.copy()
-
-        # Merge all weeks with user profiles
-        df_merged = pd.merge(all_weeks, user_profiles, on='user_id', how='left')
-        print(f"After profile merge: {df_merged.shape}")
-
-        # Merge with df1 for activity metrics
-        df_merged = pd.merge(
-            df_merged,
-            df1,
-            on=['user_id', 'activity_week'],
-            how='left'
-        )
-        print(f"After df1 merge: {df_merged.shape}")
-
-        # Merge with df3 for additional metrics
-        df_merged = pd.merge(
-            df_merged,
-            df3,
-            on=['user_id', 'activity_week'],
-            how='left'
-        )
-        print(f"After df3 merge: {df_merged.shape}")
-
-        print("Filling missing values...")
-        # Fill activity metrics with 0
-        activity_columns = [
-            'total_uploads', 'total_licensing_submissions', 'total_accepted_licensing', 'total_sales_revenue',
-            'total_num_of_sales', 'num_of_photos_featured', 'num_of_galleries_featured',
-            'num_of_stories_featured', 'df3_photo_likes', 'df3_comments'
-        ]
-        
-        for col in activity_columns:
-            if col in df_merged.columns:
-                df_merged[col] = df_merged[col].fillna(0)
-
-        # Forward fill user profile data
-        profile_columns = [
-            'df2_full_name', 'df2_username', 'df2_user_type', 'df2_registration_date',
-            'df2_membership', 'df2_country', 'df2_profile_url', 'df2_social_links',
-            'df3_med_lai_score', 'df2_exclusivity_rate', 'df2_acceptance_rate',
-            'df3_avg_visit_days_monthly', 'df3_med_aesthetic_score', 'df3_quality_score'
-        ]
-
-        print("Forward filling profile data...")
-        # Group by user_id and forward fill profile data
-        df_merged = df_merged.sort_values(['user_id', 'activity_week'])
-        
-        # Process profile columns in chunks for better performance
-        chunk_size = 5
-        for i in range(0, len(profile_columns), chunk_size):
-            chunk = profile_columns[i:i + chunk_size]
-            print(f"Processing columns {i+1}-{min(i+chunk_size, len(profile_columns))} of {len(profile_columns)}")
-            
-            existing_columns = [col for col in chunk if col in df_merged.columns]
-            if existing_columns:
-                # Store the user_id column
-                user_id_col = df_merged['user_id'].copy()
-                
-                # Perform the forward/backward fill
-                filled_data = df_merged.groupby('user_id')[existing_columns].transform('ffill')
-                filled_data = filled_data.groupby(user_id_col).transform('bfill')
-                
-                # Update only the filled columns
-                df_merged[existing_columns] = filled_data
-
-        print("Removing blank activity weeks...")
-        # Remove rows where activity_week is blank
-        df_merged = df_merged[df_merged['activity_week'].notna() & (df_merged['activity_week'] != '')]
-
-        print("Final sorting...")
-        # Sort by user_id (numerically) and activity_week
-        df_merged['user_id'] = pd.to_numeric(df_merged['user_id'])
-        df_merged = df_merged.sort_values(['user_id', 'activity_week'])
-        df_merged['user_id'] = df_merged['user_id'].astype(str)
-
-        print("Saving results...")
-        # Save the joined DataFrame to CSV
-        df_merged.to_csv(output_file, index=False)
+
+        if engine == 'arrow':
+            from arrow_merge import MergedOutputWriter, merge_frames_arrow, user_rows
+            with stage('join', rows_in=rows_in) as record:
+                merged = merge_frames_arrow(df1, df2, df3, since_week=since_week)
+                record.rows_out = merged.num_rows
+            print("Saving results...")
+            with stage('write', rows_in=merged.num_rows):
+                with MergedOutputWriter(output_file) as writer:
+                    writer.write(merged)
+            sample = user_rows(merged, 233)
+        elif engine == 'pandas':
+            with stage('join', rows_in=rows_in) as record:
+                df_merged = merge_frames(df1, df2, df3, since_week=since_week)
+                record.rows_out = len(df_merged)
+            print("Saving results...")
+            with stage('write', rows_in=len(df_merged)):
+                if str(output_file).endswith('.parquet'):
+                    import pyarrow as pa
+                    from arrow_merge import MergedOutputWriter
+                    with MergedOutputWriter(output_file) as writer:
+                        writer.write(pa.Table.from_pandas(df_merged, preserve_index=False))
+                else:
+                    # Save the joined DataFrame to CSV
+                    df_merged.to_csv(output_file, index=False)
+            sample = df_merged[df_merged['user_id'] == 233]
+        else:
+            raise ValueError(f"Unknown merge engine: {engine}")
         print(f"Join results saved to {output_file}")
 
-        print("\nFinal columns:", df_merged.columns.tolist())
+        print("\nFinal columns:", sample.columns.tolist())
         print("\nSample data:")
-        print(df_merged[df_merged['user_id'] == '233'].sort_values('activity_week'))
+        print(sample.sort_values('activity_week'))
 
     except Exception as e:
         print(f"Error during merge process: {str(e)}")
         import traceback
         print(traceback.format_exc())
-        raise
\ No newline at end of file
+        raise
+
+def merge_frames(df1, df2, df3, since_week=None):
+    """Merge standardized query frames with pandas. Returns the joined DataFrame."""
+    import pandas as pd
+
+    df1, df2, df3 = (with_integer_user_ids(df) for df in [df1, df2, df3])
+
+    # Process 'activity_week' column
+    for df in [df1, df3]:
+        if 'activity_week' in df.columns:
+            df['activity_week'] = pd.to_datetime(df['activity_week'], errors='coerce').dt.strftime('%Y-%m-%d')
+            df['activity_week'] = df['activity_week'].fillna('')
+
+    # Rename df2 columns to add prefix
+    df2_columns_to_rename = {
+        col: f'df2_{col}' for col in df2.columns 
+        if col not in ['user_id']
+    }
+    df2.rename(columns=df2_columns_to_rename, inplace=True)
+
+    # Rename df3 columns to add prefix
+    df3_columns_to_rename = {
+        col: f'df3_{col}' for col in df3.columns 
+        if col not in ['user_id', 'activity_week']
+    }
+    df3.rename(columns=df3_columns_to_rename, inplace=True)
+
+    history_context = None
+    if since_week:
+        print(f"Keeping weeks from {since_week} onwards...")
+        history = df3[df3['activity_week'] < since_week]
+        df1 = df1[df1['activity_week'] >= since_week]
+        df3 = df3[df3['activity_week'] >= since_week]
+        history_context = _history_context(history, set(df1['user_id']) | set(df3['user_id']))
+
+    print("Getting unique weeks...")
+    # Get all unique user_id and activity_week combinations
+    weeks_df1 = df1[['user_id', 'activity_week']].copy()
+    weeks_df3 = df3[['user_id', 'activity_week']].copy()
+
+    print(f"Unique weeks in df1: {sorted(weeks_df1['activity_week'].unique())}")
+    print(f"Unique weeks in df3: {sorted(weeks_df3['activity_week'].unique())}")
+
+    all_weeks = pd.concat([weeks_df1, weeks_df3]).drop_duplicates()
+    print(f"Total unique week combinations: {len(all_weeks)}")
+
+    print("Merging data...")
+    # Get user profile data
+    user_profiles = df2.copy()
+
+    # Merge all weeks with user profiles
+    df_merged = pd.merge(all_weeks, user_profiles, on='user_id', how='left')
+    print(f"After profile merge: {df_merged.shape}")
+
+    # Merge with df1 for activity metrics
+    df_merged = pd.merge(
+        df_merged,
+        df1,
+        on=['user_id', 'activity_week'],
+        how='left'
+    )
+    print(f"After df1 merge: {df_merged.shape}")
+
+    # Merge with df3 for additional metrics
+    df_merged = pd.merge(
+        df_merged,
+        df3,
+        on=['user_id', 'activity_week'],
+        how='left'
+    )
+    print(f"After df3 merge: {df_merged.shape}")
+
+    print("Filling missing values...")
+    # Fill activity metrics with 0
+    for col in ACTIVITY_COLUMNS:
+        if col in df_merged.columns:
+            df_merged[col] = df_merged[col].fillna(0)
+
+    if history_context is not None and not history_context.empty:
+        # Blank-week rows sort first, seed the forward fill and are removed below
+        history_context = history_context.reindex(columns=df_merged.columns)
+        for col in ACTIVITY_COLUMNS:
+            if col in df_merged.columns:
+                history_context[col] = history_context[col].fillna(0).astype(df_merged[col].dtype)
+        df_merged = pd.concat([df_merged, history_context], ignore_index=True)
+
+    # Forward fill user profile data
+    profile_columns = PROFILE_COLUMNS
+
+    print("Forward filling profile data...")
+    # Group by user_id and forward fill profile data
+    df_merged = df_merged.sort_values(['user_id', 'activity_week'])
+    
+    # Process profile columns in chunks for better performance
+    chunk_size = 5
+    for i in range(0, len(profile_columns), chunk_size):
+        chunk = profile_columns[i:i + chunk_size]
+        print(f"Processing columns {i+1}-{min(i+chunk_size, len(profile_columns))} of {len(profile_columns)}")
+        
+        existing_columns = [col for col in chunk if col in df_merged.columns]
+        if existing_columns:
+            # Store the user_id column
+            user_id_col = df_merged['user_id'].copy()
+            
+            # Perform the forward/backward fill
+            filled_data = df_merged.groupby('user_id')[existing_columns].transform('ffill')
+            filled_data = filled_data.groupby(user_id_col).transform('bfill')
+            
+            # Update only the filled columns
+            df_merged[existing_columns] = filled_data
+
+    print("Removing blank activity weeks...")
+    # Remove rows where activity_week is blank
+    df_merged = df_merged[df_merged['activity_week'].notna() & (df_merged['activity_week'] != '')]
+
+    print("Final sorting...")
+    # Sort by user_id and activity_week
+    df_merged = df_merged.sort_values(['user_id', 'activity_week'])
+
+    return df_merged
+
+def _history_context(history, user_ids):
+    """
+    Summarize the weeks before an incremental merge for the users in it.
+
+    Returns one blank-week row per user holding the last known value of each
+    forward-filled query_3 column, so the delta is filled exactly as a full
+    merge would fill it.
+    """
+    columns = [col for col in PROFILE_COLUMNS if col in history.columns]
+    history = history[history['user_id'].isin(user_ids)]
+    context = (
+        history.sort_values(['user_id', 'activity_week'])
+        .groupby('user_id')[columns]
+        .last()
+        .reset_index()
+    )
+    context['activity_week'] = ''
+    return context
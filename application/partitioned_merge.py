@@ -0,0 +1,203 @@
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from arrow_merge import MergedOutputWriter, merge_frames_arrow, user_rows, _user_id_keys
+from pipeline_metrics import stage
+
+# Peak bytes held per query_1/query_3 row while a partition is merged,
+# measured with benchmarks/bench_merge.py on the production column set
+BYTES_PER_WEEKLY_ROW = 2500
+MIN_PARTITION_ROWS = 10000
+QUERY_KEYS = ('query_1', 'query_2', 'query_3')
+
+
+def _standardize_columns(df):
+    df.columns = df.columns.str.strip().str.lower()
+    return df
+
+
+def iter_query_chunks(path, chunk_rows):
+    """Read a query result file in DataFrame chunks of at most chunk_rows rows."""
+    if str(path).endswith('.parquet'):
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_rows):
+            yield _standardize_columns(batch.to_pandas())
+    else:
+        for chunk in pd.read_csv(path, chunksize=chunk_rows):
+            yield _standardize_columns(chunk)
+
+
+def _user_row_counts(paths, chunk_rows):
+    """Count rows per user across the weekly query results, one chunk at a time."""
+    user_ids = np.empty(0, dtype=np.int64)
+    counts = np.empty(0, dtype=np.int64)
+    for path in paths:
+        for chunk in iter_query_chunks(path, chunk_rows):
+            ids, chunk_counts = np.unique(_user_id_keys(chunk['user_id']), return_counts=True)
+            user_ids = np.concatenate([user_ids, ids])
+            counts = np.concatenate([counts, chunk_counts])
+            user_ids, inverse = np.unique(user_ids, return_inverse=True)
+            counts = np.bincount(inverse, weights=counts).astype(np.int64)
+    return user_ids, counts
+
+
+def weekly_rows(path):
+    """Count the rows of a query result: from the Parquet footer, or the lines of a CSV."""
+    if str(path).endswith('.parquet'):
+        return pq.ParquetFile(path).metadata.num_rows
+    with open(path, 'rb') as f:
+        lines = sum(chunk.count(b'\n') for chunk in iter(lambda: f.read(1 << 20), b''))
+    return max(lines - 1, 0)
+
+
+def estimated_merge_mb(weekly_paths):
+    """Estimate the peak memory of merging the query_1 and query_3 results at weekly_paths in memory, in MB."""
+    return sum(weekly_rows(path) for path in weekly_paths) * BYTES_PER_WEEKLY_ROW / (1024 * 1024)
+
+
+def plan_partitions(user_ids, counts, rows_per_partition):
+    """
+    Split sorted user ids into contiguous ranges of about rows_per_partition rows.
+
+    Returns the first user id of every partition. Users are never split, so a
+    user with more rows than the target gets a partition of their own.
+    """
+    if len(user_ids) == 0:
+        return np.array([0], dtype=np.int64)
+    rows_before = np.cumsum(counts) - counts
+    partition = rows_before // max(rows_per_partition, 1)
+    starts = np.flatnonzero(np.diff(partition, prepend=-1))
+    return user_ids[starts]
+
+
+def _partition_of(user_ids, boundaries):
+    return np.maximum(np.searchsorted(boundaries, user_ids, side='right') - 1, 0)
+
+
+def _spill(path, key, boundaries, spill_dir, chunk_rows):
+    """
+    Split a query result into per-partition Parquet pieces.
+
+    Returns an empty frame with the query's columns and types, standing in for
+    partitions that have no rows of this query.
+    """
+    template = None
+    for chunk_number, chunk in enumerate(iter_query_chunks(path, chunk_rows)):
+        if template is None:
+            template = chunk.iloc[:0]
+        partitions = _partition_of(_user_id_keys(chunk['user_id']), boundaries)
+        order = np.argsort(partitions, kind='stable')
+        partitions = partitions[order]
+        chunk = chunk.iloc[order]
+        splits = np.flatnonzero(np.diff(partitions)) + 1
+        for rows in np.split(np.arange(len(chunk)), splits):
+            if len(rows) == 0:
+                continue
+            piece_dir = os.path.join(spill_dir, f'part-{partitions[rows[0]]:05d}', key)
+            os.makedirs(piece_dir, exist_ok=True)
+            chunk.iloc[rows].to_parquet(os.path.join(piece_dir, f'{chunk_number:06d}.parquet'), index=False)
+    if template is None:
+        template = _standardize_columns(pd.read_parquet(path) if str(path).endswith('.parquet') else pd.read_csv(path))
+    return template
+
+
+def _read_partition(partition_dir, key, template):
+    """Read one query's pieces of a partition back into a single DataFrame."""
+    piece_dir = os.path.join(partition_dir, key)
+    if not os.path.isdir(piece_dir):
+        return template.copy()
+    pieces = [pd.read_parquet(os.path.join(piece_dir, name)) for name in sorted(os.listdir(piece_dir))]
+    # Concatenating pieces widens their types the way reading the whole file does
+    return pd.concat(pieces, ignore_index=True) if len(pieces) > 1 else pieces[0]
+
+
+def _unified_type(types):
+    """Pick the type that every partition's version of a column casts to."""
+    types = [t for t in types if not pa.types.is_null(t)]
+    if not types:
+        return pa.null()
+    if any(pa.types.is_string(t) or pa.types.is_large_string(t) for t in types):
+        return pa.string()
+    if any(pa.types.is_floating(t) for t in types):
+        return pa.float64()
+    return types[0]
+
+
+def join_partitioned(csv_file_1, csv_file_2, csv_file_3, output_file, since_week=None, memory_budget_mb=2048):
+    """
+    Merge the three query results out of core, one range of users at a time.
+
+    Users are range-partitioned by user_id so every partition holds about as
+    many rows as fit the memory budget. Each input is split into per-partition
+    Parquet pieces in one pass, each partition is merged with the arrow engine,
+    and the results are appended to the output in user order. Peak memory
+    depends on the budget, not on how many weeks of history there are.
+
+    Returns user 233's merged rows as a DataFrame, for the sample printout.
+    """
+    rows_per_partition = max(MIN_PARTITION_ROWS, int(memory_budget_mb * 1024 * 1024 / BYTES_PER_WEEKLY_ROW))
+    paths = dict(zip(QUERY_KEYS, (csv_file_1, csv_file_2, csv_file_3)))
+    spill_dir = tempfile.mkdtemp(prefix='merge_spill_', dir=os.path.dirname(os.path.abspath(output_file)))
+
+    try:
+        print(f"Planning partitions of ~{rows_per_partition:,} rows ({memory_budget_mb} MB budget)...")
+        with stage('plan') as record:
+            user_ids, counts = _user_row_counts([paths['query_1'], paths['query_3']], rows_per_partition)
+            boundaries = plan_partitions(user_ids, counts, rows_per_partition)
+            record.rows_in = int(counts.sum())
+        print(f"{len(user_ids):,} users with {int(counts.sum()):,} weekly rows in {len(boundaries)} partitions")
+
+        print("Splitting query results by partition...")
+        with stage('spill'):
+            templates = {key: _spill(path, key, boundaries, spill_dir, rows_per_partition)
+                         for key, path in paths.items()}
+
+        merged_paths = []
+        schemas = []
+        with stage('join') as record:
+            record.rows_out = 0
+            for number in range(len(boundaries)):
+                partition_dir = os.path.join(spill_dir, f'part-{number:05d}')
+                if not os.path.isdir(partition_dir):
+                    continue
+                frames = [_read_partition(partition_dir, key, templates[key]) for key in QUERY_KEYS]
+                if frames[0].empty and frames[2].empty:
+                    continue
+                print(f"Merging partition {number + 1} of {len(boundaries)}...")
+                merged = merge_frames_arrow(*frames, since_week=since_week)
+                merged_path = os.path.join(partition_dir, 'merged.parquet')
+                pq.write_table(merged, merged_path)
+                merged_paths.append(merged_path)
+                schemas.append(merged.schema)
+                record.rows_out += merged.num_rows
+                shutil.rmtree(os.path.join(partition_dir, 'query_1'), ignore_errors=True)
+                shutil.rmtree(os.path.join(partition_dir, 'query_3'), ignore_errors=True)
+
+        print("Writing merged partitions...")
+        if not schemas:
+            empty = merge_frames_arrow(*(templates[key].copy() for key in QUERY_KEYS), since_week=since_week)
+            with MergedOutputWriter(output_file) as writer:
+                writer.write(empty)
+            return empty.to_pandas()
+
+        names = schemas[0].names
+        target = pa.schema([(name, _unified_type([schema.field(name).type for schema in schemas])) for name in names])
+        sample = None
+        with stage('write') as record, MergedOutputWriter(output_file) as writer:
+            record.rows_in = 0
+            for merged_path in merged_paths:
+                merged = pq.read_table(merged_path).cast(target)
+                writer.write(merged)
+                record.rows_in += merged.num_rows
+                rows = user_rows(merged, 233)
+                if not rows.empty:
+                    sample = rows
+                os.remove(merged_path)
+        return sample if sample is not None else user_rows(merged, 233)
+    finally:
+        shutil.rmtree(spill_dir, ignore_errors=True)
@@ -0,0 +1,309 @@
+"""
+Per-stage timing and memory metrics for the ingest pipeline.
+
+A run (see start_run) collects one record per stage: wall time, CPU time,
+rows in and out and peak RSS. Code anywhere in the pipeline opens a stage
+with `with stage('name') as s:` and sets s.rows_in / s.rows_out; stages
+opened inside another stage are named after it ('merge.read'). Outside a
+run, stages cost nothing and record nothing. Finished runs are appended as
+one JSON line each to the metrics file.
+
+Show the trend of the last runs (from the application directory):
+    python pipeline_metrics.py --last 10
+"""
+import argparse
+import contextlib
+import json
+import os
+import resource
+import statistics
+import time
+import uuid
+from datetime import datetime
+
+DEFAULT_METRICS_FILE = 'pipeline_metrics.jsonl'
+
+_CLEAR_REFS_PATH = '/proc/self/clear_refs'
+_active_run = None
+
+
+def peak_rss_mb():
+    """Return the peak resident set size of this process in MB."""
+    # VmHWM starts afresh in a spawned process, unlike ru_maxrss, which
+    # carries over the high-water mark of the parent it was forked from
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def reset_peak_rss():
+    """Reset the peak RSS to the current RSS. Returns False where that isn't supported."""
+    try:
+        with open(_CLEAR_REFS_PATH, 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def get_metrics_path(config):
+    """Return the metrics file named in config, by default next to the query results."""
+    return config.get('metrics_path', os.path.join(config.get('output_folder', '.'), DEFAULT_METRICS_FILE))
+
+
+class StageRecord:
+    """Measurements of one stage. rows_in and rows_out are set by the code being measured."""
+
+    def __init__(self, name):
+        self.name = name
+        self.rows_in = None
+        self.rows_out = None
+        self.wall_seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.peak_rss_mb = 0.0
+        self.status = 'ok'
+
+    def as_dict(self):
+        return {
+            'name': self.name,
+            'status': self.status,
+            'wall_seconds': round(self.wall_seconds, 4),
+            'cpu_seconds': round(self.cpu_seconds, 4),
+            'rows_in': self.rows_in,
+            'rows_out': self.rows_out,
+            'peak_rss_mb': round(self.peak_rss_mb, 1),
+        }
+
+
+class PipelineRun:
+    """
+    The stages of one pipeline run.
+
+    Peak RSS is tracked per stage by resetting the kernel's high-water mark
+    when a stage starts; a stage's peak includes the stages nested in it.
+    Where the mark can't be reset, each stage reports the process peak so
+    far, and the run's peak_rss_scope says so. Stages are meant to be opened
+    from the thread that started the run.
+    """
+
+    def __init__(self, path, **attributes):
+        self.path = path
+        self.attributes = attributes
+        self.run_id = uuid.uuid4().hex[:12]
+        self.started_at = datetime.now().isoformat(timespec='seconds')
+        self.stages = []
+        self._stack = []
+        self._start = time.perf_counter()
+        self._cpu_start = time.process_time()
+        self.per_stage_peaks = reset_peak_rss()
+
+    @contextlib.contextmanager
+    def stage(self, name, rows_in=None):
+        parent = self._stack[-1] if self._stack else None
+        record = StageRecord(f"{parent.name}.{name}" if parent else name)
+        record.rows_in = rows_in
+        if parent is not None and self.per_stage_peaks:
+            # The reset below would lose what the parent has used so far
+            parent.peak_rss_mb = max(parent.peak_rss_mb, peak_rss_mb())
+        if self.per_stage_peaks:
+            reset_peak_rss()
+        self.stages.append(record)
+        self._stack.append(record)
+        start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield record
+        except BaseException:
+            record.status = 'failed'
+            raise
+        finally:
+            record.wall_seconds = time.perf_counter() - start
+            record.cpu_seconds = time.process_time() - cpu_start
+            record.peak_rss_mb = max(record.peak_rss_mb, peak_rss_mb())
+            self._stack.pop()
+            if parent is not None:
+                parent.peak_rss_mb = max(parent.peak_rss_mb, record.peak_rss_mb)
+
+    def as_dict(self, status='ok', error=None):
+        stages = [record.as_dict() for record in self.stages]
+        return {
+            'run_id': self.run_id,
+            'started_at': self.started_at,
+            'status': status,
+            'error': error,
+            **self.attributes,
+            'wall_seconds': round(time.perf_counter() - self._start, 4),
+            'cpu_seconds': round(time.process_time() - self._cpu_start, 4),
+            'peak_rss_mb': round(max([peak_rss_mb()] + [record.peak_rss_mb for record in self.stages]), 1),
+            'peak_rss_scope': 'stage' if self.per_stage_peaks else 'process',
+            'stages': stages,
+        }
+
+    def save(self, status='ok', error=None):
+        """Append this run's record to the metrics file."""
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(self.as_dict(status, error)) + '\n')
+
+
+@contextlib.contextmanager
+def start_run(path, **attributes):
+    """
+    Collect the stages of a pipeline run and append its record to path when it ends.
+
+    The record is written even if the run fails, with status 'failed' and the
+    error. Extra keyword attributes (e.g. the ingest mode) are stored with it.
+    """
+    global _active_run
+    previous = _active_run
+    run = PipelineRun(path, **attributes)
+    _active_run = run
+    try:
+        yield run
+    except BaseException as e:
+        _active_run = previous
+        _save_quietly(run, 'failed', f"{type(e).__name__}: {e}")
+        raise
+    _active_run = previous
+    _save_quietly(run)
+
+
+def _save_quietly(run, status='ok', error=None):
+    # Metrics must never fail the pipeline they measure
+    try:
+        run.save(status, error)
+        print(f"Pipeline metrics for run {run.run_id} appended to {run.path}")
+    except OSError as e:
+        print(f"Could not write pipeline metrics to {run.path}: {e}")
+
+
+def current_run():
+    """Return the run being recorded, or None."""
+    return _active_run
+
+
+@contextlib.contextmanager
+def stage(name, rows_in=None):
+    """
+    Measure a stage of the current run.
+
+    Yields a StageRecord whose rows_in and rows_out may be set inside the
+    block. Without a current run the record is discarded.
+    """
+    if _active_run is None:
+        yield StageRecord(name)
+        return
+    with _active_run.stage(name, rows_in=rows_in) as record:
+        yield record
+
+
+def read_runs(path, last=None):
+    """Return the recorded runs in path, oldest first, optionally only the last ones."""
+    if not os.path.exists(path):
+        return []
+    runs = []
+    with open(path, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                runs.append(json.loads(line))
+            except ValueError:
+                print(f"Skipping unreadable metrics line in {path}")
+    return runs[-last:] if last else runs
+
+
+def _stage_names(runs, depth):
+    names = []
+    for run in runs:
+        for record in run.get('stages', []):
+            if record['name'].count('.') < depth and record['name'] not in names:
+                names.append(record['name'])
+    return names
+
+
+def format_trend(runs, field='wall_seconds', depth=1):
+    """
+    Format a table with one row per run and one column per stage.
+
+    field is the stage measurement shown; depth limits how deeply nested
+    stages are included (1 shows top-level stages only). A last row gives
+    the median of every column.
+    """
+    names = _stage_names(runs, depth)
+    header = ['started_at', 'status', 'mode', 'total'] + names + ['peak_mb']
+    rows = []
+    for run in runs:
+        values = {}
+        for record in run.get('stages', []):
+            value, previous = record.get(field), values.get(record['name'])
+            # A stage that ran twice (e.g. merge after a failed incremental load) counts once, in total
+            if previous is not None and value is not None:
+                value = max(previous, value) if field == 'peak_rss_mb' else previous + value
+            values[record['name']] = previous if value is None else value
+        rows.append(
+            [run.get('started_at', ''), run.get('status', ''), run.get('mode', ''), run.get(field)]
+            + [values.get(name) for name in names]
+            + [run.get('peak_rss_mb')]
+        )
+
+    medians = ['median', '', '']
+    for column in range(3, len(header)):
+        present = [row[column] for row in rows if isinstance(row[column], (int, float))]
+        medians.append(statistics.median(present) if present else None)
+
+    def cell(value):
+        if value is None:
+            return '-'
+        if isinstance(value, float):
+            return f"{value:,.2f}"
+        if isinstance(value, int):
+            return f"{value:,}"
+        return str(value)
+
+    table = [header] + [[cell(value) for value in row] for row in rows + [medians]]
+    widths = [max(len(row[i]) for row in table) for i in range(len(header))]
+    lines = ['  '.join(value.rjust(width) for value, width in zip(row, widths)) for row in table]
+    lines.insert(1, '  '.join('-' * width for width in widths))
+    lines.insert(len(lines) - 1, lines[1])
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show per-stage metrics of the last ingest pipeline runs.")
+    parser.add_argument('--last', type=int, default=10, help="Number of most recent runs to show")
+    parser.add_argument('--field', default='wall_seconds',
+                        choices=['wall_seconds', 'cpu_seconds', 'rows_in', 'rows_out', 'peak_rss_mb'],
+                        help="Stage measurement to show")
+    parser.add_argument('--depth', type=int, default=1,
+                        help="Include stages nested up to this depth (e.g. 2 adds merge.read)")
+    parser.add_argument('--path', help="Metrics file (default: metrics_path from config.json)")
+    parser.add_argument('--config', default='./config.json')
+    args = parser.parse_args()
+
+    path = args.path
+    if path is None:
+        try:
+            with open(args.config, 'r') as config_file:
+                path = get_metrics_path(json.load(config_file))
+        except (OSError, ValueError):
+            path = DEFAULT_METRICS_FILE
+
+    runs = read_runs(path, args.last)
+    if not runs:
+        print(f"No pipeline runs recorded in {path}")
+        return
+    print(f"Last {len(runs)} runs in {path} ({args.field}):")
+    print(format_trend(runs, args.field, args.depth))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    """Return the SHA-256 hex digest of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def combine_fingerprints(*fingerprints):
+    """Combine several fingerprints into one that changes if any of them does."""
+    digest = hashlib.sha256()
+    for fingerprint in fingerprints:
+        digest.update(str(fingerprint).encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+class RefreshManifest:
+    """
+    Record of what each pipeline stage last produced, used to skip unchanged work.
+
+    For every query it stores the Redash latest_query_data_id that was downloaded
+    and a content hash of the output file. For the merge stage it stores a
+    fingerprint of the inputs together with the output file's hash, and for
+    the database load stages the database generation they produced, so a
+    stage can be skipped when its inputs haven't changed since the last run.
+
+    File hashes are cached alongside the file size and mtime, so checking an
+    unchanged file doesn't re-read it.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.data = {'queries': {}, 'stages': {}}
+        if os.path.exists(path):
+            try:
+                with open(path, 'r') as f:
+                    self.data = json.load(f)
+                self.data.setdefault('queries', {})
+                self.data.setdefault('stages', {})
+            except (OSError, ValueError) as e:
+                print(f"Ignoring unreadable refresh manifest {path}: {e}")
+
+    def save(self):
+        """Write the manifest atomically."""
+        with self._lock:
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(self.data, f, indent=2, sort_keys=True)
+            os.replace(tmp_path, self.path)
+
+    @staticmethod
+    def _describe_file(path):
+        stat = os.stat(path)
+        return {
+            'path': path,
+            'size': stat.st_size,
+            'mtime': stat.st_mtime,
+            'sha256': file_sha256(path),
+        }
+
+    @staticmethod
+    def _file_matches(entry, path):
+        """Check that path still holds the content recorded in entry."""
+        if not entry or entry.get('path') != path or not os.path.exists(path):
+            return False
+        stat = os.stat(path)
+        if stat.st_size == entry.get('size') and stat.st_mtime == entry.get('mtime'):
+            return True
+        return file_sha256(path) == entry.get('sha256')
+
+    def query_is_current(self, key, query_result_id, path):
+        """True if path already holds the given Redash result for this query."""
+        entry = self.data['queries'].get(key)
+        return (
+            entry is not None
+            and entry.get('query_result_id') == query_result_id
+            and self._file_matches(entry, path)
+        )
+
+    def get_query(self, key):
+        return self.data['queries'].get(key)
+
+    def record_query(self, key, query_id, query_result_id, path, **details):
+        """Record a freshly downloaded query result, plus any extra details such as row counts."""
+        entry = self._describe_file(path)
+        entry.update(details)
+        entry.update({
+            'query_id': query_id,
+            'query_result_id': query_result_id,
+            'updated_at': datetime.now().isoformat(timespec='seconds'),
+        })
+        with self._lock:
+            self.data['queries'][key] = entry
+
+    def query_fingerprint(self, key):
+        entry = self.data['queries'].get(key)
+        return entry['sha256'] if entry else None
+
+    def stage_is_current(self, stage, input_fingerprint, output_path):
+        """True if the stage last ran on the same inputs and its output is intact."""
+        entry = self.data['stages'].get(stage)
+        return (
+            entry is not None
+            and entry.get('input_fingerprint') == input_fingerprint
+            and self._file_matches(entry, output_path)
+        )
+
+    def record_stage(self, stage, input_fingerprint, output_path):
+        """Record a completed stage run."""
+        entry = self._describe_file(output_path)
+        entry.update({
+            'input_fingerprint': input_fingerprint,
+            'updated_at': datetime.now().isoformat(timespec='seconds'),
+        })
+        with self._lock:
+            self.data['stages'][stage] = entry
+
+    def load_is_current(self, stage, input_fingerprint, generation):
+        """
+        True if the load stage last ran on the same inputs and the database is
+        still at the generation it produced. The database itself is never
+        hashed: WAL checkpoints and in-place updates change its file anyway.
+        """
+        entry = self.data['stages'].get(stage)
+        return (
+            entry is not None
+            and entry.get('input_fingerprint') == input_fingerprint
+            and entry.get('generation') == generation
+        )
+
+    def record_load(self, stage, input_fingerprint, generation):
+        """Record a completed load stage run and the database generation it produced."""
+        entry = {
+            'input_fingerprint': input_fingerprint,
+            'generation': generation,
+            'updated_at': datetime.now().isoformat(timespec='seconds'),
+        }
+        with self._lock:
+            self.data['stages'][stage] = entry
+
+    def stage_fingerprint(self, stage):
+        entry = self.data['stages'].get(stage)
+        return entry['sha256'] if entry else None
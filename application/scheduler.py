@@ -1,12 +1,37 @@
 import schedule
 import time
-import subprocess
+import json
+from job_queue import JobQueue, JobRunner
+from update_user_data import run_update_user_data
 
-def run_update_user_data():
-    subprocess.run(["python3", "update_user_data.py"])
+def get_refresh_interval_minutes(config_path='config.json'):
+    """Read the refresh interval from config.json, defaulting to hourly."""
+    try:
+        with open(config_path, 'r') as config_file:
+            return int(json.load(config_file).get('refresh_interval_minutes', 60))
+    except Exception as e:
+        print(f"Could not read refresh interval from {config_path}: {e}")
+        return 60
 
-schedule.every().day.at("05:00").do(run_update_user_data)
+# Refreshes are 'ingest' jobs on the job queue the dashboard shares, run here
+# rather than in the web process (a reload in incremental ingest mode runs a
+# queued one itself). update_user_data holds the rebuild lock, so a refresh
+# and a reload from the dashboard never rebuild at the same time.
+jobs = JobQueue()
+runner = JobRunner(jobs, {'ingest': run_update_user_data})
 
+def queue_update_user_data():
+    """Queue a refresh, unless one is still queued or running."""
+    job_id, queued = jobs.submit('ingest')
+    if not queued:
+        print(f"Refresh job {job_id} is still pending; not queuing another")
+    runner.wake()
+
+# Runs whose Redash results haven't changed are skipped cheaply by
+# update_user_data, so the data can be refreshed often.
+schedule.every(get_refresh_interval_minutes()).minutes.do(queue_update_user_data)
+
+runner.start()
 while True:
     schedule.run_pending()
     time.sleep(60)
@@ -0,0 +1,235 @@
+import json
+import os
+import codecs
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from pipeline_metrics import peak_rss_mb
+
+# Arrow types for the column types Redash reports in query_result.data.columns.
+# Dates are kept as their ISO strings; the merge step parses them.
+REDASH_COLUMN_TYPES = {
+    'integer': pa.int64(),
+    'float': pa.float64(),
+    'boolean': pa.bool_(),
+    'string': pa.string(),
+    'date': pa.string(),
+    'datetime': pa.string(),
+}
+
+_DECODER = json.JSONDecoder()
+_WHITESPACE = ' \t\n\r'
+
+
+class RedashRowStream:
+    """
+    Incrementally parse a Redash query result payload.
+
+    Feeds on an iterable of byte chunks and yields the objects of
+    query_result.data.rows one at a time, so the full payload is never held
+    in memory. The column definitions are captured when they appear before
+    the rows array, which is how Redash serializes its results.
+    """
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._text_decoder = codecs.getincrementaldecoder('utf-8')()
+        self._buffer = ''
+        self._pos = 0
+        self._eof = False
+        self.bytes_read = 0
+        self.columns = None
+
+    def _read_more(self):
+        """Append the next chunk to the buffer. Returns False at end of stream."""
+        if self._eof:
+            return False
+        try:
+            chunk = next(self._chunks)
+        except StopIteration:
+            self._eof = True
+            self._buffer += self._text_decoder.decode(b'', final=True)
+            return False
+        self.bytes_read += len(chunk)
+        # Drop the consumed prefix so the buffer stays bounded
+        if self._pos > 1 << 20:
+            self._buffer = self._buffer[self._pos:]
+            self._pos = 0
+        self._buffer += self._text_decoder.decode(chunk)
+        return True
+
+    def _find(self, token):
+        """Advance past the next occurrence of token, reading as needed."""
+        while True:
+            index = self._buffer.find(token, self._pos)
+            if index != -1:
+                self._pos = index + len(token)
+                return True
+            # Keep a tail in case the token straddles two chunks
+            self._pos = max(self._pos, len(self._buffer) - len(token))
+            if not self._read_more():
+                return False
+
+    def _skip(self, chars):
+        """Skip over any of chars and return the next significant character."""
+        while True:
+            while self._pos < len(self._buffer) and self._buffer[self._pos] in chars:
+                self._pos += 1
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._read_more():
+                return None
+
+    def _decode_value(self):
+        """Decode the JSON value starting at the current position."""
+        while True:
+            try:
+                value, end = _DECODER.raw_decode(self._buffer, self._pos)
+                self._pos = end
+                return value
+            except json.JSONDecodeError:
+                # The value is probably cut off at the end of the buffer
+                if not self._read_more():
+                    raise ValueError("Truncated JSON in query result rows")
+
+    def _seek_key(self, key):
+        """Position the stream at the value of the next `"key":` member."""
+        token = f'"{key}"'
+        while self._find(token):
+            if self._skip(_WHITESPACE) == ':':
+                self._pos += 1
+                self._skip(_WHITESPACE)
+                return True
+        return False
+
+    def __iter__(self):
+        if not self._seek_key('data'):
+            raise ValueError("Unexpected response format from API")
+
+        # Redash writes "columns" before "rows"; capture them if present
+        start = self._pos
+        next_key = self._skip(_WHITESPACE + '{')
+        if next_key == '"' and self._buffer.startswith('"columns"', self._pos):
+            self._seek_key('columns')
+            self.columns = self._decode_value()
+        else:
+            self._pos = start
+
+        if not self._seek_key('rows') or self._skip(_WHITESPACE) != '[':
+            raise ValueError("Unexpected response format from API")
+        self._pos += 1
+
+        while True:
+            char = self._skip(_WHITESPACE + ',')
+            if char is None:
+                raise ValueError("Truncated JSON in query result rows")
+            if char == ']':
+                self._pos += 1
+                return
+            yield self._decode_value()
+
+
+def _schema_from_columns(columns):
+    """Build an Arrow schema from Redash column definitions."""
+    return pa.schema([
+        (column['name'], REDASH_COLUMN_TYPES.get(column.get('type'), pa.string()))
+        for column in columns
+    ])
+
+
+def _schema_from_rows(rows):
+    """Infer an Arrow schema from a batch of rows, defaulting untyped columns to string."""
+    inferred = pa.Table.from_pylist(rows).schema
+    return pa.schema([
+        (field.name, pa.string() if pa.types.is_null(field.type) else field.type)
+        for field in inferred
+    ])
+
+
+def _rows_to_batch(rows, schema):
+    """Convert a list of row dicts into a record batch with the given schema."""
+    arrays = []
+    for field in schema:
+        values = [row.get(field.name) for row in rows]
+        try:
+            arrays.append(pa.array(values, type=field.type))
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            # Values that don't match the declared type (e.g. numbers in a
+            # string column) are converted with Arrow's cast rules
+            arrays.append(pa.array(values).cast(field.type))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def stream_rows_to_parquet(chunks, output_path, batch_size=50000):
+    """
+    Parse Redash result chunks and write the rows to a Parquet file in batches.
+
+    Returns a dict with the number of bytes and rows processed.
+    """
+    stream = RedashRowStream(chunks)
+    tmp_path = f"{output_path}.tmp"
+    writer = None
+    schema = None
+    rows = []
+    row_count = 0
+
+    def flush():
+        nonlocal writer, schema
+        if schema is None:
+            schema = _schema_from_columns(stream.columns) if stream.columns else _schema_from_rows(rows)
+        if writer is None:
+            writer = pq.ParquetWriter(tmp_path, schema)
+        if rows:
+            writer.write_batch(_rows_to_batch(rows, schema))
+
+    try:
+        for row in stream:
+            rows.append(row)
+            if len(rows) >= batch_size:
+                flush()
+                row_count += len(rows)
+                rows = []
+        flush()
+        row_count += len(rows)
+    except Exception:
+        if writer is not None:
+            writer.close()
+            writer = None
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    finally:
+        if writer is not None:
+            writer.close()
+
+    os.replace(tmp_path, output_path)
+    return {'bytes': stream.bytes_read, 'rows': row_count}
+
+
+def write_rows_to_parquet(rows, columns, output_path):
+    """
+    Write already parsed Redash rows to a Parquet file typed by their column definitions.
+
+    Returns the number of rows written.
+    """
+    schema = _schema_from_columns(columns) if columns else _schema_from_rows(rows)
+    tmp_path = f"{output_path}.tmp"
+    try:
+        pq.write_table(pa.Table.from_batches([_rows_to_batch(rows, schema)], schema=schema), tmp_path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, output_path)
+    return len(rows)
+
+
+def format_stream_stats(label, stats, elapsed):
+    """Format throughput and memory figures for a finished download."""
+    elapsed = max(elapsed, 1e-9)
+    return (
+        f"{label}: {stats['rows']:,} rows, {stats['bytes'] / 1e6:,.1f} MB in {elapsed:.1f}s "
+        f"({stats['bytes'] / 1e6 / elapsed:,.1f} MB/s, {stats['rows'] / elapsed:,.0f} rows/s), "
+        f"peak RSS {peak_rss_mb():,.0f} MB"
+    )
@@ -0,0 +1,90 @@
+"""
+Generation numbering across a crash between making a database live and
+writing its generation marker.
+
+Usage (from the application directory):
+    python -m pytest tests
+"""
+import sqlite3
+
+import pytest
+
+import db_swap
+from db_swap import DatabaseSwap, DatabaseUpdate, read_generation
+
+
+class Crash(Exception):
+    pass
+
+
+def _build(db_path, rows):
+    with DatabaseSwap(db_path) as swap:
+        conn = sqlite3.connect(swap.staging_path)
+        conn.execute("CREATE TABLE user_data (user_id INTEGER)")
+        conn.executemany("INSERT INTO user_data VALUES (?)", [(i,) for i in range(rows)])
+        conn.commit()
+        conn.close()
+        return swap.commit(expected_rows=rows)
+
+
+def _update(db_path, user_id):
+    with DatabaseUpdate(db_path) as update:
+        update.conn.execute("INSERT INTO user_data VALUES (?)", (user_id,))
+        return update.commit()
+
+
+def _stored_generation(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute("PRAGMA user_version").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def _crash_before_marker(monkeypatch):
+    def write_marker(*args, **kwargs):
+        raise Crash()
+    monkeypatch.setattr(db_swap, '_write_marker', write_marker)
+
+
+def test_swap_after_crashed_swap_gets_a_new_generation(tmp_path, monkeypatch):
+    db_path = str(tmp_path / 'user_data.db')
+    assert _build(db_path, 3) == 1
+
+    with monkeypatch.context() as patch:
+        _crash_before_marker(patch)
+        with pytest.raises(Crash):
+            _build(db_path, 4)
+    assert _stored_generation(db_path) == 2
+    assert read_generation(db_path) == 1
+
+    assert _build(db_path, 5) == 3
+    assert read_generation(db_path) == 3
+
+
+def test_update_after_crashed_update_gets_a_new_generation(tmp_path, monkeypatch):
+    db_path = str(tmp_path / 'user_data.db')
+    _build(db_path, 3)
+
+    with monkeypatch.context() as patch:
+        _crash_before_marker(patch)
+        with pytest.raises(Crash):
+            _update(db_path, 3)
+    assert _stored_generation(db_path) == 2
+    assert read_generation(db_path) == 1
+
+    assert _update(db_path, 4) == 3
+    assert read_generation(db_path) == 3
+
+
+def test_swap_after_crashed_update_gets_a_new_generation(tmp_path, monkeypatch):
+    db_path = str(tmp_path / 'user_data.db')
+    _build(db_path, 3)
+
+    with monkeypatch.context() as patch:
+        _crash_before_marker(patch)
+        with pytest.raises(Crash):
+            _update(db_path, 3)
+
+    assert _build(db_path, 5) == 3
+    assert _stored_generation(db_path) == 3
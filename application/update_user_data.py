@@ -1,123 +1,416 @@
+import argparse
 import requests
+from requests.adapters import HTTPAdapter
 import time
+import random
 import os
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
 import json
-from datetime import datetime
-from merge_utils import join_csv_files 
+from merge_utils import join_csv_files, interchange_path, write_debug_csv
 import pandas as pd
-import shutil 
-from initialize_db import load_and_process_data
+from initialize_db import load_and_process_data, get_max_activity_week
+from stream_utils import stream_rows_to_parquet, write_rows_to_parquet, format_stream_stats
+from refresh_manifest import RefreshManifest, combine_fingerprints
+from pipeline_metrics import start_run, stage, get_metrics_path
+from db_swap import rebuild_lock, read_generation
 
-def download_query_result(base_url, query_result_id, api_key, output_csv_file, max_retries=10, retry_delay=10):
+# Status codes worth retrying: rate limiting and transient server/gateway errors
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# (connect, read) timeouts in seconds; Redash can take a while to start sending a large result
+REQUEST_TIMEOUT = (10, 300)
+
+def create_session(pool_size=4):
+    """Create a Session whose keep-alive connection pool is shared across worker threads."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+def backoff_delay(attempt, base_delay=1.0, max_delay=60.0):
+    """Exponential backoff with full jitter for the given zero-based attempt."""
+    return random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+
+def _is_retryable(error):
+    if isinstance(error, requests.exceptions.HTTPError):
+        return error.response is not None and error.response.status_code in RETRYABLE_STATUS_CODES
+    return isinstance(error, (
+        requests.exceptions.ConnectionError,
+        requests.exceptions.Timeout,
+        requests.exceptions.ChunkedEncodingError,
+    ))
+
+def with_retries(operation, description, max_retries=10, base_delay=1.0, max_delay=60.0):
+    """
+    Call operation(), retrying transient HTTP failures with exponential backoff and jitter.
+
+    Non-retryable errors (4xx responses, malformed payloads) are raised immediately.
+    """
     for attempt in range(max_retries):
         try:
-            url = f"{base_url}/api/query_results/{query_result_id}"
-            headers = {
-                'Authorization': f'Key {api_key}',
-                'Content-Type': 'text/csv',
-            }
-            print(f"Attempt {attempt + 1}/{max_retries} to download query result")
-            response = requests.get(url, headers=headers)
-            response.raise_for_status()
-            
-            # Parse JSON response
-            data = response.json()
-            
-            # Convert to DataFrame and save as CSV
-            if 'query_result' in data and 'data' in data['query_result']:
-                df = pd.DataFrame(data['query_result']['data']['rows'])
-                df.to_csv(output_csv_file, index=False)
-                return
-            else:
-                raise ValueError("Unexpected response format from API")
-                
-        except requests.exceptions.HTTPError as e:
-            if e.response.status_code == 502 and attempt < max_retries - 1:
-                print(f"Got 502 error, retrying in {retry_delay} seconds...")
-                time.sleep(retry_delay)
-                continue
-            else:
-                print(f"Failed to download after {attempt + 1} attempts")
-                raise
+            return operation()
         except Exception as e:
-            print(f"Unexpected error: {str(e)}")
-            raise
+            if not _is_retryable(e) or attempt == max_retries - 1:
+                print(f"{description} failed after {attempt + 1} attempts: {str(e)}")
+                raise
+            delay = backoff_delay(attempt, base_delay, max_delay)
+            print(f"{description}: {str(e)}; retrying in {delay:.1f} seconds "
+                  f"(attempt {attempt + 2}/{max_retries})...")
+            time.sleep(delay)
+
+def download_query_result(base_url, query_result_id, api_key, output_file, max_retries=10,
+                          session=None, base_delay=1.0):
+    """Download a query result in one piece and save it as Parquet or CSV, by output_file's extension."""
+    session = session or requests
+    url = f"{base_url}/api/query_results/{query_result_id}"
+    headers = {
+        'Authorization': f'Key {api_key}',
+        'Content-Type': 'text/csv',
+    }
+
+    def attempt():
+        response = session.get(url, headers=headers, timeout=REQUEST_TIMEOUT)
+        response.raise_for_status()
+
+        # Parse JSON response
+        data = response.json()
+
+        # Save the rows as typed Parquet, or as CSV through a DataFrame
+        if 'query_result' in data and 'data' in data['query_result']:
+            result = data['query_result']['data']
+            if output_file.endswith('.parquet'):
+                rows = write_rows_to_parquet(result['rows'], result.get('columns'), output_file)
+                return {'bytes': len(response.content), 'rows': rows}
+            df = pd.DataFrame(result['rows'])
+            df.to_csv(output_file, index=False)
+            return {'bytes': len(response.content), 'rows': len(df)}
+        else:
+            raise ValueError("Unexpected response format from API")
+
+    return with_retries(attempt, f"Download of query result {query_result_id}",
+                        max_retries=max_retries, base_delay=base_delay)
+
+def stream_query_result(base_url, query_result_id, api_key, output_file, max_retries=10,
+                        session=None, base_delay=1.0, chunk_size=1 << 16, batch_size=50000):
+    """
+    Download a query result and write its rows to a Parquet file as they arrive.
+
+    Unlike download_query_result, the JSON payload is never loaded in full: the
+    rows array is parsed incrementally and written out in typed record batches.
+    """
+    session = session or requests
+    url = f"{base_url}/api/query_results/{query_result_id}"
+    headers = {'Authorization': f'Key {api_key}'}
+
+    def attempt():
+        start = time.perf_counter()
+        with session.get(url, headers=headers, stream=True, timeout=REQUEST_TIMEOUT) as response:
+            response.raise_for_status()
+            stats = stream_rows_to_parquet(
+                response.iter_content(chunk_size=chunk_size),
+                output_file,
+                batch_size=batch_size
+            )
+        print(format_stream_stats(os.path.basename(output_file), stats, time.perf_counter() - start))
+        return stats
+
+    return with_retries(attempt, f"Stream of query result {query_result_id}",
+                        max_retries=max_retries, base_delay=base_delay)
+
+def get_latest_query_result_id(session, base_url, query_id, api_key, max_retries=10, base_delay=1.0):
+    """Look up the id of the latest stored result for a Redash query."""
+    url = f"{base_url}/api/queries/{query_id}"
+    headers = {'Authorization': f'Key {api_key}'}
+
+    def attempt():
+        response = session.get(url, headers=headers, timeout=REQUEST_TIMEOUT)
+        response.raise_for_status()
+        return response.json()['latest_query_data_id']
+
+    return with_retries(attempt, f"Lookup of query {query_id}",
+                        max_retries=max_retries, base_delay=base_delay)
+
+def fetch_query(session, config, key, query_id, manifest=None, force=False):
+    """
+    Fetch the latest result of one query into the output folder and time it.
+
+    If a manifest is given and it shows the latest result id was already
+    downloaded intact, the download is skipped.
+    """
+    base_url = config['redash_base_url']
+    api_key = config['api_key']
+    max_retries = config.get('max_retries', 10)
+    base_delay = config.get('retry_base_delay', 1.0)
+    start = time.perf_counter()
+
+    print(f"Downloading results for {key} (Query ID: {query_id})")
+    # Get the latest query result directly
+    query_result_id = get_latest_query_result_id(
+        session, base_url, query_id, api_key, max_retries=max_retries, base_delay=base_delay
+    )
+    lookup_seconds = time.perf_counter() - start
+
+    stream = config.get('download_mode', 'json') == 'stream'
+    # Streamed results are always written as Parquet
+    file_format = 'parquet' if stream else config.get('interchange_format', 'parquet')
+    output_file = os.path.join(config['output_folder'], f"{key}.{file_format}")
+
+    if manifest is not None and not force and manifest.query_is_current(key, query_result_id, output_file):
+        print(f"{key}: result {query_result_id} unchanged since last run, skipping download")
+        previous = manifest.get_query(key)
+        return {
+            'key': key,
+            'query_id': query_id,
+            'query_result_id': query_result_id,
+            'path': output_file,
+            'rows': previous.get('rows', 0),
+            'bytes': previous.get('bytes', 0),
+            'lookup_seconds': lookup_seconds,
+            'total_seconds': time.perf_counter() - start,
+            'skipped': True,
+        }
+
+    if stream:
+        print(f"Streaming result to {output_file}")
+        stats = stream_query_result(base_url, query_result_id, api_key, output_file,
+                                    max_retries=max_retries, session=session, base_delay=base_delay)
+    else:
+        print(f"Downloading result to {output_file}")
+        stats = download_query_result(base_url, query_result_id, api_key, output_file,
+                                      max_retries=max_retries, session=session, base_delay=base_delay)
+
+    if config.get('debug_csv') and file_format == 'parquet':
+        print(f"Debug copy written to {write_debug_csv(output_file)}")
+
+    if manifest is not None:
+        manifest.record_query(key, query_id, query_result_id, output_file,
+                              rows=stats['rows'], bytes=stats['bytes'])
+
+    return {
+        'key': key,
+        'query_id': query_id,
+        'query_result_id': query_result_id,
+        'path': output_file,
+        'rows': stats['rows'],
+        'bytes': stats['bytes'],
+        'lookup_seconds': lookup_seconds,
+        'total_seconds': time.perf_counter() - start,
+        'skipped': False,
+    }
+
+def fetch_all_queries(config, session=None, manifest=None, force=False):
+    """
+    Fetch every query in config['query_ids'] concurrently.
 
-def main():
+    Downloads run on a bounded thread pool sharing one keep-alive Session.
+    Returns a dict mapping query key to its fetch result.
+    """
+    query_ids = config['query_ids']
+    max_workers = max(1, min(config.get('fetch_workers', 3), len(query_ids)))
+    owns_session = session is None
+    session = session or create_session(pool_size=max_workers)
+    os.makedirs(config['output_folder'], exist_ok=True)
+
+    start = time.perf_counter()
+    results = {}
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='redash-fetch') as executor:
+            futures = {
+                executor.submit(fetch_query, session, config, key, query_id, manifest, force): key
+                for key, query_id in query_ids.items()
+            }
+            for future in as_completed(futures):
+                result = future.result()
+                results[result['key']] = result
+    finally:
+        if owns_session:
+            session.close()
+
+    print_fetch_summary(results, time.perf_counter() - start)
+    return results
+
+def print_fetch_summary(results, total_seconds):
+    """Print per-query and total fetch timings."""
+    print("\nFetch summary:")
+    for key in sorted(results):
+        result = results[key]
+        status = "unchanged, skipped" if result.get('skipped') else "downloaded"
+        print(f"  {key} (query {result['query_id']}, result {result['query_result_id']}, {status}): "
+              f"{result['rows']:,} rows, {result['bytes'] / 1e6:,.1f} MB, "
+              f"lookup {result['lookup_seconds']:.2f}s, total {result['total_seconds']:.2f}s")
+    sequential = sum(result['total_seconds'] for result in results.values())
+    print(f"  Wall clock {total_seconds:.2f}s (sum of per-query times {sequential:.2f}s)\n")
+
+def load_config(config_path='config.json'):
+    """Load config.json and add the Redash API key from the environment."""
     load_dotenv()
 
     # Load configurations from config.json
-    with open('config.json', 'r') as config_file:
+    with open(config_path, 'r') as config_file:
         config = json.load(config_file)
 
     # Update config with API key from environment variable
     config['api_key'] = os.getenv('REDASH_API_KEY')
+    return config
 
-    base_url = config['redash_base_url']
-    api_key = config['api_key']
-    query_ids = config['query_ids']
-    output_folder = config['output_folder']
-
-    # Ensure output folder exists
-    os.makedirs(output_folder, exist_ok=True)
-
-    csv_files = {}
-    for key, query_id in query_ids.items():
-        print(f"Downloading results for {key} (Query ID: {query_id})")
-        # Get the latest query result directly
-        url = f"{base_url}/api/queries/{query_id}"
-        headers = {'Authorization': f'Key {api_key}'}
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
-        
-        # Extract the latest query result ID
-        query_result_id = response.json()['latest_query_data_id']
-        
-        output_csv_file = os.path.join(output_folder, f"{key}.csv")
-        print(f"Downloading result to {output_csv_file}")
-        download_query_result(base_url, query_result_id, api_key, output_csv_file)
-        csv_files[key] = output_csv_file
+def merge_stage(csv_files, output_file, manifest, force=False, since_week=None, engine='arrow',
+                memory_budget_mb=None, debug_csv=False, csv_parser='pandas'):
+    """Join the query results into output_file unless they're unchanged since the last merge."""
+    merge_fingerprint = combine_fingerprints(
+        *(manifest.query_fingerprint(key) for key in ('query_1', 'query_2', 'query_3')),
+        since_week or 'full'
+    )
+    if not force and manifest.stage_is_current('merge', merge_fingerprint, output_file):
+        print(f"Query results unchanged since last merge, keeping {output_file}")
+        with stage('merge') as record:
+            record.status = 'skipped'
+        return
+
+    print(f"Merging query results into {output_file} ({engine} engine)")
 
-    # Add file existence checks before merge
-    for file_path in csv_files.values():
-        if not os.path.exists(file_path):
-            raise FileNotFoundError(f"Required CSV file not found: {file_path}")
-    
-    # Get fixed_output_csv path from config
-    fixed_output_csv = config.get('fixed_output_csv', './join_result.csv')
-    print(f"Merging CSV files into {fixed_output_csv}")
-    
     try:
         # Merge the CSV files
-        join_csv_files(
-            csv_files['query_1'],
-            csv_files['query_2'],
-            csv_files['query_3'],
-            fixed_output_csv
-        )
-        print(f"CSV file saved to {fixed_output_csv}")
+        with stage('merge'):
+            join_csv_files(
+                csv_files['query_1'],
+                csv_files['query_2'],
+                csv_files['query_3'],
+                output_file,
+                since_week=since_week,
+                engine=engine,
+                memory_budget_mb=memory_budget_mb,
+                csv_parser=csv_parser
+            )
+        print(f"Merged file saved to {output_file}")
+        if debug_csv and output_file.endswith('.parquet'):
+            print(f"Debug copy written to {write_debug_csv(output_file)}")
         print("Process completed successfully.")
     except KeyboardInterrupt:
         print("\nProcess interrupted by user. Cleaning up...")
         # Optionally clean up incomplete output file
-        if os.path.exists(fixed_output_csv):
-            os.remove(fixed_output_csv)
+        if os.path.exists(output_file):
+            os.remove(output_file)
         raise
     except Exception as e:
         print(f"Error during file merge: {str(e)}")
         raise
 
-    # After update is complete, reinitialize the database
-    CONFIG_PATH = './config.json'
-    CSV_PATH = './join_result.csv'
-    DB_PATH = './user_data.db'
-    
+    manifest.record_stage('merge', merge_fingerprint, output_file)
+    manifest.save()
+
+def load_stage(csv_path, config_path, db_path, manifest, force=False, incremental=False, profiles_path=None):
+    """Load the merged output into the database unless it was already loaded. Returns True on success."""
+    load_fingerprint = combine_fingerprints(
+        manifest.stage_fingerprint('merge'), 'incremental' if incremental else 'full'
+    )
+    if not force and manifest.load_is_current('load', load_fingerprint, read_generation(db_path)):
+        print(f"Merged data unchanged since last load, keeping {db_path}")
+        with stage('load') as record:
+            record.status = 'skipped'
+        return True
+
     print("Reinitializing database with updated data...")
-    if os.path.exists(CSV_PATH):
-        load_and_process_data(CSV_PATH, CONFIG_PATH, DB_PATH)
-    else:
-        print(f"Error: CSV file not found at {CSV_PATH}")
+    if not os.path.exists(csv_path):
+        print(f"Error: CSV file not found at {csv_path}")
+        return False
+
+    with stage('load') as record:
+        if not load_and_process_data(csv_path, config_path, db_path,
+                                     incremental=incremental, profiles_path=profiles_path):
+            record.status = 'failed'
+            return False
+    manifest.record_load('load', load_fingerprint, read_generation(db_path))
+    manifest.save()
+    return True
+
+def main(config=None, config_path='./config.json', db_path='./user_data.db', force=False, full_rebuild=False):
+    """
+    Refresh user_data.db from the latest Redash results.
+
+    Stages whose inputs haven't changed since the last run (according to the
+    refresh manifest) are skipped, unless force is set. With ingest_mode
+    'incremental' in config, only the weeks from the database's latest
+    activity_week onwards are merged and replaced; the full rebuild remains
+    the fallback, and can be requested with full_rebuild. Every run's stage
+    timings and memory use are appended to the metrics file (see
+    pipeline_metrics).
+    """
+    if config is None:
+        config = load_config(config_path)
+
+    # One rebuild at a time, whether scheduled, manual or from the dashboard
+    with rebuild_lock(db_path, on_wait=lambda: print("Another rebuild is running; waiting for it to finish")):
+        with start_run(get_metrics_path(config), mode='full') as run:
+            _refresh(config, config_path, db_path, force, full_rebuild, run)
+
+def _refresh(config, config_path, db_path, force, full_rebuild, run):
+    manifest = RefreshManifest(
+        config.get('manifest_path', os.path.join(config['output_folder'], 'refresh_manifest.json'))
+    )
+
+    with stage('fetch') as record:
+        try:
+            results = fetch_all_queries(config, manifest=manifest, force=force)
+        finally:
+            manifest.save()
+        record.rows_out = sum(result['rows'] for result in results.values())
+    csv_files = {key: result['path'] for key, result in results.items()}
+
+    # Add file existence checks before merge
+    for file_path in csv_files.values():
+        if not os.path.exists(file_path):
+            raise FileNotFoundError(f"Required query result file not found: {file_path}")
+
+    # After update is complete, reinitialize the database
+    CONFIG_PATH = config_path
+    DB_PATH = db_path
+
+    merge_options = {
+        'engine': config.get('merge_engine', 'arrow'),
+        'memory_budget_mb': config.get('merge_memory_budget_mb'),
+        'debug_csv': config.get('debug_csv', False),
+        'csv_parser': config.get('csv_parser', 'pandas'),
+    }
+    file_format = config.get('interchange_format', 'parquet')
+
+    if config.get('ingest_mode', 'full') == 'incremental' and not full_rebuild:
+        since_week = get_max_activity_week(DB_PATH)
+        if since_week is None:
+            print("No existing data to update incrementally; doing a full rebuild.")
+        else:
+            run.attributes['mode'] = 'incremental'
+            delta_output_csv = interchange_path(config.get('delta_output_csv', './join_delta.csv'), file_format)
+            print(f"Incremental ingest of weeks from {since_week}")
+            merge_stage(csv_files, delta_output_csv, manifest, force=force, since_week=since_week,
+                        **merge_options)
+            if load_stage(delta_output_csv, CONFIG_PATH, DB_PATH, manifest, force=force,
+                          incremental=True, profiles_path=csv_files['query_2']):
+                return
+            print("Incremental ingest failed; falling back to a full rebuild.")
+            run.attributes['mode'] = 'fallback'
+
+    # Get fixed_output_csv path from config
+    fixed_output_csv = interchange_path(config.get('fixed_output_csv', './join_result.csv'), file_format)
+    merge_stage(csv_files, fixed_output_csv, manifest, force=force, **merge_options)
+    load_stage(fixed_output_csv, CONFIG_PATH, DB_PATH, manifest, force=force,
+               profiles_path=csv_files['query_2'])
+
+def run_update_user_data(job=None, progress=None):
+    """Run update_user_data.py in its own process, as an 'ingest' job; fails the job if it fails."""
+    if progress is not None:
+        progress(0, "Refreshing the data from Redash")
+    result = subprocess.run(["python3", "update_user_data.py"])
+    if result.returncode != 0:
+        raise RuntimeError(f"update_user_data.py exited with status {result.returncode}")
 
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser(description="Refresh user_data.db from the latest Redash query results.")
+    parser.add_argument('--force', action='store_true',
+                        help="Download, merge and reload even if nothing changed since the last run")
+    parser.add_argument('--full-rebuild', action='store_true',
+                        help="Rebuild the database from the full history even in incremental mode")
+    args = parser.parse_args()
+    main(force=args.force, full_rebuild=args.full_rebuild)
@@ -1,173 +1,479 @@
+import numpy as np
 import pandas as pd
 import sqlite3
 import logging
-from sqlalchemy import create_engine, text
-import json
-from pathlib import Path
+import os
+import threading
+import time
+from sqlalchemy import bindparam, create_engine, text
+from sqlalchemy.pool import NullPool
+from .dataset_snapshot import (
+    map_snapshot, remove_old_snapshots, snapshot_generation, snapshot_lock, snapshot_path, to_series, write_snapshot
+)
 
 # Database configuration
 DB_PATH = './user_data.db'
-ENGINE = create_engine(f'sqlite:///{DB_PATH}')
+# Read the dataset from each generation's Arrow snapshot (see Dataset); set
+# DASHBOARD_SNAPSHOTS=0 to always read SQLite
+SNAPSHOTS = os.getenv('DASHBOARD_SNAPSHOTS', '1') != '0'
+# Refreshes swap a new database file in atomically (see db_swap); without
+# pooling, every query opens whichever generation is live at that moment
+ENGINE = create_engine(f'sqlite:///{DB_PATH}', poolclass=NullPool)
 
-# Initialize cache as None
-cache = None
+# Compact in-memory schema, applied whenever the dataset is loaded. The
+# categories of the categorical columns are stored at ingest
+# (initialize_db.CATEGORIES_TABLE); without them the stored values are used.
+CATEGORY_COLUMNS = ['df2_user_type', 'df2_country', 'df2_membership', 'region']
+# Weekly counts, held in the narrowest integer type their stored range fits
+# (sums are taken in int64)
+COUNT_COLUMNS = [
+    'total_uploads', 'total_licensing_submissions', 'total_accepted_licensing', 'total_num_of_sales',
+    'df3_photo_likes', 'df3_comments', 'num_of_photos_featured', 'num_of_galleries_featured',
+    'num_of_stories_featured'
+]
+# Scores, rates, day averages and revenue stay float64: the table shows them
+# rounded to two decimals, which float32 would shift (0.065 shows as 0.06)
 
-def init_data_loading(cache_instance):
-    """Initialize the data loading with the cache instance"""
-    global cache
-    cache = cache_instance
+# Mostly unique text, held as Arrow strings instead of Python objects
+STRING_COLUMNS = ['df2_full_name', 'df2_username', 'df2_profile_url', 'df2_social_links']
+# A few hundred distinct weeks: an ordered categorical of week start dates,
+# one small code per row (filter it with weeks_between)
+WEEK_COLUMN = 'activity_week'
 
-def load_region_mappings():
-    """Load region mappings from JSON file"""
-    try:
-        mappings_path = Path(__file__).parent.parent / "region_mappings.json"
-        with open(mappings_path, 'r') as f:
-            return json.load(f)
-    except Exception as e:
-        print(f"Error loading region mappings: {e}")
-        return {}
+INTEGER_TYPES = ['int8', 'int16', 'int32']
+# user_id is int32 when every id fits, int64 otherwise
+USER_ID_TYPES = ['int32']
+
+# Stored as 'YYYY-MM-DD HH:MM:SS' text by both loaders
+DATE_COLUMNS = ['df2_registration_date', 'activity_week']
+
+# Primary key of each dataset table; rows are always read in key order
+TABLE_KEYS = {'users': ['user_id'], 'weekly_activity': ['user_id', 'activity_week']}
+
+# Wide text only shown for the rows on screen or exported; never loaded in full
+DETAIL_COLUMNS = ['df2_full_name', 'df2_username', 'df2_profile_url', 'df2_social_links']
+
+# User ids bound per IN (...) query
+DETAIL_BATCH_IDS = 500
+
+class DatasetHolder:
+    """
+    Holds the dashboard's one Dataset and hands out references to it.
+
+    Nothing is copied or serialized on the way out: every caller gets the same
+    Dataset, whose kept columns are read-only (see Dataset). The holder is
+    tagged with the database generation its Dataset reads from. invalidate()
+    drops the Dataset, so the next get() starts a new one on the live database.
+    """
+
+    def __init__(self, engine=ENGINE):
+        self.engine = engine
+        self._dataset = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        """Return the current Dataset, starting one if there is none."""
+        with self._lock:
+            if self._dataset is None:
+                self._dataset = Dataset(self.engine)
+            return self._dataset
+
+    def invalidate(self):
+        """Drop the current Dataset; references already handed out keep working."""
+        with self._lock:
+            self._dataset = None
+
+    def replace(self, dataset):
+        """Make dataset the current Dataset; returns the previous one (None if there was none)."""
+        with self._lock:
+            previous, self._dataset = self._dataset, dataset
+            return previous
+
+    @property
+    def generation(self):
+        """Database generation of the current Dataset (None until it has read)."""
+        dataset = self._dataset
+        return dataset.generation if dataset is not None else None
+
+# The dashboard's dataset; it fills in columns as callbacks ask for them, so
+# it lives in this process rather than in a (pickling) cache
+DATASET = DatasetHolder()
 
 def load_data(force_reload=False):
     """
-    Load data from the SQLite database.
-    """
-    global cache
-    
-    # If cache is initialized and force_reload is True, clear the cache
-    if cache and force_reload:
-        cache.delete('data')
-    
-    # If cache is initialized and data is cached, return cached data
-    if cache and not force_reload:
-        cached_data = cache.get('data')
-        if cached_data is not None:
-            return cached_data
-    
-    # Load fresh data
-    df = load_data_from_db()
-
-    # Define membership display name mapping
-    membership_mapping = {
-        '0': 'No membership',
-        '': 'No membership',
-        '-': 'No membership',
-        'Trial - Awesome Monthly - 30 Days': 'Trial - Awesome - M',
-        'Trial - Awesome Yearly - 30 Days': 'Trial - Awesome - Y',
-        'Trial - Pro Monthly - 30 Days': 'Trial - Pro - M',
-        'Trial - Pro Yearly - 30 Days': 'Trial - Pro - Y'
-    }
-    
-    # Replace membership values with their display names
-    df['df2_membership'] = df['df2_membership'].astype(str).map(lambda x: membership_mapping.get(x, x))
-    
-    # Define custom sort order
-    membership_order = [
-        'No membership',
-        'Awesome - Monthly',
-        'Awesome - Yearly',
-        'Pro - Monthly',
-        'Pro - Yearly',
-        'Android - Monthly',
-        'Android - Yearly',
-        'iOS - Monthly',
-        'iOS - Yearly',
-        'Free Pro CX',
-        'Free Awesome CX',
-        'Trial - Awesome - M',
-        'Trial - Awesome - Y',
-        'Trial - Pro - M',
-        'Trial - Pro - Y'
-    ]
-    
-    # Create a categorical type with custom ordering
-    df['df2_membership'] = pd.Categorical(
-        df['df2_membership'],
-        categories=membership_order,
-        ordered=True
-    )
+    Return the dashboard's Dataset (see Dataset and DatasetHolder).
+
+    With force_reload, the holder is invalidated first, so every column is
+    read again from the live database on first use.
+    """
+    if force_reload:
+        DATASET.invalidate()
+    return DATASET.get()
+
+class Dataset:
+    """
+    Column-projected, lazily read access to the users and weekly_activity tables.
+
+    users() and activity() return projections holding the requested columns
+    plus the table's key columns. A column is read from the database the
+    first time a projection asks for it and kept; projections share the kept
+    arrays instead of copying them, and the arrays are marked read-only so no
+    caller can change them for the others. The wide text
+    columns in DETAIL_COLUMNS are never loaded in full: user_details reads them
+    for the given users only.
+
+    Columns are read from one database generation (PRAGMA user_version, see
+    db_swap). If a newer generation has been swapped in when another column
+    is needed, everything kept is dropped and read again from the new one.
+
+    With snapshots, columns come from the generation's memory-mapped Arrow
+    snapshot (see utils.dataset_snapshot) instead of SQLite. The first process
+    to need a generation publishes its snapshot; every worker process maps
+    the same files, so their pages are shared rather than copied per worker.
+    """
+
+    def __init__(self, engine=ENGINE, snapshots=None):
+        self.engine = engine
+        self.snapshots = SNAPSHOTS if snapshots is None else snapshots
+        self.generation = None
+        # 'snapshot' or 'sqlite': where the current generation's columns come from
+        self.source = None
+        self._stored_columns = {}
+        self._categories = {}
+        self._columns = {table: {} for table in TABLE_KEYS}
+        self._snapshot = {}
+        self._derived = {}
+        self._lock = threading.Lock()
+
+    def users(self, columns=None):
+        """Project users onto columns (default: all but DETAIL_COLUMNS)."""
+        return self._project('users', columns)
+
+    def activity(self, columns=None):
+        """Project weekly_activity onto columns (default: all)."""
+        return self._project('weekly_activity', columns)
+
+    @property
+    def empty(self):
+        """True when there are no weekly rows, or the database can't be read."""
+        try:
+            return self.activity([]).empty
+        except Exception as e:
+            print(f"Error loading data: {e}")
+            return True
+
+    def user_details(self, user_ids, columns=None):
+        """
+        Read DETAIL_COLUMNS (or the given subset) of the given users.
+
+        Returns one row per stored user in user_ids, with user_id, in no
+        particular order.
+        """
+        columns = [col for col in (columns or DETAIL_COLUMNS) if col != 'user_id']
+        user_ids = [int(user_id) for user_id in user_ids]
+        query = text(
+            f"SELECT user_id, {', '.join(columns)} FROM users WHERE user_id IN :ids"
+        ).bindparams(bindparam('ids', expanding=True))
+        with self.engine.connect() as conn:
+            dtypes = _column_dtypes(_read_categories(conn))
+            frames = [
+                pd.read_sql(query, conn, params={'ids': user_ids[start:start + DETAIL_BATCH_IDS]},
+                            dtype={col: dtypes[col] for col in ['user_id'] + columns if col in dtypes})
+                for start in range(0, len(user_ids), DETAIL_BATCH_IDS)
+            ]
+        if not frames:
+            return pd.DataFrame({col: pd.Series(dtype=dtypes.get(col, object)) for col in ['user_id'] + columns})
+        return pd.concat(frames, ignore_index=True)
+
+    def derived(self, name, compute):
+        """
+        Return compute(self), computed once per database generation and kept
+        with the columns. Every caller gets the same object; treat it as read-only.
+        """
+        derived = self._derived
+        if name not in derived:
+            derived[name] = compute(self)
+        return derived[name]
+
+    def loaded_frames(self):
+        """Return (users, activity) holding every column read so far."""
+        return tuple(pd.DataFrame(self._columns[table], copy=False) for table in TABLE_KEYS)
 
-    region_order = [
-        'North America',
-        'South America',
-        'Northern Europe',
-        'Southern Europe',
-        'Western Europe',
-        'Eastern Europe',
-        'Africa',
-        'Asia Pacific (excl. China & Indonesia)',
-        'China',
-        'Indonesia',
-        'Rest of Asia',
-        'Other'
+    def _project(self, table, columns):
+        with self._lock:
+            if columns is None:
+                self._refresh_metadata_if_unread()
+                columns = [col for col in self._stored_columns.get(table, []) if col not in DETAIL_COLUMNS]
+            elif set(columns) & set(DETAIL_COLUMNS):
+                raise ValueError(f"Read {sorted(set(columns) & set(DETAIL_COLUMNS))} with user_details")
+            wanted = TABLE_KEYS[table] + [col for col in columns if col not in TABLE_KEYS[table]]
+            self._materialize(table, wanted)
+            loaded = self._columns[table]
+            return pd.DataFrame({col: loaded[col] for col in wanted if col in loaded}, copy=False)
+
+    def _refresh_metadata_if_unread(self):
+        if self.generation is None:
+            with self.engine.connect() as conn:
+                self._read_metadata(conn)
+
+    def _read_metadata(self, conn):
+        self.generation = conn.execute(text("PRAGMA user_version")).scalar()
+        self._stored_columns = {
+            table: [row[1] for row in conn.execute(text(f"PRAGMA table_info({table})"))]
+            for table in TABLE_KEYS
+        }
+        self._categories = _read_categories(conn)
+        self._columns = {table: {} for table in TABLE_KEYS}
+        self._derived = {}
+        self._snapshot = self._map_snapshot(conn) if self.snapshots else {}
+        self.source = 'snapshot' if self._snapshot else 'sqlite'
+
+    def _map_snapshot(self, conn):
+        """
+        Map the snapshot of the generation conn reads, publishing it from conn
+        first if no process has yet (or the files there are stale or
+        unreadable). Returns {table: pyarrow Table}, or {} if there is no data
+        or the snapshot can't be written or read, in which case columns are
+        read from SQLite.
+        """
+        db_path = self.engine.url.database
+        if db_path in (None, '', ':memory:') or not all(self._stored_columns.values()):
+            return {}
+        paths = {table: snapshot_path(db_path, self.generation, table) for table in TABLE_KEYS}
+        try:
+            start = time.perf_counter()
+            mapped = self._map_current(paths)
+            if mapped is None:
+                lock_file = snapshot_lock(db_path)
+                try:
+                    # Another worker may have published it while this one waited
+                    mapped = self._map_current(paths)
+                    if mapped is None:
+                        self._publish_snapshot(conn, paths)
+                        remove_old_snapshots(db_path, self.generation)
+                        mapped = self._map_current(paths)
+                finally:
+                    lock_file.close()
+            if mapped is None:
+                raise ValueError("the published snapshot doesn't match the database")
+            logging.info(f"Mapped the generation {self.generation} snapshot "
+                         f"in {(time.perf_counter() - start) * 1000:.1f} ms")
+            return mapped
+        except Exception as e:
+            logging.error(f"Dataset snapshot unavailable, reading from SQLite: {e}")
+            return {}
+
+    def _map_current(self, paths):
+        """Map the snapshot files if they exist, are readable and match this generation's columns; None otherwise."""
+        if not all(os.path.exists(path) for path in paths.values()):
+            return None
+        mapped = {}
+        for table, path in paths.items():
+            try:
+                mapped[table] = map_snapshot(path)
+            except Exception as e:
+                logging.warning(f"Unreadable snapshot {path}: {e}")
+                return None
+            expected = [col for col in self._stored_columns[table] if col not in DETAIL_COLUMNS]
+            if (snapshot_generation(mapped[table]) != self.generation
+                    or sorted(mapped[table].column_names) != sorted(expected)):
+                logging.info(f"Snapshot {path} is stale; rebuilding it")
+                return None
+        return mapped
+
+    def _publish_snapshot(self, conn, paths):
+        start = time.perf_counter()
+        for table, path in paths.items():
+            columns = [col for col in self._stored_columns[table] if col not in DETAIL_COLUMNS]
+            write_snapshot(self._read_columns(conn, table, columns), path, self.generation)
+        logging.info(f"Published the generation {self.generation} snapshot "
+                     f"in {time.perf_counter() - start:.2f}s")
+
+    def _read_columns(self, conn, table, columns):
+        """Read columns of table from SQLite, in key order, with the compact schema."""
+        frame = _read_sql(conn, f"SELECT {', '.join(columns)} FROM {table} ORDER BY {', '.join(TABLE_KEYS[table])}")
+        return typed_frame(frame, self._categories)
+
+    def _materialize(self, table, columns):
+        """Read the columns of table that aren't kept yet (all of them after a generation change)."""
+        loaded = self._columns[table]
+        if self.generation is not None and all(col in loaded for col in columns):
+            return
+        with self.engine.connect() as conn:
+            generation = conn.execute(text("PRAGMA user_version")).scalar()
+            if generation != self.generation:
+                if self.generation is not None:
+                    logging.info(f"Database generation {generation} replaced {self.generation}; reloading columns")
+                self._read_metadata(conn)
+            loaded = self._columns[table]
+            stored = self._stored_columns[table]
+            missing = [col for col in columns if col in stored and col not in loaded]
+            if not missing:
+                return
+            start = time.perf_counter()
+            snapshot = self._snapshot.get(table)
+            if snapshot is not None and all(col in snapshot.column_names for col in missing):
+                columns = {col: to_series(snapshot.column(col)) for col in missing}
+                source = 'the snapshot'
+            else:
+                frame = self._read_columns(conn, table, missing)
+                columns = {col: frame[col] for col in missing}
+                source = 'SQLite'
+        for series in columns.values():
+            _freeze(series)
+        loaded.update(columns)
+        logging.info(f"Read {len(missing)} columns of {table} from {source} "
+                     f"in {time.perf_counter() - start:.2f}s")
+
+def _freeze(series):
+    """Mark the NumPy array behind series read-only; Arrow strings and categorical codes already are."""
+    values = getattr(series.array, '_ndarray', None)
+    if values is not None:
+        values.flags.writeable = False
+
+def _narrowest_int(values, types=INTEGER_TYPES):
+    """Return the first of types that holds every value of values, or None if there is none (or a value is missing or not whole)."""
+    if values.isna().any():
+        return None
+    if values.empty:
+        return types[0]
+    if values.dtype.kind not in 'iu' and not (values % 1 == 0).all():
+        return None
+    low, high = values.min(), values.max()
+    for dtype in types:
+        info = np.iinfo(dtype)
+        if info.min <= low and high <= info.max:
+            return dtype
+    return None
+
+def compact_frame(df):
+    """
+    Convert the columns of df named in the compact schema to their narrow types.
+
+    Count columns with missing or fractional values, or beyond int32, become
+    float32 instead. Returns df.
+    """
+    if 'user_id' in df.columns:
+        df['user_id'] = df['user_id'].astype(_narrowest_int(df['user_id'], USER_ID_TYPES) or 'int64')
+    if WEEK_COLUMN in df.columns and not isinstance(df[WEEK_COLUMN].dtype, pd.CategoricalDtype):
+        df[WEEK_COLUMN] = pd.Categorical(df[WEEK_COLUMN], ordered=True)
+    for col in CATEGORY_COLUMNS:
+        if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype('category')
+    for col in COUNT_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype(_narrowest_int(df[col]) or 'float32')
+    for col in STRING_COLUMNS:
+        if col in df.columns and df[col].dtype != pd.StringDtype('pyarrow'):
+            df[col] = df[col].astype(pd.StringDtype('pyarrow'))
+    return df
+
+def weeks_between(weeks, start, end):
+    """
+    Boolean mask of the rows of an activity_week column (see WEEK_COLUMN)
+    whose week lies between start and end, inclusive. Each distinct week is
+    compared once.
+    """
+    categories = weeks.cat.categories
+    keep = (categories >= pd.to_datetime(start)) & (categories <= pd.to_datetime(end))
+    # Missing weeks have code -1, which picks the appended False
+    return pd.Series(np.append(keep, False)[weeks.cat.codes.to_numpy()], index=weeks.index)
+
+def memory_report(users, activity):
+    """Return the memory held by each column of the dataset frames, largest first, in MB."""
+    rows = [
+        {'frame': name, 'column': col, 'dtype': str(frame[col].dtype),
+         'mb': frame[col].memory_usage(deep=True, index=False) / 1e6}
+        for name, frame in (('users', users), ('activity', activity))
+        for col in frame.columns
     ]
+    report = pd.DataFrame(rows, columns=['frame', 'column', 'dtype', 'mb'])
+    return report.sort_values('mb', ascending=False, ignore_index=True)
 
-    # Create a categorical type with custom ordering
-    df['region'] = pd.Categorical(
-        df['region'],
-        categories=region_order,
-        ordered=True
+def _table_exists(conn, name):
+    return conn.execute(
+        text("SELECT 1 FROM sqlite_master WHERE name = :name"), {'name': name}
+    ).first() is not None
+
+def _read_categories(conn):
+    """Return the stored categories as a CategoricalDtype per column ({} if the database has none)."""
+    if not _table_exists(conn, 'column_categories'):
+        return {}
+    rows = conn.execute(text(
+        "SELECT column_name, category, ordered FROM column_categories ORDER BY column_name, position"
+    )).all()
+    columns = {}
+    for column, category, ordered in rows:
+        columns.setdefault(column, ([], bool(ordered)))[0].append(category)
+    return {
+        column: pd.CategoricalDtype(categories, ordered=ordered)
+        for column, (categories, ordered) in columns.items()
+    }
+
+def _column_dtypes(categories):
+    """Return the declared type of each column with a fixed type in the compact schema."""
+    dtypes = {'user_id': 'int64'}
+    dtypes.update({col: pd.StringDtype('pyarrow') for col in STRING_COLUMNS})
+    dtypes.update(categories)
+    return dtypes
+
+def _read_sql(conn, query):
+    """
+    Read query into a frame of the raw values SQLite returns, through the
+    sqlite3 connection behind conn: pandas builds a frame from sqlite3 rows
+    about a quarter faster than from SQLAlchemy result rows. typed_frame
+    applies the types afterwards.
+    """
+    return pd.read_sql(query, conn.connection.driver_connection)
+
+def _parse_dates(values):
+    """Parse stored date text, each distinct value once (there are few weeks and registration dates)."""
+    codes, uniques = pd.factorize(values)
+    return pd.Series(
+        pd.to_datetime(uniques, format='ISO8601').take(codes, allow_fill=True, fill_value=pd.NaT),
+        index=values.index, name=values.name
     )
-    
-    # Cache the new data if cache is initialized
-    if cache:
-        cache.set('data', df, timeout=604800)
-    
-    return df
 
-def load_data_from_db():
-    """Load data directly from the database"""
+def typed_frame(df, categories):
+    """
+    Give raw columns read from SQLite the compact schema in one pass: dates
+    parsed, the stored categories applied, then compact_frame. Returns df.
+    """
+    for col in DATE_COLUMNS:
+        if col in df.columns:
+            df[col] = _parse_dates(df[col])
+    for col, dtype in categories.items():
+        if col in df.columns:
+            df[col] = df[col].astype(dtype)
+    return compact_frame(df)
+
+def _read_table(conn, table, categories):
+    """Read table in key order with the compact schema."""
+    return typed_frame(_read_sql(conn, f"SELECT * FROM {table} ORDER BY {', '.join(TABLE_KEYS[table])}"), categories)
+
+def load_data_from_db(engine=ENGINE):
+    """
+    Read the users and weekly_activity tables into typed frames, in full.
+
+    Everything the dashboard needs is derived at ingest (region, membership
+    display names, category orders), so this is a plain read typed once
+    afterwards (see typed_frame). Returns two empty frames when there is no
+    data, including for a database from before the normalized schema, which
+    the next ingest rebuilds.
+    """
     try:
-        # Create table if it doesn't exist
-        with ENGINE.connect() as conn:
-            conn.execute(text("""
-                CREATE TABLE IF NOT EXISTS user_data (
-                    user_id TEXT PRIMARY KEY,
-                    df2_full_name TEXT,
-                    df2_username TEXT,
-                    df2_user_type TEXT,
-                    df2_registration_date DATE,
-                    df2_membership TEXT,
-                    df2_country TEXT,
-                    region TEXT,
-                    df2_profile_url TEXT,
-                    df2_social_links TEXT,
-                    df3_med_aesthetic_score FLOAT,
-                    df3_med_lai_score FLOAT,
-                    df3_quality_score FLOAT,
-                    df2_exclusivity_rate FLOAT,
-                    df2_acceptance_rate FLOAT,
-                    num_of_photos_featured INTEGER,
-                    num_of_galleries_featured INTEGER,
-                    num_of_stories_featured INTEGER,
-                    total_uploads INTEGER,
-                    total_licensing_submissions INTEGER,
-                    total_accepted_licensing INTEGER,
-                    total_sales_revenue FLOAT,
-                    total_num_of_sales INTEGER,
-                    df3_photo_likes INTEGER,
-                    df3_comments INTEGER,
-                    df3_avg_visit_days_monthly FLOAT,
-                    activity_week DATE
-                )
-            """))
-            
-            query = text("SELECT * FROM user_data")
-            df = pd.read_sql(query, conn)
-            
-            if not df.empty:
-                # Load and apply region mappings
-                region_mappings = load_region_mappings()
-                df['region'] = df['df2_country'].map(region_mappings).fillna('Other')
-                
-                # Convert date columns
-                df['df2_registration_date'] = pd.to_datetime(df['df2_registration_date'])
-                df['activity_week'] = pd.to_datetime(df['activity_week'])
-            
-            return df
+        with engine.connect() as conn:
+            if not _table_exists(conn, 'weekly_activity'):
+                print("The database has no weekly_activity table yet; run an ingest to build it.")
+                return pd.DataFrame(), pd.DataFrame()
+            categories = _read_categories(conn)
+            users = _read_table(conn, 'users', categories)
+            activity = _read_table(conn, 'weekly_activity', categories)
+        return users, activity
             
     except Exception as e:
         print(f"Error loading data: {e}")
-        return pd.DataFrame()
+        return pd.DataFrame(), pd.DataFrame()
 
 def load_filtered_data(user_ids=None, columns=None):
     """
@@ -205,7 +511,7 @@ def load_paginated_data(page_number, rows_per_page, filtered_user_ids):
         cursor = conn.cursor()
         
         # Create temporary table for filtered IDs
-        cursor.execute("CREATE TEMP TABLE IF NOT EXISTS temp_filtered_ids (user_id TEXT)")
+        cursor.execute("CREATE TEMP TABLE IF NOT EXISTS temp_filtered_ids (user_id INTEGER)")
         cursor.execute("DELETE FROM temp_filtered_ids")  # Clear existing data
         
         # Insert filtered IDs in chunks to avoid variable limit
@@ -0,0 +1,109 @@
+import fcntl
+import glob
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+# One uncompressed Arrow IPC file per table and database generation, next to
+# the database. Uncompressed files can be memory-mapped and read without
+# copying, so every worker process that maps one shares its pages through
+# the OS page cache instead of holding its own copy. Each file is tagged with
+# the generation it was read from and the snapshot format version; bump
+# SNAPSHOT_VERSION whenever the stored types change, so older files are
+# rebuilt rather than mapped.
+SNAPSHOT_VERSION = 2
+
+
+def snapshot_path(db_path, generation, table):
+    return f"{db_path}.snapshot-{int(generation)}.{table}.arrow"
+
+
+def snapshot_lock(db_path):
+    """
+    Open and exclusively lock the snapshot lock file of db_path; closing the
+    returned file releases it. Serializes the processes publishing a snapshot.
+    """
+    lock_file = open(f"{db_path}.snapshot.lock", 'w')
+    fcntl.flock(lock_file, fcntl.LOCK_EX)
+    return lock_file
+
+
+def _to_arrow(series):
+    """
+    Convert a column to an Arrow array that reads back without a copy.
+
+    NumPy-backed columns keep their NaN and NaT values as values rather than
+    nulls: a column with nulls can't be handed to NumPy zero-copy.
+    Categoricals become dictionary arrays.
+    """
+    if isinstance(series.dtype, np.dtype) and series.dtype.kind in 'biufM':
+        return pa.array(series.to_numpy(), from_pandas=False)
+    return pa.array(series, from_pandas=True)
+
+
+def write_snapshot(frame, path, generation):
+    """Write frame to path as an Arrow IPC file tagged with generation; the file appears complete or not at all."""
+    table = pa.table({col: _to_arrow(frame[col]) for col in frame.columns})
+    table = table.replace_schema_metadata({
+        'generation': str(int(generation)),
+        'snapshot_version': str(SNAPSHOT_VERSION),
+    })
+    tmp_path = f"{path}.tmp"
+    with pa.OSFile(tmp_path, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, path)
+
+
+def map_snapshot(path):
+    """Memory-map the Arrow IPC file at path; returns a pyarrow Table backed by the mapping."""
+    with pa.memory_map(path, 'r') as source:
+        return pa.ipc.open_file(source).read_all()
+
+
+def snapshot_generation(table):
+    """Return the generation a mapped snapshot was tagged with, or None if it is untagged or of another format version."""
+    metadata = table.schema.metadata or {}
+    if metadata.get(b'snapshot_version') != str(SNAPSHOT_VERSION).encode():
+        return None
+    try:
+        return int(metadata[b'generation'])
+    except (KeyError, ValueError):
+        return None
+
+
+def to_series(column):
+    """
+    Convert a mapped Arrow column to a pandas Series.
+
+    Numeric and date columns without nulls (as write_snapshot stores them)
+    and dictionary codes without nulls are wrapped, not copied, and stay
+    read-only; anything else is converted by pyarrow.
+    """
+    if column.num_chunks == 1:
+        chunk = column.chunk(0)
+        if pa.types.is_dictionary(chunk.type):
+            codes = chunk.indices
+            codes = (codes.to_numpy(zero_copy_only=True) if codes.null_count == 0
+                     else codes.fill_null(-1).to_numpy())
+            categories = pd.Index(chunk.dictionary.to_pandas())
+            return pd.Series(pd.Categorical.from_codes(codes, categories, ordered=chunk.type.ordered),
+                             copy=False)
+        numeric = (pa.types.is_integer(chunk.type) or pa.types.is_floating(chunk.type)
+                   or pa.types.is_timestamp(chunk.type))
+        if numeric and chunk.null_count == 0:
+            return pd.Series(chunk.to_numpy(zero_copy_only=True), copy=False)
+    return column.to_pandas()
+
+
+def remove_old_snapshots(db_path, keep_generation):
+    """Delete the snapshots of every generation but keep_generation. Processes still mapping them keep their pages."""
+    for path in glob.glob(f"{glob.escape(db_path)}.snapshot-*.arrow"):
+        generation = os.path.basename(path)[len(os.path.basename(db_path)) + len('.snapshot-'):].split('.')[0]
+        if generation != str(int(keep_generation)):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
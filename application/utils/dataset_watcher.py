@@ -0,0 +1,110 @@
+import logging
+import os
+import threading
+import time
+
+from db_swap import read_generation
+from .data_loading import DATASET, DB_PATH, Dataset
+
+# Seconds between checks of the generation marker
+RELOAD_INTERVAL = int(os.getenv('DASHBOARD_RELOAD_INTERVAL', 30))
+
+
+class DatasetWatcher:
+    """
+    Swaps new database generations into the dashboard in the background.
+
+    A thread polls the generation marker db_swap writes next to the database
+    (a small file read, no database access). When a newer generation is
+    live, it builds a new Dataset off the request path: reads its columns,
+    then runs prepare(dataset) (the warm-up's precomputation), and only then
+    replaces the holder's Dataset. Requests keep using the previous one until
+    the swap and never wait for a reload; requests already running finish on
+    the Dataset they started with. A failed reload is logged and retried at
+    the next check.
+
+    The thread doesn't survive a fork: under gunicorn, each worker starts its
+    own (see gunicorn.conf.py).
+    """
+
+    def __init__(self, holder=DATASET, db_path=DB_PATH, interval=RELOAD_INTERVAL):
+        self.holder = holder
+        self.db_path = db_path
+        self.interval = interval
+        self.prepare = None
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._reload_lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, prepare=None):
+        """Start watching in a daemon thread; prepare(dataset) runs on each new Dataset before it is swapped in."""
+        if self.running:
+            return
+        self.prepare = prepare
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watch, name='dataset-watcher', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def refresh(self):
+        """Check for a new generation now: in the background if watching, otherwise in this thread."""
+        if self.running:
+            self._wake.set()
+        else:
+            self.check()
+
+    def check(self):
+        """Reload if the live generation differs from the holder's. Returns True if a new Dataset was swapped in."""
+        current = self.holder.generation
+        # Nothing has been read yet; the warm-up or the first request will
+        if current is None:
+            return False
+        live = read_generation(self.db_path)
+        if live == current:
+            return False
+        return self.reload(live)
+
+    def reload(self, generation=None):
+        """Build a new Dataset on the live database and swap it in. Returns True on success."""
+        with self._reload_lock:
+            # Another thread may have swapped it in while this one waited
+            if generation is not None and self.holder.generation == generation:
+                return False
+            start = time.perf_counter()
+            try:
+                dataset = Dataset(self.holder.engine)
+                if not dataset.empty:
+                    dataset.users(), dataset.activity()
+                    if self.prepare is not None:
+                        self.prepare(dataset)
+            except Exception as e:
+                logging.error(f"Background reload of generation {generation} failed: {e}")
+                return False
+            previous = self.holder.replace(dataset)
+            logging.info(f"Swapped in database generation {dataset.generation} "
+                         f"(was {previous.generation if previous else None}) from {dataset.source} "
+                         f"in {time.perf_counter() - start:.2f}s")
+            return True
+
+    def _watch(self):
+        while not self._stop.is_set():
+            try:
+                self.check()
+            except Exception as e:
+                logging.error(f"Dataset watcher check failed: {e}")
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+# The dashboard process's watcher
+DATASET_WATCHER = DatasetWatcher()
@@ -1,5 +1,4 @@
 import pandas as pd
-from flask_caching import Cache
 from dash import Dash, dcc, html
 import dash_bootstrap_components as dbc
 import re
@@ -56,6 +55,12 @@ def validate_and_format_url(link):
             link = 'https://' + link
         return link
 
+def display_text(value):
+    """Return a text cell value, or '-' when it is missing or empty (None, NaN or pd.NA)."""
+    if pd.isna(value) or value == '':
+        return '-'
+    return value
+
 def create_table_row(row, row_number, is_selected=False):
     """Create a table row from a DataFrame row."""
     # Format registration date - handle both string and datetime inputs safely
@@ -71,10 +76,12 @@ def create_table_row(row, row_number, is_selected=False):
             reg_date = '-'
     
     # Create checkbox with consistent value format
+    # User IDs stay integers in the stores and checkbox ids; only the cell shows text
+    user_id = int(row['user_id'])
     checkbox = dcc.Checklist(
-        id={'type': 'row-checkbox', 'index': str(row['user_id'])},
-        options=[{'label': '', 'value': str(row['user_id'])}],
-        value=[str(row['user_id'])] if is_selected else [],
+        id={'type': 'row-checkbox', 'index': user_id},
+        options=[{'label': '', 'value': user_id}],
+        value=[user_id] if is_selected else [],
         style={'margin': '0', 'padding': '0'}
     )
     
@@ -94,14 +101,14 @@ def create_table_row(row, row_number, is_selected=False):
     return html.Tr([
         html.Td(row_number, style={'textAlign': 'center'}),
         html.Td(checkbox, style={'textAlign': 'center'}),
-        html.Td(row['user_id'], style={'textAlign': 'center'}),
-        html.Td(row['df2_username'] or '-', style={'textAlign': 'left'}),
-        html.Td(row['df2_full_name'] or '-', style={'textAlign': 'left'}),
-        html.Td(row['df2_user_type'] or '-', style={'textAlign': 'center'}),
+        html.Td(str(user_id), style={'textAlign': 'center'}),
+        html.Td(display_text(row['df2_username']), style={'textAlign': 'left'}),
+        html.Td(display_text(row['df2_full_name']), style={'textAlign': 'left'}),
+        html.Td(display_text(row['df2_user_type']), style={'textAlign': 'center'}),
         html.Td(reg_date, style={'textAlign': 'center'}),
-        html.Td(row['df2_membership'] or '-', style={'textAlign': 'center'}),
-        html.Td(row['df2_country'] or '-', style={'textAlign': 'center'}),
-        html.Td(row['region'] or '-', style={'textAlign': 'center'}),
+        html.Td(display_text(row['df2_membership']), style={'textAlign': 'center'}),
+        html.Td(display_text(row['df2_country']), style={'textAlign': 'center'}),
+        html.Td(display_text(row['region']), style={'textAlign': 'center'}),
         profile_cell,
         social_cell,
         html.Td(f"{row['total_uploads']:,.0f}" if pd.notnull(row['total_uploads']) else '-', style={'textAlign': 'center'}),
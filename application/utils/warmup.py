@@ -0,0 +1,62 @@
+import logging
+import threading
+import time
+
+
+class WarmUp:
+    """
+    The dashboard's startup warm-up: named phases run in order, each one's
+    duration is recorded and logged, and the dashboard is ready only once all
+    of them have finished (see /healthz in app.py).
+    """
+
+    def __init__(self):
+        self.phases = {}
+        self.error = None
+        self._finished = threading.Event()
+
+    @property
+    def ready(self):
+        return self._finished.is_set() and self.error is None
+
+    def run(self, phases):
+        """Run phases, a list of (name, function) pairs, in order. Returns True if all of them succeeded."""
+        self.phases = {}
+        self.error = None
+        self._finished.clear()
+        start = time.perf_counter()
+        try:
+            for name, phase in phases:
+                phase_start = time.perf_counter()
+                try:
+                    phase()
+                except Exception as e:
+                    self.error = f"{name}: {e}"
+                    logging.error(f"Warm-up failed in {name}: {e}")
+                    return False
+                self.phases[name] = round(time.perf_counter() - phase_start, 3)
+                logging.info(f"Warm-up {name}: {self.phases[name]:.2f}s")
+        finally:
+            self._finished.set()
+        logging.info(f"Warm-up finished in {time.perf_counter() - start:.2f}s")
+        return True
+
+    def start(self, phases):
+        """Run phases in a background thread; returns the thread."""
+        thread = threading.Thread(target=self.run, args=(phases,), name='warm-up', daemon=True)
+        thread.start()
+        return thread
+
+    def status(self):
+        """'ready', 'warming' or 'failed', with the phase timings so far."""
+        if not self._finished.is_set():
+            state = 'warming'
+        else:
+            state = 'ready' if self.error is None else 'failed'
+        status = {'status': state, 'phases': dict(self.phases)}
+        if self.error is not None:
+            status['error'] = self.error
+        return status
+
+# The dashboard process's warm-up
+WARM_UP = WarmUp()
@@ -1,3 +1,9 @@
 #!/bin/bash
 nginx
-exec python3 app.py & exec python3 scheduler.py
\ No newline at end of file
+python3 scheduler.py &
+if [ "${DASHBOARD_SERVER:-gunicorn}" = "dev" ]; then
+    # Dash's single-process development server
+    exec python3 app.py
+else
+    exec gunicorn --config gunicorn.conf.py app:server
+fi